@@ -0,0 +1,134 @@
+from logging.handlers import QueueHandler, QueueListener
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+
+# One JSON line per request. Records are handed to a queue and written by a background thread, so a slow stdout or
+# log collector never holds up the event loop. When the queue is full records are dropped (and counted) instead.
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1.0"))  # Fraction of ordinary requests logged.
+ACCESS_LOG_SLOW_MS = float(os.getenv("ACCESS_LOG_SLOW_MS", "1000"))  # Slow requests and 5xx are always logged.
+ACCESS_LOG_HEADERS = os.getenv("ACCESS_LOG_HEADERS", "false").lower() == "true"
+ACCESS_LOG_QUEUE_SIZE = int(os.getenv("ACCESS_LOG_QUEUE_SIZE", "10000"))
+
+SENSITIVE_HEADERS = {"authorization", "proxy-authorization", "cookie", "set-cookie", "x-api-key", "stripe-signature"}
+REDACTED = "[redacted]"
+
+logger = logging.getLogger("medport.access")
+
+class JsonFormatter(logging.Formatter):
+    converter = time.gmtime
+
+    def format(self, record):
+        entry = {
+            "timestamp": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        else:
+            entry["message"] = record.getMessage()
+        return json.dumps(entry, default=str)
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: records that do not fit in the queue are counted and discarded."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread, only make sure the record can cross threads.
+        return record
+
+queue_handler = DroppingQueueHandler(queue.Queue(ACCESS_LOG_QUEUE_SIZE))
+logger.addHandler(queue_handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+_listener = None
+
+def start_access_log(stream=None):
+    global _listener
+    if _listener is None:
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter())
+        _listener = QueueListener(queue_handler.queue, output, respect_handler_level=True)
+        _listener.start()
+
+def stop_access_log():
+    # Flushes whatever is still queued.
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def redact_headers(headers):
+    return {
+        name: REDACTED if name.lower() in SENSITIVE_HEADERS else value
+        for name, value in headers
+    }
+
+class AccessLogMiddleware:
+    """ASGI middleware that logs method, route template, status, duration and response size of each request."""
+
+    def __init__(self, app, sample_rate: float = ACCESS_LOG_SAMPLE_RATE, slow_ms: float = ACCESS_LOG_SLOW_MS,
+                 include_headers: bool = ACCESS_LOG_HEADERS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.include_headers = include_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500  # Stays 500 if the app raises before sending a response.
+        response_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            if status_code >= 500 or duration_ms >= self.slow_ms or random.random() < self.sample_rate:
+                self.log(scope, status_code, duration_ms, response_bytes)
+
+    def log(self, scope, status_code: int, duration_ms: float, response_bytes: int):
+        route = scope.get("route")
+        client = scope.get("client")
+        fields = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": getattr(route, "path", None),
+            "status": status_code,
+            "duration_ms": round(duration_ms, 2),
+            "response_bytes": response_bytes,
+            "client": client[0] if client else None,
+        }
+        if self.include_headers:
+            fields["headers"] = redact_headers(
+                (name.decode("latin-1"), value.decode("latin-1")) for name, value in scope.get("headers", [])
+            )
+        level = logging.ERROR if status_code >= 500 else logging.WARNING if status_code >= 400 else logging.INFO
+        logger.log(level, "request", extra={"fields": fields})
@@ -0,0 +1,239 @@
+"""Provider availability and booking conflict checks.
+
+Every booking claims rows in booking_slots: one per 15 minute unit it covers and per seat (provider.slot_capacity
+bookings can overlap). The rows are written in the booking's own transaction and the primary key
+(provider_id, slot_start, seat) rejects a seat that is already taken, so two overlapping requests cannot both commit.
+Conflict checks and availability are range scans of that primary key, their cost depends on the number of slots
+asked about and not on how many bookings a provider has.
+
+Bookings made before the slot index existed are indexed with:
+    poetry run python availability.py
+"""
+from fastapi import HTTPException, status
+from sqlalchemy import select, delete, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, date, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from models import BookingSlot, ProviderWorkingHours, Provider, Booking, BookingStatus, Treatment, TreatmentPrice
+import asyncio
+import math
+import re
+
+SLOT_UNIT = timedelta(minutes=15)  # Grain of the slot index, start times and working hours are multiples of it.
+MAX_BOOKING_DURATION = timedelta(days=1)
+MIN_LEAD_TIME = timedelta(days=1)  # Same rule as create_booking.
+MAX_AVAILABILITY_RANGE = timedelta(days=31)
+ACTIVE_STATUSES = (BookingStatus.PENDING, BookingStatus.CONFIRMED)  # Bookings that hold their slots.
+
+# Minutes per unit of Treatment.average_duration, by the unit words and abbreviations it is written with.
+DURATION_UNITS = {
+    **dict.fromkeys(("w", "wk", "wks", "week", "weeks"), 7 * 24 * 60),
+    **dict.fromkeys(("d", "day", "days"), 24 * 60),
+    **dict.fromkeys(("h", "hr", "hrs", "hour", "hours"), 60),
+    **dict.fromkeys(("m", "min", "mins", "minute", "minutes"), 1),
+}
+# One amount (or range, "1-2") and its unit: "1 hour", "30min", "1.5h", "2-3 days".
+DURATION_PART = re.compile(r"(\d+(?:[.,]\d+)?)(?:\s*(?:-|–|to)\s*(\d+(?:[.,]\d+)?))?\s*([a-z]*)")
+
+def as_utc(value: datetime):
+    # SQLite returns naive datetimes, naive input is taken as UTC as well.
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def parse_duration(text: str, default: timedelta):
+    """Treatment.average_duration ("45 min", "1 hour 30 min", "2h 15m", "1-2 hours") as a timedelta, the upper end of
+    a range. default when an amount has no known unit or there is none."""
+    parts = DURATION_PART.findall((text or "").lower())
+    if not parts:
+        return default
+    minutes = 0.0
+    for low, high, unit in parts:
+        if unit not in DURATION_UNITS:
+            return default
+        minutes += float((high or low).replace(",", ".")) * DURATION_UNITS[unit]
+    return min(max(timedelta(minutes=minutes), SLOT_UNIT), MAX_BOOKING_DURATION)
+
+def provider_zone(provider: Provider):
+    return ZoneInfo(provider.timezone or "UTC")
+
+def validate_zone(name: str):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown time zone {name}")
+
+def on_unit(value: time):
+    return value.second == 0 and value.microsecond == 0 and value.minute % 15 == 0
+
+def validate_working_hours(slot_minutes: int, hours):
+    if slot_minutes % 15:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="slot_minutes must be a multiple of 15")
+    if len({entry.weekday for entry in hours}) != len(hours):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="One interval per weekday")
+    for entry in hours:
+        if not (on_unit(entry.opens_at) and on_unit(entry.closes_at)) or entry.opens_at >= entry.closes_at:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Working hours must open before they close, on a quarter hour"
+            )
+
+async def load_working_hours(db: AsyncSession, provider_id: int):
+    rows = (await db.scalars(
+        select(ProviderWorkingHours).where(ProviderWorkingHours.provider_id == provider_id)
+    )).all()
+    return {row.weekday: row for row in rows}
+
+async def treatment_duration(db: AsyncSession, provider: Provider, treatment_price_id: int):
+    text = await db.scalar(
+        select(Treatment.average_duration)
+        .join(TreatmentPrice, TreatmentPrice.treatment_id == Treatment.id)
+        .where(TreatmentPrice.id == treatment_price_id)
+    )
+    return parse_duration(text, timedelta(minutes=provider.slot_minutes))
+
+def working_interval(zone: ZoneInfo, day: date, entry: ProviderWorkingHours):
+    opening = datetime.combine(day, entry.opens_at, tzinfo=zone).astimezone(timezone.utc)
+    closing = datetime.combine(day, entry.closes_at, tzinfo=zone).astimezone(timezone.utc)
+    return opening, closing
+
+def slot_units(start: datetime, end: datetime):
+    """UTC starts of the 15 minute units that [start, end) touches."""
+    epoch = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    first = math.floor((as_utc(start) - epoch) / SLOT_UNIT)
+    last = math.ceil((as_utc(end) - epoch) / SLOT_UNIT)
+    return [epoch + i * SLOT_UNIT for i in range(first, last)]
+
+def booking_window(provider: Provider, hours: dict, start: datetime, duration: timedelta):
+    """The [start, end) a booking occupies. With working hours it has to fit in them (treatments longer than the
+    day start at opening and end at closing time), without working hours any time is accepted."""
+    start = as_utc(start)
+    end = start + duration
+    if not hours:
+        return start, end
+    zone = provider_zone(provider)
+    local = start.astimezone(zone)
+    entry = hours.get(local.weekday())
+    if entry is None or not (entry.opens_at <= local.time() < entry.closes_at):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Appointment is outside the provider's working hours"
+        )
+    opening, closing = working_interval(zone, local.date(), entry)
+    if end > closing and start != opening:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Appointment would run past the provider's closing time"
+        )
+    return start, min(end, closing)
+
+async def claim_slots(db: AsyncSession, provider: Provider, booking_id: int, start: datetime, duration: timedelta):
+    """Add the slot rows of a booking to the session (flushed), 409 if the time is taken."""
+    start, end = booking_window(provider, await load_working_hours(db, provider.id), start, duration)
+    units = slot_units(start, end)
+    taken = {}
+    for slot_start, seat in (await db.execute(
+        select(BookingSlot.slot_start, BookingSlot.seat).where(
+            BookingSlot.provider_id == provider.id,
+            BookingSlot.slot_start >= units[0],
+            BookingSlot.slot_start <= units[-1],
+        )
+    )).all():
+        taken.setdefault(as_utc(slot_start), set()).add(seat)
+
+    slots = []
+    for unit in units:
+        seats = taken.get(unit, set())
+        if len(seats) >= provider.slot_capacity:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="This time is already booked")
+        seat = next(seat for seat in range(len(seats) + 1) if seat not in seats)
+        slots.append(BookingSlot(provider_id=provider.id, slot_start=unit, seat=seat, booking_id=booking_id))
+    db.add_all(slots)
+    try:
+        await db.flush()
+    except IntegrityError:
+        # A concurrent booking took one of the seats between the lookup and the insert.
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="This time was just booked, please try again")
+
+async def release_slots(db: AsyncSession, booking_id: int):
+    await db.execute(delete(BookingSlot).where(BookingSlot.booking_id == booking_id))
+
+async def claim_booking_slots(db: AsyncSession, booking_id: int, provider_id: int, treatment_price_id: int, start: datetime):
+    provider = await db.get(Provider, provider_id)
+    duration = await treatment_duration(db, provider, treatment_price_id)
+    await claim_slots(db, provider, booking_id, start, duration)
+
+def candidate_starts(provider: Provider, hours: dict, start: datetime, end: datetime, duration: timedelta):
+    """Appointment starts within [start, end) on the provider's slot_minutes grid from opening time, each with the
+    end of the time it would occupy."""
+    zone = provider_zone(provider)
+    step = timedelta(minutes=provider.slot_minutes)
+    day = start.astimezone(zone).date() - timedelta(days=1)
+    last_day = end.astimezone(zone).date()
+    while day <= last_day:
+        entry = hours.get(day.weekday())
+        if entry is not None:
+            opening, closing = working_interval(zone, day, entry)
+            candidate = opening
+            while candidate < closing and (candidate + duration <= closing or candidate == opening):
+                if start <= candidate < end:
+                    yield candidate, min(candidate + duration, closing)
+                candidate += step
+        day += timedelta(days=1)
+
+async def provider_availability(db: AsyncSession, provider: Provider, start: datetime, end: datetime, duration: timedelta):
+    """Bookable starts between start and end with the number of free seats, one grouped query for the bookings."""
+    start, end = as_utc(start), as_utc(end)
+    if end <= start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'to' must be after 'from'")
+    if end - start > MAX_AVAILABILITY_RANGE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Ask for at most 31 days at a time")
+    start = max(start, datetime.now(timezone.utc) + MIN_LEAD_TIME)
+
+    hours = await load_working_hours(db, provider.id)
+    candidates = list(candidate_starts(provider, hours, start, end, duration)) if start < end else []
+    if not candidates:
+        return []
+
+    booked = dict((as_utc(slot_start), count) for slot_start, count in (await db.execute(
+        select(BookingSlot.slot_start, func.count())
+        .where(
+            BookingSlot.provider_id == provider.id,
+            BookingSlot.slot_start >= candidates[0][0],
+            BookingSlot.slot_start < candidates[-1][1],
+        )
+        .group_by(BookingSlot.slot_start)
+    )).all())
+
+    slots = []
+    for slot_start, slot_end in candidates:
+        available = min(provider.slot_capacity - booked.get(unit, 0) for unit in slot_units(slot_start, slot_end))
+        slots.append({"start": slot_start, "end": slot_end, "available": max(available, 0)})
+    return slots
+
+async def backfill():
+    # Index upcoming bookings that have no slots yet. Overlapping ones keep the time they have, the first one by id
+    # gets the slots and the others are reported.
+    from database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        indexed = select(BookingSlot.booking_id).where(BookingSlot.booking_id == Booking.id).exists()
+        bookings = (await db.execute(
+            select(Booking.id, Booking.provider_id, Booking.treatment_price_id, Booking.appointment_date)
+            .where(Booking.status.in_(ACTIVE_STATUSES), Booking.appointment_date > func.now(), ~indexed)
+            .order_by(Booking.id)
+        )).all()
+        claimed = 0
+        for booking in bookings:
+            try:
+                await claim_booking_slots(db, *booking)
+                await db.commit()
+                claimed += 1
+            except HTTPException as e:
+                await db.rollback()
+                print(f"Booking {booking.id}: {e.detail}")
+        print(f"Indexed {claimed} of {len(bookings)} bookings")
+
+if __name__ == "__main__":
+    asyncio.run(backfill())
@@ -0,0 +1,290 @@
+"""Bulk import of providers, treatments and treatment prices (routers/imports.py).
+
+Rows come as a JSON array, NDJSON (one object per line) or CSV with a header row. NDJSON and CSV are parsed while
+the upload streams in. Rows are handled in chunks of IMPORT_CHUNK_SIZE: each chunk is validated with a few set based
+queries (IN lists instead of one lookup per row), inserted with executemany and committed on its own. Rows that fail
+validation are reported with their position and skipped, the rest of the file is still imported.
+"""
+from abc import ABC, abstractmethod
+from sqlalchemy import select, insert, update, func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import ValidationError
+from models import Provider, User, Specialty, Treatment, TreatmentPrice, UserRole, provider_specialties, provider_treatments
+from schemas import ProviderCreate, TreatmentCreate, TreatmentPriceCreate
+from jobs import enqueue
+from geo import location
+from prices import refresh_base_prices
+from money import to_minor
+from cache import cache, invalidate_providers, TREATMENTS_PREFIX
+from routers.auth import CurrentUser
+import codecs
+import csv
+import json
+import logging
+import os
+import re
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))  # Errors listed in a summary response, all are counted.
+
+logger = logging.getLogger(__name__)
+
+# Readers yield (row number, values, error), row numbers count records from 1.
+async def read_lines(chunks):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+async def read_ndjson(chunks):
+    row = 0
+    async for line in read_lines(chunks):
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            values = json.loads(line)
+        except ValueError as e:
+            yield row, None, f"Invalid JSON: {e}"
+            continue
+        if isinstance(values, dict):
+            yield row, values, None
+        else:
+            yield row, None, "Expected a JSON object"
+
+async def read_csv(chunks):
+    header = None
+    row = 0
+    record = ""
+    async for line in read_lines(chunks):
+        record += line
+        if record.count('"') % 2:
+            continue  # Inside a quoted value that spans lines.
+        values = next(csv.reader([record]), [])
+        record = ""
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if not any(values):
+            continue
+        row += 1
+        # Empty cells are missing values (the schema defaults apply).
+        yield row, {name: value for name, value in zip(header, values) if value != ""}, None
+
+async def read_json_array(chunks):
+    # A JSON array is parsed as a whole.
+    body = b"".join([chunk async for chunk in chunks])
+    try:
+        rows = json.loads(body or b"[]")
+    except ValueError as e:
+        yield 1, None, f"Invalid JSON: {e}"
+        return
+    if not isinstance(rows, list):
+        yield 1, None, "Expected a JSON array"
+        return
+    for row, values in enumerate(rows, 1):
+        if isinstance(values, dict):
+            yield row, values, None
+        else:
+            yield row, None, "Expected a JSON object"
+
+def split_ids(value):
+    # CSV cells hold id lists as "1;2;3" (or separated by | or spaces).
+    if isinstance(value, str):
+        return [part for part in re.split(r"[;|\s]+", value) if part]
+    return value
+
+def validation_error(error: ValidationError):
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors())
+
+class Importer(ABC):
+    """One kind of row. check() returns {row: error} for rows it rejects, insert() writes the others."""
+
+    schema = None
+    list_fields = ()
+
+    def __init__(self, current_user: CurrentUser):
+        self.current_user = current_user
+
+    def parse(self, values: dict):
+        for field in self.list_fields:
+            if field in values:
+                values[field] = split_ids(values[field])
+        return self.schema.model_validate(values)
+
+    async def check(self, db: AsyncSession, rows: dict):
+        return {}
+
+    @abstractmethod
+    async def insert(self, db: AsyncSession, rows: dict):
+        """Add the rows ({row: validated schema}) to the session, the caller commits them."""
+
+    async def after_commit(self):
+        pass
+
+async def existing_ids(db: AsyncSession, column, ids):
+    if not ids:
+        return set()
+    return set(await db.scalars(select(column).where(column.in_(ids))))
+
+class ProviderImport(Importer):
+    schema = ProviderCreate
+    list_fields = ("specialty_ids", "treatment_ids")
+
+    async def check(self, db: AsyncSession, rows: dict):
+        user_ids = {item.user_id for item in rows.values()}
+        users = await existing_ids(db, User.id, user_ids)
+        taken = await existing_ids(db, Provider.user_id, user_ids)
+        specialties = await existing_ids(db, Specialty.id, {i for item in rows.values() for i in item.specialty_ids})
+        treatments = await existing_ids(db, Treatment.id, {i for item in rows.values() for i in item.treatment_ids})
+
+        errors = {}
+        for row, item in rows.items():
+            if item.user_id not in users:
+                errors[row] = f"User {item.user_id} not found"
+            elif item.user_id in taken:
+                errors[row] = f"Provider profile already exists for user {item.user_id}"
+            elif not set(item.specialty_ids) <= specialties:
+                errors[row] = "One or more specialty IDs are invalid"
+            elif not set(item.treatment_ids) <= treatments:
+                errors[row] = "One or more treatment IDs are invalid"
+            else:
+                taken.add(item.user_id)  # A second row for the same user in this chunk.
+        return errors
+
+    async def insert(self, db: AsyncSession, rows: dict):
+        items = list(rows.values())
+        provider_ids = list(await db.scalars(
+            insert(Provider).returning(Provider.id, sort_by_parameter_order=True),
+            [
+                {**item.dict(exclude={"specialty_ids", "treatment_ids"}),
+                 **location(item.city, item.country, item.latitude, item.longitude)}
+                for item in items
+            ]
+        ))
+        specialty_rows = [
+            {"provider_id": provider_id, "specialty_id": specialty_id}
+            for provider_id, item in zip(provider_ids, items) for specialty_id in set(item.specialty_ids)
+        ]
+        treatment_rows = [
+            {"provider_id": provider_id, "treatment_id": treatment_id}
+            for provider_id, item in zip(provider_ids, items) for treatment_id in set(item.treatment_ids)
+        ]
+        if specialty_rows:
+            await db.execute(insert(provider_specialties), specialty_rows)
+        if treatment_rows:
+            await db.execute(insert(provider_treatments), treatment_rows)
+        enqueue(db, "refresh_providers", provider_ids=provider_ids)  # Search facets.
+
+class TreatmentImport(Importer):
+    schema = TreatmentCreate
+
+    async def insert(self, db: AsyncSession, rows: dict):
+        await db.execute(insert(Treatment), [item.dict() for item in rows.values()])
+
+    async def after_commit(self):
+        await cache.delete_prefix(TREATMENTS_PREFIX)
+
+class TreatmentPriceImport(Importer):
+    schema = TreatmentPriceCreate
+
+    def __init__(self, current_user: CurrentUser):
+        super().__init__(current_user)
+        self.provider_ids = set()
+
+    async def check(self, db: AsyncSession, rows: dict):
+        owners = dict((await db.execute(
+            select(Provider.id, Provider.user_id).where(Provider.id.in_({item.provider_id for item in rows.values()}))
+        )).all())
+        treatments = await existing_ids(db, Treatment.id, {item.treatment_id for item in rows.values()})
+
+        errors = {}
+        for row, item in rows.items():
+            if item.provider_id not in owners:
+                errors[row] = f"Provider {item.provider_id} not found"
+            elif owners[item.provider_id] != self.current_user.id and self.current_user.role != UserRole.ADMIN:
+                errors[row] = f"Not authorized to add treatment prices for provider {item.provider_id}"
+            elif item.treatment_id not in treatments:
+                errors[row] = f"Treatment {item.treatment_id} not found"
+            else:
+                try:
+                    to_minor(item.price, item.currency)  # insert() converts the valid rows again.
+                except ValueError as e:
+                    errors[row] = str(e)
+        return errors
+
+    async def insert(self, db: AsyncSession, rows: dict):
+        price_ids = list(await db.scalars(insert(TreatmentPrice).returning(TreatmentPrice.id), [
+            dict(item.dict(exclude={"price"}), price_minor=to_minor(item.price, item.currency)) for item in rows.values()
+        ]))
+        await refresh_base_prices(db, price_ids)
+        provider_ids = {item.provider_id for item in rows.values()}
+        # Same follow-up as create_treatment_price, once per chunk: detail page ETag and leaderboard rows.
+        await db.execute(
+            update(Provider).where(Provider.id.in_(provider_ids)).values(updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        enqueue(db, "refresh_providers", provider_ids=sorted(provider_ids))
+        self.provider_ids |= provider_ids
+
+    async def after_commit(self):
+        if self.provider_ids:
+            await invalidate_providers(self.provider_ids)
+            self.provider_ids = set()
+
+async def import_chunk(db: AsyncSession, importer: Importer, chunk: list):
+    """Validate, insert and commit one chunk. Returns (inserted, [{"row", "error"}])."""
+    rows, errors = {}, {}
+    for row, values, error in chunk:
+        if error is None:
+            try:
+                rows[row] = importer.parse(values)
+            except ValidationError as e:
+                error = validation_error(e)
+        if error is not None:
+            errors[row] = error
+
+    if rows:
+        errors.update(await importer.check(db, rows))
+        valid = {row: item for row, item in rows.items() if row not in errors}
+        if valid:
+            try:
+                await importer.insert(db, valid)
+                await db.commit()
+            except SQLAlchemyError as e:
+                await db.rollback()
+                logger.error(f"Import chunk failed: {e}")
+                errors.update({row: "Could not be saved, the chunk was rolled back" for row in valid})
+                valid = {}
+            else:
+                await importer.after_commit()
+        rows = valid
+
+    return len(rows), [{"row": row, "error": error} for row, error in sorted(errors.items())]
+
+async def run_import(db: AsyncSession, importer: Importer, records, chunk_size: int = IMPORT_CHUNK_SIZE):
+    """Import records chunk by chunk, yielding progress after each: rows read and inserted so far and the chunk's errors."""
+    progress = {"rows": 0, "inserted": 0, "failed": 0}
+    chunk = []
+
+    async def flush():
+        inserted, errors = await import_chunk(db, importer, chunk)
+        progress["rows"] += len(chunk)
+        progress["inserted"] += inserted
+        progress["failed"] += len(errors)
+        chunk.clear()
+        return {**progress, "errors": errors}
+
+    async for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield await flush()
+    if chunk:
+        yield await flush()
@@ -0,0 +1,165 @@
+from collections import OrderedDict
+import json
+import logging
+import os
+import time
+
+# Read-heavy catalog responses are cached as JSON-ready data (what the response model would produce).
+# "memory" is per process, use "redis" when several workers/replicas must see the same invalidations.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # memory, redis or none
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "60"))  # Upper bound on how stale an authenticated user can be.
+
+logger = logging.getLogger(__name__)
+
+class MemoryCache:
+    """In-process cache with a TTL per entry and least recently used eviction."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, default_ttl: int = CACHE_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < self.clock():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    async def set(self, key: str, value, ttl: int = None):
+        self._entries[key] = (self.clock() + (ttl or self.default_ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def delete_prefix(self, prefix: str):
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+
+class RedisCache:
+    """Cache stored in Redis (or anything speaking its protocol), shared by every API process.
+
+    Errors talking to the server are logged and treated as cache misses so the API keeps serving from the database.
+    """
+
+    def __init__(self, url: str = CACHE_URL, default_ttl: int = CACHE_TTL, namespace: str = "medport:", client=None):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package")
+            client = redis.from_url(url)
+        self.client = client
+        self.default_ttl = default_ttl
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str):
+        try:
+            raw = await self.client.get(self.namespace + key)
+        except Exception as e:
+            logger.warning(f"Cache get failed for {key}: {e}")
+            raw = None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    async def set(self, key: str, value, ttl: int = None):
+        try:
+            await self.client.set(self.namespace + key, json.dumps(value), ex=ttl or self.default_ttl)
+        except Exception as e:
+            logger.warning(f"Cache set failed for {key}: {e}")
+
+    async def delete(self, *keys: str):
+        try:
+            await self.client.delete(*[self.namespace + key for key in keys])
+        except Exception as e:
+            logger.warning(f"Cache delete failed for {keys}: {e}")
+
+    async def delete_prefix(self, prefix: str):
+        try:
+            keys = [key async for key in self.client.scan_iter(match=self.namespace + prefix + "*")]
+            if keys:
+                await self.client.delete(*keys)
+        except Exception as e:
+            logger.warning(f"Cache delete failed for {prefix}*: {e}")
+
+class NullCache:
+    hits = 0
+    misses = 0
+
+    async def get(self, key: str):
+        return None
+
+    async def set(self, key: str, value, ttl: int = None):
+        pass
+
+    async def delete(self, *keys: str):
+        pass
+
+    async def delete_prefix(self, prefix: str):
+        pass
+
+def create_cache(backend: str = CACHE_BACKEND):
+    if backend == "redis":
+        return RedisCache()
+    if backend == "none":
+        return NullCache()
+    return MemoryCache()
+
+cache = create_cache()
+
+# Cache keys
+TOP_RATED_TREATMENTS_KEY = "top-rated-treatments"
+SPECIALTIES_PREFIX = "specialties:"
+TREATMENTS_PREFIX = "treatments:"
+
+def cache_key(*parts):
+    return ":".join("" if part is None else str(part) for part in parts)
+
+def provider_key(provider_id: int):
+    # Holds {"etag": ..., "body": ...} for the provider detail page.
+    return cache_key("provider-detail", provider_id)
+
+def user_key(user_id: int):
+    # Holds the snapshot get_current_user authenticates against.
+    return cache_key("auth-user", user_id)
+
+async def invalidate_user(user_id: int):
+    await cache.delete(user_key(user_id))
+
+async def invalidate_provider(provider_id: int):
+    # The provider detail page and the homepage leaderboard both show provider data (name, prices, rating).
+    await invalidate_providers([provider_id])
+
+async def invalidate_providers(provider_ids):
+    await cache.delete(*[provider_key(provider_id) for provider_id in provider_ids], TOP_RATED_TREATMENTS_KEY)
+
+# Conditional GET. Weak ETags, the JSON body may be serialized differently for the same data.
+def make_etag(*parts):
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+def etag_matches(if_none_match: str, etag: str):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = lambda tag: tag.strip().removeprefix("W/")
+    return opaque(etag) in {opaque(tag) for tag in if_none_match.split(",")}
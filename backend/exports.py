@@ -0,0 +1,151 @@
+"""Streaming exports of bookings, reviews and payments (routers/exports.py).
+
+Rows are read through a server side cursor (AsyncSession.stream with yield_per) as plain column tuples, no ORM
+objects or Pydantic models, and written out one batch at a time as NDJSON or CSV. Memory use depends on
+EXPORT_BATCH_SIZE, not on the size of the export.
+"""
+from sqlalchemy import select
+from datetime import datetime
+from decimal import Decimal
+from database import AsyncSessionLocal
+from models import Booking, Review, Payment, TreatmentPrice, Treatment
+from money import from_minor
+import csv
+import enum
+import io
+import json
+import os
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Exported fields, in CSV column order.
+BOOKING_COLUMNS = {
+    "id": Booking.id,
+    "user_id": Booking.user_id,
+    "provider_id": Booking.provider_id,
+    "treatment_price_id": Booking.treatment_price_id,
+    "treatment": Treatment.name,
+    "price": TreatmentPrice.price_minor,
+    "currency": TreatmentPrice.currency,
+    "appointment_date": Booking.appointment_date,
+    "status": Booking.status,
+    "special_requests": Booking.special_requests,
+    "created_at": Booking.created_at,
+    "updated_at": Booking.updated_at,
+}
+REVIEW_COLUMNS = {
+    "id": Review.id,
+    "user_id": Review.user_id,
+    "provider_id": Review.provider_id,
+    "rating": Review.rating,
+    "comment": Review.comment,
+    "treatment_received": Review.treatment_received,
+    "site_quality": Review.site_quality,
+    "transportation": Review.transportation,
+    "accommodation": Review.accommodation,
+    "verified_booking": Review.verified_booking,
+    "created_at": Review.created_at,
+    "updated_at": Review.updated_at,
+}
+PAYMENT_COLUMNS = {
+    "id": Payment.id,
+    "booking_id": Payment.booking_id,
+    "provider_id": Booking.provider_id,
+    "user_id": Booking.user_id,
+    "amount": Payment.amount_minor,
+    "currency": Payment.currency,
+    "status": Payment.status,
+    "stripe_payment_intent_id": Payment.stripe_payment_intent_id,
+    "created_at": Payment.created_at,
+    "updated_at": Payment.updated_at,
+}
+
+# Amount columns (selected in minor units) and the currency column they are converted with, to exact decimals.
+MONEY_COLUMNS = {"price": "currency", "amount": "currency"}
+
+def filter_range(query, column, start: datetime = None, end: datetime = None):
+    # [start, end), either side may be open.
+    if start is not None:
+        query = query.where(column >= start)
+    if end is not None:
+        query = query.where(column < end)
+    return query
+
+def booking_export_query(provider_id: int = None, status=None, start: datetime = None, end: datetime = None):
+    query = (
+        select(*BOOKING_COLUMNS.values())
+        .outerjoin(TreatmentPrice, TreatmentPrice.id == Booking.treatment_price_id)
+        .outerjoin(Treatment, Treatment.id == TreatmentPrice.treatment_id)
+        .order_by(Booking.appointment_date, Booking.id)
+    )
+    if provider_id is not None:
+        query = query.where(Booking.provider_id == provider_id)
+    if status is not None:
+        query = query.where(Booking.status == status)
+    return filter_range(query, Booking.appointment_date, start, end)
+
+def review_export_query(provider_id: int = None, start: datetime = None, end: datetime = None):
+    query = select(*REVIEW_COLUMNS.values()).order_by(Review.created_at, Review.id)
+    if provider_id is not None:
+        query = query.where(Review.provider_id == provider_id)
+    return filter_range(query, Review.created_at, start, end)
+
+def payment_export_query(provider_id: int = None, status=None, start: datetime = None, end: datetime = None):
+    query = select(*PAYMENT_COLUMNS.values()).join(Booking, Booking.id == Payment.booking_id).order_by(Payment.created_at, Payment.id)
+    if provider_id is not None:
+        query = query.where(Booking.provider_id == provider_id)
+    if status is not None:
+        query = query.where(Payment.status == status)
+    return filter_range(query, Payment.created_at, start, end)
+
+def export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        # The amount as written ("19.99", "1500"), a float would lose digits of large amounts.
+        return str(value)
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+def json_value(value):
+    # Decimals are JSON numbers made from their str(), json.dumps only writes numbers from floats.
+    if isinstance(value, Decimal):
+        return str(value)
+    return json.dumps(export_value(value), ensure_ascii=False)
+
+def ndjson_batch(names, rows):
+    keys = [json.dumps(name, ensure_ascii=False) + ": " for name in names]
+    return "".join(
+        "{" + ", ".join(key + json_value(value) for key, value in zip(keys, row)) + "}\n" for row in rows
+    )
+
+def csv_batch(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(["" if value is None else export_value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+def money_converter(names):
+    # Replaces minor unit amounts in a row with decimals of their currency.
+    positions = [(names.index(amount), names.index(currency)) for amount, currency in MONEY_COLUMNS.items() if amount in names]
+    def convert(row):
+        row = list(row)
+        for amount, currency in positions:
+            row[amount] = from_minor(row[amount], row[currency])
+        return row
+    return convert
+
+async def export_rows(query, columns: dict, format: str, batch_size: int = EXPORT_BATCH_SIZE):
+    """Yield the query's rows as NDJSON or CSV text, one chunk per batch of rows."""
+    names = list(columns)
+    convert = money_converter(names)
+    if format == "csv":
+        yield csv_batch([names])
+    # Own session, the export keeps streaming after the request handler has returned.
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            rows = list(map(convert, rows))
+            yield csv_batch(rows) if format == "csv" else ndjson_batch(names, rows)
@@ -0,0 +1,72 @@
+from sqlalchemy import select, insert, delete, func, literal, union_all, cast, String
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+from models import ProviderFacet, Provider, provider_specialties, provider_treatments
+import asyncio
+
+# Facets of the provider search. Ratings are cumulative buckets: a 4.5 provider counts under 1, 2, 3 and 4, so the
+# count of a bucket is what the min_rating filter with that value returns.
+FACETS = ("country", "city", "specialty", "treatment", "rating")
+RATING_BUCKETS = (1, 2, 3, 4, 5)
+
+FACET_COLUMNS = [ProviderFacet.provider_id, ProviderFacet.facet, ProviderFacet.value]
+
+def facet_rows(provider_ids=None):
+    # (provider_id, facet, value) for every facet value a provider has, optionally for some providers only.
+    def scoped(query, column):
+        return query if provider_ids is None else query.where(column.in_(provider_ids))
+
+    selects = [
+        scoped(select(Provider.id, literal("country"), Provider.country).where(Provider.country.isnot(None)), Provider.id),
+        scoped(select(Provider.id, literal("city"), Provider.city).where(Provider.city.isnot(None)), Provider.id),
+        scoped(select(
+            provider_specialties.c.provider_id, literal("specialty"), cast(provider_specialties.c.specialty_id, String)
+        ), provider_specialties.c.provider_id),
+        scoped(select(
+            provider_treatments.c.provider_id, literal("treatment"), cast(provider_treatments.c.treatment_id, String)
+        ), provider_treatments.c.provider_id),
+    ]
+    selects += [
+        scoped(select(Provider.id, literal("rating"), literal(str(bucket))).where(Provider.average_rating >= bucket), Provider.id)
+        for bucket in RATING_BUCKETS
+    ]
+    return union_all(*selects)
+
+async def refresh_provider_facets(db: AsyncSession, provider_ids):
+    """Rebuild the facet rows of some providers inside the caller's transaction.
+
+    Call it after anything a facet shows changes: country, city, specialties, treatments or the average rating.
+    Concurrent refreshes of a provider have to take turns, see jobs.refresh_providers.
+    """
+    await db.flush()
+    await db.execute(delete(ProviderFacet).where(ProviderFacet.provider_id.in_(provider_ids)))
+    await db.execute(insert(ProviderFacet).from_select(FACET_COLUMNS, facet_rows(provider_ids)))
+
+async def rebuild_facets(db: AsyncSession):
+    await db.execute(delete(ProviderFacet))
+    await db.execute(insert(ProviderFacet).from_select(FACET_COLUMNS, facet_rows()))
+    await db.commit()
+
+async def facet_counts(db: AsyncSession, provider_query):
+    """The number of providers a (filtered) Provider select returns and the counts per facet value among them, from
+    one grouped query over the facet table. The counts follow writes once their refresh_providers job ran:
+    (total, {"country": {"Turkey": 12, ...}, "city": {...}, "specialty": {"3": 5, ...}, "treatment": {...}, "rating": {...}})"""
+    provider_ids = provider_query.with_only_columns(Provider.id).order_by(None).limit(None).offset(None)
+    total = await db.scalar(select(func.count()).select_from(provider_ids.subquery()))
+    rows = await db.execute(
+        select(ProviderFacet.facet, ProviderFacet.value, func.count())
+        .where(ProviderFacet.provider_id.in_(provider_ids))
+        .group_by(ProviderFacet.facet, ProviderFacet.value)
+    )
+    counts = {facet: {} for facet in FACETS}
+    for facet, value, count in rows:
+        counts.setdefault(facet, {})[value] = count
+    return total, counts
+
+async def main():
+    async with AsyncSessionLocal() as db:
+        await rebuild_facets(db)
+    print("Provider facets rebuilt.")
+
+if __name__ == "__main__": # Full rebuild, e.g. after providers were edited directly in the database.
+    asyncio.run(main())
@@ -0,0 +1,175 @@
+"""Provider coordinates and the "providers near me" search (GET /providers/nearby).
+
+Coordinates come from the provider (latitude/longitude on create and update) or, when it gives none, from an offline
+lookup of its city and country in a local gazetteer file. Every located provider also stores the geohash of its
+coordinates, a b-tree index on it turns "near this point" into a few index range scans:
+
+    geohash cells of the search point's cell and its 8 neighbours -> candidates -> exact distance, radius, sort
+
+Geocode providers that have no coordinates yet (e.g. after migration 0011 or a gazetteer update):
+    poetry run python geo.py [--all]
+"""
+from sqlalchemy import select, update, or_, and_
+from functools import lru_cache
+from database import AsyncSessionLocal
+from models import Provider
+import argparse
+import asyncio
+import csv
+import math
+import os
+import unicodedata
+
+# CSV with a city,country,latitude,longitude header. City and country may list alternative names separated by "|".
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", os.path.join(os.path.dirname(__file__), "data", "gazetteer.csv"))
+MAX_NEARBY_RADIUS_KM = float(os.getenv("MAX_NEARBY_RADIUS_KM", "500"))
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # Stored precision, cells of about 5 x 5 m.
+
+def geohash(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    code, bits, value, even = [], 0, 0, True
+    while len(code) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude.
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            code.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return "".join(code)
+
+def cell_size(precision: int):
+    # (height, width) in degrees of a geohash cell.
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float):
+    # Haversine great circle distance.
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def search_cells(latitude: float, longitude: float, radius_km: float):
+    """Geohash prefixes that together cover the circle: the longest precision whose cells are at least radius_km
+    across, the point's cell and its neighbours. None when even single character cells are too small."""
+    radius_deg = radius_km / (math.pi * EARTH_RADIUS_KM / 180)
+    # Cells are narrowest (in km) at the edge of the circle nearest to the pole.
+    edge_latitude = min(89.9, abs(latitude) + radius_deg)
+    precision = 0
+    for candidate in range(1, GEOHASH_PRECISION + 1):
+        height, width = cell_size(candidate)
+        if height < radius_deg or width * math.cos(math.radians(edge_latitude)) < radius_deg:
+            break
+        precision = candidate
+    if not precision:
+        return None
+
+    height, width = cell_size(precision)
+    # Centre of the point's cell, the neighbours are one cell size away from it.
+    center_lat = (math.floor((latitude + 90) / height) + 0.5) * height - 90
+    center_lon = (math.floor((longitude + 180) / width) + 0.5) * width - 180
+    cells = set()
+    for lat_step in (-1, 0, 1):
+        cell_lat = center_lat + lat_step * height
+        if not -90 < cell_lat < 90:
+            continue
+        for lon_step in (-1, 0, 1):
+            cell_lon = (center_lon + lon_step * width + 180) % 360 - 180  # Across the antimeridian.
+            cells.add(geohash(cell_lat, cell_lon, precision))
+    return sorted(cells)
+
+def prefix_range(prefix: str):
+    # [prefix, next prefix) in geohash order, so the b-tree index serves it in any collation that sorts
+    # digits before lowercase letters. None as the end when nothing follows the prefix.
+    stripped = prefix.rstrip(GEOHASH_ALPHABET[-1])
+    if not stripped:
+        return prefix, None
+    return prefix, stripped[:-1] + GEOHASH_ALPHABET[GEOHASH_ALPHABET.index(stripped[-1]) + 1]
+
+def nearby_condition(latitude: float, longitude: float, radius_km: float):
+    """Where clause for the providers that can be within radius_km of the point. Candidates only, distance_km
+    decides."""
+    cells = search_cells(latitude, longitude, radius_km)
+    if cells is None:
+        return Provider.geohash.isnot(None)
+    ranges = []
+    for start, end in map(prefix_range, cells):
+        ranges.append(Provider.geohash >= start if end is None else and_(Provider.geohash >= start, Provider.geohash < end))
+    return or_(*ranges)
+
+def normalize_place(name: str):
+    # "İzmir " -> "izmir": case and accents do not matter.
+    decomposed = unicodedata.normalize("NFKD", name.strip().casefold())
+    return " ".join("".join(char for char in decomposed if not unicodedata.combining(char)).split())
+
+@lru_cache(maxsize=1)
+def gazetteer():
+    places = {}
+    with open(GAZETTEER_PATH, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            point = (float(row["latitude"]), float(row["longitude"]))
+            for city in row["city"].split("|"):
+                for country in row["country"].split("|"):
+                    places.setdefault((normalize_place(city), normalize_place(country)), point)
+    return places
+
+def geocode(city: str, country: str):
+    """(latitude, longitude) of a city from the gazetteer, None when it is not listed."""
+    if not city or not country:
+        return None
+    return gazetteer().get((normalize_place(city), normalize_place(country)))
+
+def location(city: str, country: str, latitude: float = None, longitude: float = None):
+    """Provider column values for its coordinates: the given ones, otherwise the gazetteer's for city and country."""
+    if latitude is None or longitude is None:
+        latitude, longitude = geocode(city, country) or (None, None)
+    return dict(
+        latitude=latitude,
+        longitude=longitude,
+        geohash=geohash(latitude, longitude) if latitude is not None else None,
+    )
+
+async def geocode_providers(db, everyone: bool = False):
+    """Geocode providers without coordinates (or all of them, replacing coordinates set by hand). Returns the number
+    located and the city/country pairs the gazetteer does not list."""
+    query = select(Provider.id, Provider.city, Provider.country)
+    if not everyone:
+        query = query.where(Provider.latitude.is_(None))
+    rows, missing = [], set()
+    for provider_id, city, country in await db.execute(query):
+        values = location(city, country)
+        if values["latitude"] is None:
+            missing.add((city, country))
+            if not everyone:
+                continue
+        rows.append(dict(id=provider_id, **values))
+    if rows:
+        await db.execute(update(Provider), rows)  # Bulk UPDATE by primary key.
+    await db.commit()
+    return sum(row["latitude"] is not None for row in rows), missing
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--all", action="store_true", help="Re-geocode every provider from its city and country")
+    args = parser.parse_args(argv)
+
+    async with AsyncSessionLocal() as db:
+        located, missing = await geocode_providers(db, args.all)
+    print(f"Geocoded {located} providers.")
+    for city, country in sorted(missing, key=str):
+        print(f"Not in the gazetteer: {city}, {country}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,10 +1,25 @@
-from database import engine
-from models import Base
-import models
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+from database import async_engine
+import os
+import asyncio
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
-    print("Database tables created successfully!")
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+def run_migrations(connection):
+    config = Config(ALEMBIC_INI)
+    config.attributes["connection"] = connection
+    # Databases created by create_all before migrations existed already have the initial schema.
+    inspector = inspect(connection)
+    if inspector.has_table("users") and not inspector.has_table("alembic_version"):
+        command.stamp(config, "0001")
+    command.upgrade(config, "head")
+
+async def init_db():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(run_migrations)
+    print("Database migrated successfully!")
 
 if __name__ == "__main__": # In case we run the database manually.
-    init_db()
\ No newline at end of file
+    asyncio.run(init_db())
@@ -0,0 +1,254 @@
+"""Background jobs: follow-up work of a write that the client does not have to wait for.
+
+A router calls enqueue(db, name, **args) before it commits. The job runs after the transaction commits, never if it
+rolls back, in its own session:
+- JOB_QUEUE=memory (the default): handed to a pool of JOB_WORKERS tasks in this process. Jobs still queued when the
+  process dies are lost, the refresh jobs can be redone with the rebuild scripts (leaderboard.py, facets.py).
+- JOB_QUEUE=database: inserted into the jobs table in the same transaction, so a committed write always gets its
+  jobs. Workers in any process claim them with SELECT ... FOR UPDATE SKIP LOCKED (Postgres). They also run on
+  their own:
+    JOB_QUEUE=database poetry run python jobs.py
+
+A failing job is retried JOB_MAX_ATTEMPTS times with exponential backoff and then dead-lettered: logged, kept in
+the jobs table (status "dead") or, in memory, in the last JOB_DEAD_LETTERS dead jobs. Counters per job and the dead
+jobs are at GET /health/jobs.
+"""
+from sqlalchemy import select, update, delete, event, func
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from database import AsyncSessionLocal
+from models import Job, Provider
+from leaderboard import refresh_providers_leaderboard
+from facets import refresh_provider_facets
+from cache import invalidate_providers
+import asyncio
+import json
+import logging
+import os
+import time
+
+JOB_QUEUE = os.getenv("JOB_QUEUE", "memory")  # "memory" or "database"
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "1"))  # Seconds before the first retry, doubled for each next one.
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "300"))  # Database queue: a claimed job not finished by then runs again.
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))  # Database queue: picks up jobs of other processes.
+JOB_DEAD_LETTERS = int(os.getenv("JOB_DEAD_LETTERS", "100"))
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", "10"))  # Memory queue: time to finish queued jobs.
+
+PENDING, DEAD = "pending", "dead"
+PENDING_JOBS = "pending_jobs"  # Session.info key of the jobs waiting for the commit.
+
+logger = logging.getLogger(__name__)
+
+handlers = {}
+stats = {}
+dead_letters = deque(maxlen=JOB_DEAD_LETTERS)
+queue = asyncio.Queue()  # Memory queue: (name, args, attempt).
+retries = set()  # Memory queue: timers of failed jobs waiting for their next attempt.
+jobs_pending = asyncio.Event()  # Database queue: wakes the worker when this process commits jobs.
+
+def counters(name: str):
+    return stats.setdefault(name, dict(enqueued=0, succeeded=0, retried=0, dead=0, seconds=0.0))
+
+def job(name: str):
+    """Register a handler, async def handler(db, **args). It commits its own work."""
+    def register(handler):
+        handlers[name] = handler
+        counters(name)
+        return handler
+    return register
+
+def enqueue(db: AsyncSession, name: str, **args):
+    """Run a job once db's transaction commits. Arguments have to be JSON serializable."""
+    if name not in handlers:
+        raise ValueError(f"Unknown job {name}")
+    counters(name)["enqueued"] += 1
+    if JOB_QUEUE == "database":
+        db.add(Job(name=name, args=json.dumps(args), run_at=datetime.now(timezone.utc)))
+    db.sync_session.info.setdefault(PENDING_JOBS, []).append((name, args))
+
+@event.listens_for(Session, "after_commit")
+def hand_over_jobs(session):
+    jobs = session.info.pop(PENDING_JOBS, None)
+    if not jobs:
+        return
+    if JOB_QUEUE == "database":
+        jobs_pending.set()  # Already committed with the transaction.
+        return
+    for name, args in jobs:
+        queue.put_nowait((name, args, 1))
+
+@event.listens_for(Session, "after_rollback")
+def drop_jobs(session):
+    session.info.pop(PENDING_JOBS, None)
+
+def retry_delay(attempt: int):
+    return JOB_RETRY_DELAY * 2 ** (attempt - 1)
+
+async def execute(name: str, args: dict):
+    start = time.perf_counter()
+    try:
+        if name not in handlers:
+            raise ValueError(f"Unknown job {name}")
+        async with AsyncSessionLocal() as db:
+            await handlers[name](db, **args)
+    finally:
+        counters(name)["seconds"] += time.perf_counter() - start
+
+def failed(name: str, args: dict, attempt: int, error: Exception):
+    """Count a failed attempt. True when the job gets another one."""
+    if attempt < JOB_MAX_ATTEMPTS:
+        counters(name)["retried"] += 1
+        logger.warning(f"Job {name} {args} failed (attempt {attempt}), retrying: {error!r}")
+        return True
+    counters(name)["dead"] += 1
+    logger.error(f"Job {name} {args} failed {attempt} times, giving up: {error!r}")
+    return False
+
+def retry_later(name: str, args: dict, attempt: int):
+    # The failed attempt stays unfinished until its retry is queued, so stop_job_workers waits for the retry too.
+    def requeue():
+        retries.discard(handle)
+        queue.put_nowait((name, args, attempt + 1))
+        queue.task_done()
+    handle = asyncio.get_running_loop().call_later(retry_delay(attempt), requeue)
+    retries.add(handle)
+
+async def run_memory_worker():
+    while True:
+        name, args, attempt = await queue.get()
+        try:
+            await execute(name, args)
+            counters(name)["succeeded"] += 1
+        except Exception as e:
+            if failed(name, args, attempt, e):
+                retry_later(name, args, attempt)
+                continue
+            dead_letters.append(dict(name=name, args=args, error=repr(e), failed_at=datetime.now(timezone.utc).isoformat()))
+        queue.task_done()
+
+async def claim_jobs(db: AsyncSession, limit: int):
+    """Claim due jobs for this worker: their attempt is counted and run_at moved to when the claim expires."""
+    now = datetime.now(timezone.utc)
+    jobs = (await db.scalars(
+        select(Job)
+        .where(Job.status == PENDING, Job.run_at <= now)
+        .order_by(Job.run_at, Job.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)  # Workers in other processes take other jobs (Postgres).
+    )).all()
+    claimed = []
+    for db_job in jobs:
+        db_job.attempts += 1
+        db_job.run_at = now + timedelta(seconds=JOB_TIMEOUT)
+        claimed.append((db_job.id, db_job.name, json.loads(db_job.args), db_job.attempts))
+    await db.commit()
+    return claimed
+
+async def run_claimed(job_id: int, name: str, args: dict, attempt: int):
+    try:
+        await execute(name, args)
+        counters(name)["succeeded"] += 1
+        result = delete(Job).where(Job.id == job_id)
+    except Exception as e:
+        if failed(name, args, attempt, e):
+            values = dict(run_at=datetime.now(timezone.utc) + timedelta(seconds=retry_delay(attempt)), error=repr(e))
+        else:
+            values = dict(status=DEAD, error=repr(e), run_at=datetime.now(timezone.utc))  # run_at: when it died.
+        result = update(Job).where(Job.id == job_id).values(**values)
+    async with AsyncSessionLocal() as db:
+        await db.execute(result)
+        await db.commit()
+
+async def run_database_worker():
+    while True:
+        jobs_pending.clear()
+        try:
+            async with AsyncSessionLocal() as db:
+                claimed = await claim_jobs(db, JOB_WORKERS)
+            if claimed:
+                await asyncio.gather(*(run_claimed(*claim) for claim in claimed))
+                continue  # There may be more due jobs.
+        except Exception as e:
+            logger.error(f"Running jobs failed: {e}")
+        try:
+            await asyncio.wait_for(jobs_pending.wait(), JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+async def get_job_stats():
+    """Counters of this process, queued and dead jobs of the queue (all processes' for the database queue)."""
+    result = dict(queue=JOB_QUEUE, workers=JOB_WORKERS, jobs=stats)
+    if JOB_QUEUE != "database":
+        return dict(result, queued=queue.qsize(), retrying=len(retries), dead=sum(c["dead"] for c in stats.values()), dead_letters=list(dead_letters))
+    async with AsyncSessionLocal() as db:
+        counts = dict((await db.execute(select(Job.status, func.count()).group_by(Job.status))).all())
+        dead = (await db.scalars(
+            select(Job).where(Job.status == DEAD).order_by(Job.run_at.desc(), Job.id.desc()).limit(JOB_DEAD_LETTERS)
+        )).all()
+    return dict(
+        result,
+        queued=counts.get(PENDING, 0),
+        dead=counts.get(DEAD, 0),
+        dead_letters=[
+            dict(id=j.id, name=j.name, args=json.loads(j.args), error=j.error, failed_at=j.run_at.isoformat()) for j in dead
+        ],
+    )
+
+_workers = []
+
+def start_job_workers():
+    if _workers:
+        return
+    if JOB_QUEUE == "database":
+        _workers.append(asyncio.create_task(run_database_worker()))
+    else:
+        _workers.extend(asyncio.create_task(run_memory_worker()) for _ in range(JOB_WORKERS))
+
+async def stop_job_workers():
+    if JOB_QUEUE != "database" and _workers:
+        try:
+            await asyncio.wait_for(queue.join(), JOB_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"Stopping with {queue.qsize()} jobs still queued and {len(retries)} waiting for a retry")
+        for handle in retries:
+            handle.cancel()
+        retries.clear()
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+# Jobs
+
+@job("refresh_providers")
+async def refresh_providers(db: AsyncSession, provider_ids: list):
+    # Data derived from providers, their prices and reviews: leaderboard rows and search facets. Then the cached
+    # pages showing them, which may have been filled again since the write.
+    # Both are rebuilt by deleting and inserting a provider's rows, two refreshes of the same provider at once (two
+    # writes in a row, workers in several processes) would insert the same primary keys. The provider row locks,
+    # taken in id order, make them run one after the other (Postgres; SQLite runs one write transaction at a time).
+    await db.execute(
+        select(Provider.id).where(Provider.id.in_(provider_ids)).order_by(Provider.id).with_for_update()
+    )
+    await refresh_providers_leaderboard(db, provider_ids)
+    await refresh_provider_facets(db, provider_ids)
+    await db.commit()
+    await invalidate_providers(provider_ids)
+
+@job("booking_status_changed")
+async def booking_status_changed(db: AsyncSession, booking_id: int, status: str):
+    # Hook for notifying the user and the provider (email, analytics). Only logged so far.
+    logger.info(f"Booking {booking_id} is now {status}")
+
+@job("payment_status_changed")
+async def payment_status_changed(db: AsyncSession, payment_id: int, status: str):
+    logger.info(f"Payment {payment_id} is now {status}")
+
+if __name__ == "__main__":
+    if JOB_QUEUE != "database":
+        raise SystemExit("Running jobs on their own needs JOB_QUEUE=database")
+    asyncio.run(run_database_worker())
@@ -0,0 +1,81 @@
+from sqlalchemy import select, insert, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+from models import TreatmentLeaderboard, Treatment, TreatmentPrice, Provider, Review
+import asyncio
+
+LEADERBOARD_COLUMNS = [
+    TreatmentLeaderboard.treatment_id,
+    TreatmentLeaderboard.treatment_name,
+    TreatmentLeaderboard.treatment_category,
+    TreatmentLeaderboard.provider_id,
+    TreatmentLeaderboard.provider_name,
+    TreatmentLeaderboard.average_rating,
+    TreatmentLeaderboard.review_count,
+    TreatmentLeaderboard.review_snippet,
+]
+
+def leaderboard_rows():
+    # One row per treatment a provider has a price for, scored with the provider's rating aggregates.
+    # The rating comes from the provider row (kept by update_provider_rating) so the reviews are never joined in bulk.
+    snippet = (
+        select(func.substr(func.coalesce(func.min(Review.comment), ''), 1, 120))
+        .where(Review.provider_id == Provider.id)
+        .scalar_subquery()
+    )
+    return (
+        select(
+            Treatment.id,
+            Treatment.name,
+            Treatment.category,
+            Provider.id,
+            Provider.name,
+            Provider.average_rating,
+            Provider.total_reviews,
+            snippet,
+        )
+        .select_from(TreatmentPrice)
+        .join(Treatment, Treatment.id == TreatmentPrice.treatment_id)
+        .join(Provider, Provider.id == TreatmentPrice.provider_id)
+        .where(Provider.total_reviews > 0)
+        .distinct()
+    )
+
+async def refresh_provider_leaderboard(db: AsyncSession, provider_id: int):
+    """Rebuild the leaderboard rows of one provider inside the caller's transaction.
+
+    Call it after anything the leaderboard shows changes: the provider's reviews/rating, its name or its treatment prices.
+    Concurrent refreshes of a provider have to take turns, see jobs.refresh_providers.
+    """
+    await refresh_providers_leaderboard(db, [provider_id])
+
+async def refresh_providers_leaderboard(db: AsyncSession, provider_ids):
+    # Same for a set of providers (bulk imports), two statements whatever the number of providers.
+    await db.flush()
+    await db.execute(delete(TreatmentLeaderboard).where(TreatmentLeaderboard.provider_id.in_(provider_ids)))
+    await db.execute(
+        insert(TreatmentLeaderboard).from_select(
+            LEADERBOARD_COLUMNS,
+            leaderboard_rows().where(Provider.id.in_(provider_ids)),
+        )
+    )
+
+async def rebuild_leaderboard(db: AsyncSession):
+    await db.execute(delete(TreatmentLeaderboard))
+    await db.execute(insert(TreatmentLeaderboard).from_select(LEADERBOARD_COLUMNS, leaderboard_rows()))
+    await db.commit()
+
+async def get_leaderboard(db: AsyncSession, limit: int = 4):
+    return (await db.scalars(
+        select(TreatmentLeaderboard)
+        .order_by(TreatmentLeaderboard.average_rating.desc(), TreatmentLeaderboard.review_count.desc())
+        .limit(limit)
+    )).all()
+
+async def main():
+    async with AsyncSessionLocal() as db:
+        await rebuild_leaderboard(db)
+    print("Treatment leaderboard rebuilt.")
+
+if __name__ == "__main__": # Full rebuild, e.g. after treatments were edited directly in the database.
+    asyncio.run(main())
@@ -1,7 +1,15 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from routers import auth, providers, reviews, bookings, payments, users, treatments
+from routers import auth, providers, reviews, bookings, payments, users, treatments, imports, exports
+from routers.auth import get_current_active_user, CurrentUser
 from init_db import init_db
+from database import get_pool_stats
+from pagination import NEXT_CURSOR_HEADER
+from models import UserRole
+from access_log import AccessLogMiddleware, start_access_log, stop_access_log
+from stripe_events import start_event_worker, stop_event_worker
+from prices import ensure_fx_rates
+from jobs import start_job_workers, stop_job_workers, get_job_stats
 import os
 
 app = FastAPI()
@@ -14,20 +22,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],  # So browser clients can read the next page cursor.
 )
 
-@app.middleware("http")
-async def log_requests(request, call_next):
-    print(f"\n=== Incoming Request ===")
-    print(f"Method: {request.method}")
-    print(f"URL: {request.url}")
-    print(f"Headers: {request.headers}")
-    
-    response = await call_next(request)
-    
-    print(f"\n=== Response ===")
-    print(f"Status: {response.status_code}")
-    return response
+# Structured JSON access log, written off the event loop (see access_log.py for the sampling/redaction settings).
+app.add_middleware(AccessLogMiddleware)
 
 app.include_router(auth.router)
 app.include_router(providers.router)
@@ -36,6 +35,8 @@ app.include_router(bookings.router)
 app.include_router(payments.router)
 app.include_router(users.router)
 app.include_router(treatments.router)
+app.include_router(imports.router)
+app.include_router(exports.router)
 
 @app.get("/")
 async def root():
@@ -45,14 +46,43 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/pool")
+async def pool_health(current_user: CurrentUser = Depends(get_current_active_user)):
+    # Only admin can see database pool statistics
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can view pool statistics"
+        )
+    return get_pool_stats()
+
+@app.get("/health/jobs")
+async def job_health(current_user: CurrentUser = Depends(get_current_active_user)):
+    # Background job counters and dead letters, admin only like the pool statistics
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can view job statistics"
+        )
+    return await get_job_stats()
+
 
 @app.on_event("startup")
 async def on_startup():
-    init_db()
+    start_access_log()
+    await init_db()
+    await ensure_fx_rates()
+    start_event_worker()
+    start_job_workers()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await stop_event_worker()
+    await stop_job_workers()  # Finishes the queued jobs first.
+    stop_access_log()
 
 @app.options("/{rest_of_path:path}")
 async def preflight_handler(rest_of_path: str):
-    print(f"CORS Preflight to: /{rest_of_path}")
     return {}
 
 if __name__ == "__main__":
@@ -0,0 +1,45 @@
+from alembic import context
+from logging.config import fileConfig
+from sqlalchemy.ext.asyncio import create_async_engine
+from database import ASYNC_DATABASE_URL, Base
+import models
+import asyncio
+
+config = context.config
+
+# Only the CLI configures logging, not init_db running inside the app.
+if config.config_file_name is not None and "connection" not in config.attributes:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+def run_migrations_offline():
+    # alembic upgrade head --sql: print the SQL instead of running it.
+    context.configure(url=str(ASYNC_DATABASE_URL), target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def do_run_migrations(connection):
+    context.configure(connection=connection, target_metadata=target_metadata)
+    with context.begin_transaction():
+        context.run_migrations()
+
+async def run_async_migrations():
+    engine = create_async_engine(ASYNC_DATABASE_URL)
+    async with engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+        await connection.commit()
+    await engine.dispose()
+
+def run_migrations_online():
+    # init_db passes the connection it already holds (inside the app's event loop), the CLI opens its own.
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        do_run_migrations(connection)
+    else:
+        asyncio.run(run_async_migrations())
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
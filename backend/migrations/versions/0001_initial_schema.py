@@ -0,0 +1,159 @@
+"""initial schema
+
+The schema Base.metadata.create_all produced before migrations were introduced. Databases created that way are
+stamped with this revision by init_db instead of running it.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+user_role = sa.Enum("USER", "PROVIDER", "ADMIN", name="userrole")
+booking_status = sa.Enum("PENDING", "CONFIRMED", "CANCELLED", "COMPLETED", name="bookingstatus")
+payment_status = sa.Enum("PENDING", "PAID", "REFUNDED", "FAILED", name="paymentstatus")
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("email", sa.String()),
+        sa.Column("username", sa.String()),
+        sa.Column("hashed_password", sa.String()),
+        sa.Column("full_name", sa.String()),
+        sa.Column("role", user_role),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("is_active", sa.Boolean()),
+        sa.Column("stripe_customer_id", sa.String(), nullable=True),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+
+    op.create_table(
+        "providers",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), unique=True),
+        sa.Column("name", sa.String()),
+        sa.Column("description", sa.Text()),
+        sa.Column("address", sa.String()),
+        sa.Column("city", sa.String()),
+        sa.Column("country", sa.String()),
+        sa.Column("phone", sa.String()),
+        sa.Column("website", sa.String(), nullable=True),
+        sa.Column("license_number", sa.String(), nullable=True),
+        sa.Column("is_verified", sa.Boolean()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True)),
+        sa.Column("average_rating", sa.Float()),
+        sa.Column("total_reviews", sa.Integer()),
+        sa.Column("featured", sa.Boolean()),
+    )
+    op.create_index("ix_providers_id", "providers", ["id"])
+    op.create_index("ix_providers_name", "providers", ["name"])
+    op.create_index("ix_providers_country", "providers", ["country"])
+
+    op.create_table(
+        "specialties",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String()),
+        sa.Column("description", sa.Text(), nullable=True),
+    )
+    op.create_index("ix_specialties_id", "specialties", ["id"])
+    op.create_index("ix_specialties_name", "specialties", ["name"], unique=True)
+
+    op.create_table(
+        "treatments",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String()),
+        sa.Column("description", sa.Text()),
+        sa.Column("category", sa.String()),
+        sa.Column("average_duration", sa.String(), nullable=True),
+        sa.Column("recovery_time", sa.String(), nullable=True),
+    )
+    op.create_index("ix_treatments_id", "treatments", ["id"])
+    op.create_index("ix_treatments_name", "treatments", ["name"])
+    op.create_index("ix_treatments_category", "treatments", ["category"])
+
+    op.create_table(
+        "provider_specialties",
+        sa.Column("provider_id", sa.Integer(), sa.ForeignKey("providers.id"), primary_key=True),
+        sa.Column("specialty_id", sa.Integer(), sa.ForeignKey("specialties.id"), primary_key=True),
+    )
+    op.create_table(
+        "provider_treatments",
+        sa.Column("provider_id", sa.Integer(), sa.ForeignKey("providers.id"), primary_key=True),
+        sa.Column("treatment_id", sa.Integer(), sa.ForeignKey("treatments.id"), primary_key=True),
+    )
+
+    op.create_table(
+        "treatment_prices",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("provider_id", sa.Integer(), sa.ForeignKey("providers.id")),
+        sa.Column("treatment_id", sa.Integer(), sa.ForeignKey("treatments.id")),
+        sa.Column("price", sa.Float()),
+        sa.Column("currency", sa.String()),
+        sa.Column("description", sa.Text(), nullable=True),
+    )
+    op.create_index("ix_treatment_prices_id", "treatment_prices", ["id"])
+
+    op.create_table(
+        "reviews",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("provider_id", sa.Integer(), sa.ForeignKey("providers.id")),
+        sa.Column("rating", sa.Integer()),
+        sa.Column("comment", sa.Text(), nullable=True),
+        sa.Column("treatment_received", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True)),
+        sa.Column("verified_booking", sa.Boolean()),
+        sa.Column("site_quality", sa.Integer(), nullable=True),
+        sa.Column("transportation", sa.Integer(), nullable=True),
+        sa.Column("accommodation", sa.Integer(), nullable=True),
+    )
+    op.create_index("ix_reviews_id", "reviews", ["id"])
+
+    op.create_table(
+        "bookings",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("provider_id", sa.Integer(), sa.ForeignKey("providers.id")),
+        sa.Column("treatment_price_id", sa.Integer(), sa.ForeignKey("treatment_prices.id")),
+        sa.Column("appointment_date", sa.DateTime(timezone=True)),
+        sa.Column("status", booking_status),
+        sa.Column("special_requests", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True)),
+    )
+    op.create_index("ix_bookings_id", "bookings", ["id"])
+
+    op.create_table(
+        "payments",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("booking_id", sa.Integer(), sa.ForeignKey("bookings.id"), unique=True),
+        sa.Column("amount", sa.Float()),
+        sa.Column("currency", sa.String()),
+        sa.Column("status", payment_status),
+        sa.Column("stripe_payment_intent_id", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True)),
+    )
+    op.create_index("ix_payments_id", "payments", ["id"])
+
+
+def downgrade():
+    for table in [
+        "payments", "bookings", "reviews", "treatment_prices", "provider_treatments",
+        "provider_specialties", "treatments", "specialties", "providers", "users",
+    ]:
+        op.drop_table(table)
+    for enum in (payment_status, booking_status, user_role):
+        enum.drop(op.get_bind(), checkfirst=True)
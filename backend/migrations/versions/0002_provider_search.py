@@ -0,0 +1,39 @@
+"""provider full text search
+
+Weighted tsvector column, GIN index and trigram indexes for provider search (Postgres only).
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(city, '') || ' ' || coalesce(country, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute(f"ALTER TABLE providers ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ({SEARCH_DOCUMENT}) STORED")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_providers_search_vector ON providers USING gin (search_vector)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_providers_name_trgm ON providers USING gin (name gin_trgm_ops)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_providers_city_trgm ON providers USING gin (city gin_trgm_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("DROP INDEX IF EXISTS ix_providers_city_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_providers_name_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_providers_search_vector")
+    op.execute("ALTER TABLE providers DROP COLUMN IF EXISTS search_vector")
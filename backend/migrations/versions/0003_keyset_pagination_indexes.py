@@ -0,0 +1,30 @@
+"""keyset pagination indexes
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_providers_average_rating_id", "providers", ["average_rating", "id"]),
+    ("ix_reviews_provider_id_created_at_id", "reviews", ["provider_id", "created_at", "id"]),
+    ("ix_reviews_user_id_created_at_id", "reviews", ["user_id", "created_at", "id"]),
+    ("ix_bookings_user_id_appointment_date_id", "bookings", ["user_id", "appointment_date", "id"]),
+    ("ix_bookings_provider_id_appointment_date_id", "bookings", ["provider_id", "appointment_date", "id"]),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
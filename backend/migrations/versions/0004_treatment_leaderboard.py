@@ -0,0 +1,47 @@
+"""treatment leaderboard
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "treatment_leaderboard",
+        sa.Column("treatment_id", sa.Integer(), sa.ForeignKey("treatments.id"), primary_key=True),
+        sa.Column("provider_id", sa.Integer(), sa.ForeignKey("providers.id"), primary_key=True),
+        sa.Column("treatment_name", sa.String()),
+        sa.Column("treatment_category", sa.String()),
+        sa.Column("provider_name", sa.String()),
+        sa.Column("average_rating", sa.Float()),
+        sa.Column("review_count", sa.Integer()),
+        sa.Column("review_snippet", sa.String(), nullable=True),
+    )
+    op.create_index("ix_treatment_leaderboard_rank", "treatment_leaderboard", ["average_rating", "review_count"])
+    op.create_index("ix_treatment_leaderboard_provider_id", "treatment_leaderboard", ["provider_id"])
+
+    # Fill it from the existing reviews, it is maintained incrementally from here on.
+    op.execute("""
+        INSERT INTO treatment_leaderboard (
+            treatment_id, treatment_name, treatment_category, provider_id, provider_name,
+            average_rating, review_count, review_snippet
+        )
+        SELECT DISTINCT t.id, t.name, t.category, p.id, p.name, p.average_rating, p.total_reviews,
+            (SELECT substr(coalesce(min(r.comment), ''), 1, 120) FROM reviews r WHERE r.provider_id = p.id)
+        FROM treatment_prices tp
+        JOIN treatments t ON t.id = tp.treatment_id
+        JOIN providers p ON p.id = tp.provider_id
+        WHERE p.total_reviews > 0
+    """)
+
+
+def downgrade():
+    op.drop_table("treatment_leaderboard")
@@ -0,0 +1,46 @@
+"""provider rating sums
+
+Running review score sums/counts on providers, backfilled from the existing reviews.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    "rating_sum",
+    "site_quality_sum", "site_quality_count",
+    "transportation_sum", "transportation_count",
+    "accommodation_sum", "accommodation_count",
+]
+
+
+def upgrade():
+    for column in COLUMNS:
+        op.add_column("providers", sa.Column(column, sa.Integer(), server_default="0", nullable=False))
+
+    op.execute("""
+        UPDATE providers SET
+            rating_sum = (SELECT coalesce(sum(rating), 0) FROM reviews WHERE reviews.provider_id = providers.id),
+            total_reviews = (SELECT count(rating) FROM reviews WHERE reviews.provider_id = providers.id),
+            average_rating = (SELECT coalesce(avg(rating), 0) FROM reviews WHERE reviews.provider_id = providers.id),
+            site_quality_sum = (SELECT coalesce(sum(site_quality), 0) FROM reviews WHERE reviews.provider_id = providers.id),
+            site_quality_count = (SELECT count(site_quality) FROM reviews WHERE reviews.provider_id = providers.id),
+            transportation_sum = (SELECT coalesce(sum(transportation), 0) FROM reviews WHERE reviews.provider_id = providers.id),
+            transportation_count = (SELECT count(transportation) FROM reviews WHERE reviews.provider_id = providers.id),
+            accommodation_sum = (SELECT coalesce(sum(accommodation), 0) FROM reviews WHERE reviews.provider_id = providers.id),
+            accommodation_count = (SELECT count(accommodation) FROM reviews WHERE reviews.provider_id = providers.id)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table("providers") as batch:
+        for column in reversed(COLUMNS):
+            batch.drop_column(column)
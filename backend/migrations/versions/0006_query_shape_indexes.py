@@ -0,0 +1,41 @@
+"""indexes for the routers' hot filters
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_provider_specialties_specialty_id", "provider_specialties", ["specialty_id"]),
+    ("ix_provider_treatments_treatment_id", "provider_treatments", ["treatment_id"]),
+    ("ix_treatment_prices_provider_id_treatment_id", "treatment_prices", ["provider_id", "treatment_id"]),
+    ("ix_treatment_prices_treatment_id", "treatment_prices", ["treatment_id"]),
+    ("ix_reviews_user_id_provider_id_treatment_received", "reviews", ["user_id", "provider_id", "treatment_received"]),
+    ("ix_bookings_user_id_status_appointment_date", "bookings", ["user_id", "status", "appointment_date"]),
+    ("ix_bookings_provider_id_status", "bookings", ["provider_id", "status"]),
+    ("ix_bookings_treatment_price_id", "bookings", ["treatment_price_id"]),
+]
+
+COMPLETED = sa.text("status = 'COMPLETED'")
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+    op.create_index(
+        "ix_bookings_completed_user_id_provider_id", "bookings", ["user_id", "provider_id"],
+        postgresql_where=COMPLETED, sqlite_where=COMPLETED,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_bookings_completed_user_id_provider_id", table_name="bookings")
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
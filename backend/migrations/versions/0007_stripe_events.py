@@ -0,0 +1,39 @@
+"""stripe webhook event inbox
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+PENDING = sa.text("processed_at IS NULL")
+
+
+def upgrade():
+    op.create_table(
+        "stripe_events",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column("created", sa.Integer(), nullable=False),
+        sa.Column("received_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("processed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+    )
+    op.create_index(
+        "ix_stripe_events_pending_created", "stripe_events", ["created"],
+        postgresql_where=PENDING, sqlite_where=PENDING,
+    )
+    op.create_index("ix_payments_stripe_payment_intent_id", "payments", ["stripe_payment_intent_id"])
+
+
+def downgrade():
+    op.drop_index("ix_payments_stripe_payment_intent_id", table_name="payments")
+    op.drop_index("ix_stripe_events_pending_created", table_name="stripe_events")
+    op.drop_table("stripe_events")
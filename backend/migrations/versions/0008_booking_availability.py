@@ -0,0 +1,47 @@
+"""provider working hours and booking slot index
+
+Bookings made before this revision have no slot rows, `python availability.py` claims slots for the upcoming ones.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("providers", sa.Column("timezone", sa.String(), server_default="UTC", nullable=False))
+    op.add_column("providers", sa.Column("slot_minutes", sa.Integer(), server_default="60", nullable=False))
+    op.add_column("providers", sa.Column("slot_capacity", sa.Integer(), server_default="1", nullable=False))
+
+    op.create_table(
+        "provider_working_hours",
+        sa.Column("provider_id", sa.Integer(), sa.ForeignKey("providers.id"), primary_key=True),
+        sa.Column("weekday", sa.Integer(), primary_key=True),
+        sa.Column("opens_at", sa.Time(), nullable=False),
+        sa.Column("closes_at", sa.Time(), nullable=False),
+    )
+    op.create_table(
+        "booking_slots",
+        sa.Column("provider_id", sa.Integer(), sa.ForeignKey("providers.id"), primary_key=True),
+        sa.Column("slot_start", sa.DateTime(timezone=True), primary_key=True),
+        sa.Column("seat", sa.Integer(), primary_key=True),
+        sa.Column("booking_id", sa.Integer(), sa.ForeignKey("bookings.id"), nullable=False),
+    )
+    op.create_index("ix_booking_slots_booking_id", "booking_slots", ["booking_id"])
+
+
+def downgrade():
+    op.drop_index("ix_booking_slots_booking_id", table_name="booking_slots")
+    op.drop_table("booking_slots")
+    op.drop_table("provider_working_hours")
+    with op.batch_alter_table("providers") as batch:
+        batch.drop_column("slot_capacity")
+        batch.drop_column("slot_minutes")
+        batch.drop_column("timezone")
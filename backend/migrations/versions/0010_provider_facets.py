@@ -0,0 +1,41 @@
+"""provider facet table
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "provider_facets",
+        sa.Column("facet", sa.String(), primary_key=True),
+        sa.Column("value", sa.String(), primary_key=True),
+        sa.Column("provider_id", sa.Integer(), sa.ForeignKey("providers.id"), primary_key=True),
+    )
+    op.create_index("ix_provider_facets_provider_id", "provider_facets", ["provider_id"])
+
+    # Fill it from the existing providers, it is maintained incrementally from here on.
+    ratings = "\n".join(
+        f"UNION ALL SELECT id, 'rating', '{bucket}' FROM providers WHERE average_rating >= {bucket}"
+        for bucket in range(1, 6)
+    )
+    op.execute(f"""
+        INSERT INTO provider_facets (provider_id, facet, value)
+        SELECT id, 'country', country FROM providers WHERE country IS NOT NULL
+        UNION ALL SELECT id, 'city', city FROM providers WHERE city IS NOT NULL
+        UNION ALL SELECT provider_id, 'specialty', CAST(specialty_id AS VARCHAR) FROM provider_specialties
+        UNION ALL SELECT provider_id, 'treatment', CAST(treatment_id AS VARCHAR) FROM provider_treatments
+        {ratings}
+    """)
+
+
+def downgrade():
+    op.drop_table("provider_facets")
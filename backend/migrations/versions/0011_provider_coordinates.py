@@ -0,0 +1,30 @@
+"""provider coordinates and geohash index
+
+Existing providers have no coordinates until `python geo.py` geocodes them from the gazetteer.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("providers", sa.Column("latitude", sa.Float(), nullable=True))
+    op.add_column("providers", sa.Column("longitude", sa.Float(), nullable=True))
+    op.add_column("providers", sa.Column("geohash", sa.String(12), nullable=True))
+    op.create_index("ix_providers_geohash", "providers", ["geohash"])
+
+
+def downgrade():
+    op.drop_index("ix_providers_geohash", table_name="providers")
+    with op.batch_alter_table("providers") as batch:
+        batch.drop_column("geohash")
+        batch.drop_column("longitude")
+        batch.drop_column("latitude")
@@ -0,0 +1,36 @@
+"""fx rates and treatment prices in the base currency
+
+base_price is filled at startup, when the empty fx_rates table is loaded from the rates file (prices.py).
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0012"
+down_revision = "0011"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "fx_rates",
+        sa.Column("currency", sa.String(3), primary_key=True),
+        sa.Column("rate", sa.Float(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.add_column("treatment_prices", sa.Column("base_price", sa.Float(), nullable=True))
+    # Leads with treatment_id, so it replaces the single column index.
+    op.create_index("ix_treatment_prices_treatment_id_base_price", "treatment_prices", ["treatment_id", "base_price", "id"])
+    op.drop_index("ix_treatment_prices_treatment_id", table_name="treatment_prices")
+
+
+def downgrade():
+    op.create_index("ix_treatment_prices_treatment_id", "treatment_prices", ["treatment_id"])
+    op.drop_index("ix_treatment_prices_treatment_id_base_price", table_name="treatment_prices")
+    with op.batch_alter_table("treatment_prices") as batch:
+        batch.drop_column("base_price")
+    op.drop_table("fx_rates")
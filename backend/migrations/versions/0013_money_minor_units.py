@@ -0,0 +1,54 @@
+"""treatment prices and payments in integer minor units
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0013"
+down_revision = "0012"
+branch_labels = None
+depends_on = None
+
+# ISO 4217 exponents other than 2, as in money.py at this revision.
+ZERO_DECIMAL = ("BIF", "CLP", "DJF", "GNF", "ISK", "JPY", "KMF", "KRW", "PYG", "RWF", "UGX", "UYI", "VND", "VUV", "XAF", "XOF", "XPF")
+THREE_DECIMAL = ("BHD", "IQD", "JOD", "KWD", "LYD", "OMR", "TND")
+
+
+def minor_unit(currency_column):
+    # 10 ** exponent of the row's currency, as SQL.
+    zero = ", ".join(f"'{code}'" for code in ZERO_DECIMAL)
+    three = ", ".join(f"'{code}'" for code in THREE_DECIMAL)
+    return (f"CASE WHEN upper({currency_column}) IN ({zero}) THEN 1 "
+            f"WHEN upper({currency_column}) IN ({three}) THEN 1000 ELSE 100 END")
+
+
+def convert(table, old, new, currency="currency"):
+    op.add_column(table, sa.Column(new, sa.BigInteger(), nullable=True))
+    op.execute(f"UPDATE {table} SET {new} = CAST(ROUND({old} * {minor_unit(currency)}) AS BIGINT)")
+    with op.batch_alter_table(table) as batch:
+        batch.drop_column(old)
+
+
+def restore(table, new, old, currency="currency"):
+    op.add_column(table, sa.Column(old, sa.Float(), nullable=True))
+    op.execute(f"UPDATE {table} SET {old} = CAST({new} AS FLOAT) / {minor_unit(currency)}")
+    with op.batch_alter_table(table) as batch:
+        batch.drop_column(new)
+
+
+def upgrade():
+    convert("treatment_prices", "price", "price_minor")
+    convert("payments", "amount", "amount_minor")
+    # base_price now divides by the currency's minor unit, the stored values stay the same.
+    op.add_column("fx_rates", sa.Column("minor_unit", sa.Integer(), server_default="100", nullable=False))
+    op.execute(f"UPDATE fx_rates SET minor_unit = {minor_unit('currency')}")
+
+
+def downgrade():
+    with op.batch_alter_table("fx_rates") as batch:
+        batch.drop_column("minor_unit")
+    restore("payments", "amount_minor", "amount")
+    restore("treatment_prices", "price_minor", "price")
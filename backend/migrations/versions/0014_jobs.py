@@ -0,0 +1,35 @@
+"""durable background job queue
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0014"
+down_revision = "0013"
+branch_labels = None
+depends_on = None
+
+PENDING = sa.text("status = 'pending'")
+
+
+def upgrade():
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("args", sa.Text(), nullable=False),
+        sa.Column("status", sa.String(), server_default="pending", nullable=False),
+        sa.Column("attempts", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("run_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("error", sa.Text(), nullable=True),
+    )
+    op.create_index("ix_jobs_pending_run_at", "jobs", ["run_at"], postgresql_where=PENDING, sqlite_where=PENDING)
+
+
+def downgrade():
+    op.drop_index("ix_jobs_pending_run_at", table_name="jobs")
+    op.drop_table("jobs")
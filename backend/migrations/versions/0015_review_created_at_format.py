@@ -0,0 +1,24 @@
+"""store review timestamps in one format on SQLite
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0015"
+down_revision = "0014"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Reviews created through CURRENT_TIMESTAMP lack the microseconds of the values SQLAlchemy binds, which breaks the
+    # text comparison of the review pagination cursor. Postgres stores real timestamps.
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    op.execute("UPDATE reviews SET created_at = created_at || '.000000' WHERE length(created_at) = 19")
+
+
+def downgrade():
+    pass
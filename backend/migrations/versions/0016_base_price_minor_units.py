@@ -0,0 +1,46 @@
+"""treatment prices in the base currency as integer minor units
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+import os
+
+revision = "0016"
+down_revision = "0015"
+branch_labels = None
+depends_on = None
+
+# ISO 4217 exponents other than 2, as in money.py at this revision.
+ZERO_DECIMAL = ("BIF", "CLP", "DJF", "GNF", "ISK", "JPY", "KMF", "KRW", "PYG", "RWF", "UGX", "UYI", "VND", "VUV", "XAF", "XOF", "XPF")
+THREE_DECIMAL = ("BHD", "IQD", "JOD", "KWD", "LYD", "OMR", "TND")
+
+
+def base_minor_unit():
+    # base_price is in BASE_CURRENCY (prices.py), the same setting the app converts with.
+    currency = os.getenv("BASE_CURRENCY", "USD").upper()
+    return 1 if currency in ZERO_DECIMAL else 1000 if currency in THREE_DECIMAL else 100
+
+
+def upgrade():
+    unit = base_minor_unit()
+    op.add_column("treatment_prices", sa.Column("base_price_minor", sa.BigInteger(), nullable=True))
+    op.execute(f"UPDATE treatment_prices SET base_price_minor = CAST(ROUND(base_price * {unit}) AS BIGINT)")
+    op.create_index(
+        "ix_treatment_prices_treatment_id_base_price_minor", "treatment_prices", ["treatment_id", "base_price_minor", "id"]
+    )
+    op.drop_index("ix_treatment_prices_treatment_id_base_price", table_name="treatment_prices")
+    with op.batch_alter_table("treatment_prices") as batch:
+        batch.drop_column("base_price")
+
+
+def downgrade():
+    unit = base_minor_unit()
+    op.add_column("treatment_prices", sa.Column("base_price", sa.Float(), nullable=True))
+    op.execute(f"UPDATE treatment_prices SET base_price = CAST(base_price_minor AS FLOAT) / {unit}")
+    op.create_index("ix_treatment_prices_treatment_id_base_price", "treatment_prices", ["treatment_id", "base_price", "id"])
+    op.drop_index("ix_treatment_prices_treatment_id_base_price_minor", table_name="treatment_prices")
+    with op.batch_alter_table("treatment_prices") as batch:
+        batch.drop_column("base_price_minor")
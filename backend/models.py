@@ -1,8 +1,10 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Table, Text, DateTime, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Boolean, ForeignKey, Table, Text, DateTime, Time, Enum, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from datetime import datetime, timezone
 import enum
 from database import Base
+from money import from_minor
 
 # Enums
 class UserRole(str, enum.Enum):
@@ -27,14 +29,16 @@ provider_specialties = Table(
     "provider_specialties",
     Base.metadata,
     Column("provider_id", Integer, ForeignKey("providers.id"), primary_key=True),
-    Column("specialty_id", Integer, ForeignKey("specialties.id"), primary_key=True)
+    Column("specialty_id", Integer, ForeignKey("specialties.id"), primary_key=True),
+    Index("ix_provider_specialties_specialty_id", "specialty_id")  # Reverse lookups (specialty filter, Specialty.providers).
 )
 
 provider_treatments = Table(
     "provider_treatments",
     Base.metadata,
     Column("provider_id", Integer, ForeignKey("providers.id"), primary_key=True),
-    Column("treatment_id", Integer, ForeignKey("treatments.id"), primary_key=True)
+    Column("treatment_id", Integer, ForeignKey("treatments.id"), primary_key=True),
+    Index("ix_provider_treatments_treatment_id", "treatment_id")  # Reverse lookups (treatment filter, Treatment.providers).
 )
 
 # Models
@@ -76,13 +80,50 @@ class Provider(Base):
     total_reviews = Column(Integer, default=0)
     featured = Column(Boolean, default=False)
 
+    # Running review score sums/counts, updated incrementally on every review write (see reviews.update_provider_rating).
+    # Sub-scores are optional on a review so each keeps its own count.
+    rating_sum = Column(Integer, default=0, server_default="0", nullable=False)
+    site_quality_sum = Column(Integer, default=0, server_default="0", nullable=False)
+    site_quality_count = Column(Integer, default=0, server_default="0", nullable=False)
+    transportation_sum = Column(Integer, default=0, server_default="0", nullable=False)
+    transportation_count = Column(Integer, default=0, server_default="0", nullable=False)
+    accommodation_sum = Column(Integer, default=0, server_default="0", nullable=False)
+    accommodation_count = Column(Integer, default=0, server_default="0", nullable=False)
+
+    # Booking settings, see availability.py. Working hours are in the provider's time zone.
+    timezone = Column(String, default="UTC", server_default="UTC", nullable=False)
+    slot_minutes = Column(Integer, default=60, server_default="60", nullable=False)  # Offered appointment start interval.
+    slot_capacity = Column(Integer, default=1, server_default="1", nullable=False)  # Appointments at the same time.
+
+    # Coordinates given by the provider or geocoded from city and country, and their geohash (see geo.py).
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String(12), nullable=True, index=True)
+
+    __table_args__ = (
+        Index("ix_providers_average_rating_id", "average_rating", "id"),  # Keyset pagination order.
+    )
+
     # Relationships
     user = relationship("User", back_populates="provider")
     treatments = relationship("Treatment", secondary=provider_treatments, back_populates="providers")
+    treatment_prices = relationship("TreatmentPrice", back_populates="provider", order_by="TreatmentPrice.id")
     specialties = relationship("Specialty", secondary=provider_specialties, back_populates="providers")
     reviews = relationship("Review", back_populates="provider")
     bookings = relationship("Booking", back_populates="provider")
 
+    @property
+    def average_site_quality(self):
+        return self.site_quality_sum / self.site_quality_count if self.site_quality_count else None
+
+    @property
+    def average_transportation(self):
+        return self.transportation_sum / self.transportation_count if self.transportation_count else None
+
+    @property
+    def average_accommodation(self):
+        return self.accommodation_sum / self.accommodation_count if self.accommodation_count else None
+
 class Specialty(Base):
     __tablename__ = "specialties"
 
@@ -113,13 +154,33 @@ class TreatmentPrice(Base):
     id = Column(Integer, primary_key=True, index=True)
     provider_id = Column(Integer, ForeignKey("providers.id"))
     treatment_id = Column(Integer, ForeignKey("treatments.id"))
-    price = Column(Float)
+    price_minor = Column(BigInteger)  # In the currency's minor unit, see money.py.
     currency = Column(String, default="USD")
     description = Column(Text, nullable=True)
+    # price in the base currency's minor unit (see prices.py), NULL without an FX rate. An integer like price_minor,
+    # so equal prices compare equal and sort and average the same on every database.
+    base_price_minor = Column(BigInteger, nullable=True)
+
+    __table_args__ = (
+        Index("ix_treatment_prices_provider_id_treatment_id", "provider_id", "treatment_id"),
+        Index("ix_treatment_prices_treatment_id_base_price_minor", "treatment_id", "base_price_minor", "id"),  # Cheapest first.
+    )
 
     # Relationships
     treatment = relationship("Treatment", back_populates="treatment_prices")
-    provider = relationship("Provider")
+    provider = relationship("Provider", back_populates="treatment_prices")
+
+    @property
+    def price(self):
+        return from_minor(self.price_minor, self.currency)
+
+class FxRate(Base):
+    __tablename__ = "fx_rates"
+
+    currency = Column(String(3), primary_key=True)
+    rate = Column(Float, nullable=False)  # Value of one unit in the base currency.
+    minor_unit = Column(Integer, default=100, server_default="100", nullable=False)  # Minor units per unit (100 cents).
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class Review(Base):
     __tablename__ = "reviews"
@@ -130,13 +191,21 @@ class Review(Base):
     rating = Column(Integer)  # 1-5 stars
     comment = Column(Text, nullable=True)
     treatment_received = Column(String, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set here rather than by the database: a keyset cursor (pagination.py) compares against it, and SQLite stores
+    # CURRENT_TIMESTAMP without the microseconds its bound values have, so the cursor row would sort before itself.
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     verified_booking = Column(Boolean, default=False)
     site_quality = Column(Integer, nullable=True)
     transportation = Column(Integer, nullable=True)
     accommodation = Column(Integer, nullable=True)
 
+    __table_args__ = (
+        Index("ix_reviews_provider_id_created_at_id", "provider_id", "created_at", "id"),  # Keyset pagination order.
+        Index("ix_reviews_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_reviews_user_id_provider_id_treatment_received", "user_id", "provider_id", "treatment_received"),  # Duplicate review check.
+    )
+
     # Relationships
     user = relationship("User", back_populates="reviews")
     provider = relationship("Provider", back_populates="reviews")
@@ -154,6 +223,20 @@ class Booking(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    __table_args__ = (
+        Index("ix_bookings_user_id_appointment_date_id", "user_id", "appointment_date", "id"),  # Keyset pagination order.
+        Index("ix_bookings_provider_id_appointment_date_id", "provider_id", "appointment_date", "id"),
+        Index("ix_bookings_user_id_status_appointment_date", "user_id", "status", "appointment_date"),
+        Index("ix_bookings_provider_id_status", "provider_id", "status"),
+        Index("ix_bookings_treatment_price_id", "treatment_price_id"),  # "Is this price referenced by a booking" checks.
+        # Completed bookings are looked up per (user, provider) to verify reviews.
+        Index(
+            "ix_bookings_completed_user_id_provider_id", "user_id", "provider_id",
+            postgresql_where=text("status = 'COMPLETED'"),
+            sqlite_where=text("status = 'COMPLETED'"),
+        ),
+    )
+
     # Relationships
     user = relationship("User", back_populates="bookings")
     provider = relationship("Provider", back_populates="bookings")
@@ -165,12 +248,120 @@ class Payment(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     booking_id = Column(Integer, ForeignKey("bookings.id"), unique=True)
-    amount = Column(Float)
+    amount_minor = Column(BigInteger)  # In the currency's minor unit, what Stripe charged.
     currency = Column(String, default="USD")
     status = Column(Enum(PaymentStatus), default=PaymentStatus.PENDING)
     stripe_payment_intent_id = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    __table_args__ = (
+        Index("ix_payments_stripe_payment_intent_id", "stripe_payment_intent_id"),  # Webhook events name the intent.
+        Index("ix_payments_created_at", "created_at"),  # Date range exports for finance.
+    )
+
     # Relationships
     booking = relationship("Booking", back_populates="payment")
+
+    @property
+    def amount(self):
+        return from_minor(self.amount_minor, self.currency)
+
+class ProviderWorkingHours(Base):
+    # Weekly opening hours, one interval per weekday (0 = Monday) in the provider's time zone.
+    __tablename__ = "provider_working_hours"
+
+    provider_id = Column(Integer, ForeignKey("providers.id"), primary_key=True)
+    weekday = Column(Integer, primary_key=True)
+    opens_at = Column(Time, nullable=False)
+    closes_at = Column(Time, nullable=False)
+
+class BookingSlot(Base):
+    # Slot index: one row per (provider, 15 minute unit, seat) a booking occupies, written in the booking's
+    # transaction. The primary key rejects a second booking on a taken seat, so overlapping bookings cannot both
+    # commit, and it serves the per provider time range lookups of conflict checks and availability.
+    __tablename__ = "booking_slots"
+
+    provider_id = Column(Integer, ForeignKey("providers.id"), primary_key=True)
+    slot_start = Column(DateTime(timezone=True), primary_key=True)  # UTC
+    seat = Column(Integer, primary_key=True)  # 0 .. provider.slot_capacity - 1
+    booking_id = Column(Integer, ForeignKey("bookings.id"), nullable=False)
+
+    __table_args__ = (
+        Index("ix_booking_slots_booking_id", "booking_id"),  # Releasing a booking's slots.
+    )
+
+class StripeEvent(Base):
+    # Inbox of received Stripe webhook events, stored as sent and applied later by stripe_events.py.
+    # The Stripe event id is the primary key, so redelivered events are stored (and applied) once.
+    __tablename__ = "stripe_events"
+
+    id = Column(String, primary_key=True)
+    type = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    created = Column(Integer, nullable=False)  # Stripe's creation time (unix seconds), events are applied in this order.
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    error = Column(Text, nullable=True)  # Set when the event could not be applied.
+
+    __table_args__ = (
+        Index(
+            "ix_stripe_events_pending_created", "created",
+            postgresql_where=text("processed_at IS NULL"),
+            sqlite_where=text("processed_at IS NULL"),
+        ),
+    )
+
+class ProviderFacet(Base):
+    # Facet values of each provider (country, city, specialty, treatment, rating bucket) for search filters and
+    # facet counts. Kept up to date per provider by facets.refresh_provider_facets.
+    __tablename__ = "provider_facets"
+
+    facet = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    provider_id = Column(Integer, ForeignKey("providers.id"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_provider_facets_provider_id", "provider_id"),  # Refreshing and counting a set of providers.
+    )
+
+class TreatmentLeaderboard(Base):
+    # Precomputed homepage leaderboard, one row per (treatment, provider) pair with reviews.
+    # Kept up to date per provider by leaderboard.refresh_provider_leaderboard.
+    __tablename__ = "treatment_leaderboard"
+
+    treatment_id = Column(Integer, ForeignKey("treatments.id"), primary_key=True)
+    provider_id = Column(Integer, ForeignKey("providers.id"), primary_key=True)
+    treatment_name = Column(String)
+    treatment_category = Column(String)
+    provider_name = Column(String)
+    average_rating = Column(Float)
+    review_count = Column(Integer)
+    review_snippet = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_treatment_leaderboard_rank", "average_rating", "review_count"),
+        Index("ix_treatment_leaderboard_provider_id", "provider_id"),
+    )
+
+class Job(Base):
+    # Durable background job queue (JOB_QUEUE=database), see jobs.py. Done jobs are deleted, dead ones (out of
+    # attempts) are kept with their last error.
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    args = Column(Text, nullable=False)  # JSON keyword arguments of the handler.
+    status = Column(String, default="pending", server_default="pending", nullable=False)  # "pending" or "dead".
+    attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    run_at = Column(DateTime(timezone=True), nullable=False)  # Not before; for a claimed job, when its claim expires.
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_jobs_pending_run_at", "run_at",
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+    )
@@ -0,0 +1,35 @@
+"""Exact money amounts.
+
+Prices and payments are stored as integers in the currency's minor unit (cents, or yen for JPY), the same integers
+Stripe expects, so storing, summing and charging an amount never goes through a float. The API and exports show them
+as decimals, converted with the currency's ISO 4217 exponent below.
+"""
+from decimal import Decimal
+
+DEFAULT_EXPONENT = 2
+CURRENCY_EXPONENTS = {
+    **{currency: 0 for currency in (
+        "BIF", "CLP", "DJF", "GNF", "ISK", "JPY", "KMF", "KRW", "PYG", "RWF", "UGX", "UYI", "VND", "VUV", "XAF",
+        "XOF", "XPF",
+    )},
+    **{currency: 3 for currency in ("BHD", "IQD", "JOD", "KWD", "LYD", "OMR", "TND")},
+}
+
+def currency_exponent(currency: str):
+    # Digits after the decimal point: 2 for USD, 0 for JPY, 3 for KWD.
+    return CURRENCY_EXPONENTS.get((currency or "").strip().upper(), DEFAULT_EXPONENT)
+
+def to_minor(amount, currency: str):
+    """Decimal (or int/str/float) amount as an int of minor units. ValueError when the amount has more decimal places
+    than the currency allows, it is never rounded."""
+    # str() first: Decimal(19.99) would be the float's binary expansion, Decimal("19.99") is what was written.
+    amount = amount if isinstance(amount, Decimal) else Decimal(str(amount))
+    minor = amount.scaleb(currency_exponent(currency))
+    if minor != minor.to_integral_value():
+        raise ValueError(f"{amount} {currency} has more than {currency_exponent(currency)} decimal places")
+    return int(minor)
+
+def from_minor(minor: int, currency: str):
+    if minor is None:
+        return None
+    return Decimal(minor).scaleb(-currency_exponent(currency))
@@ -0,0 +1,54 @@
+from fastapi import HTTPException, Response, status
+from sqlalchemy import tuple_, literal
+from datetime import datetime
+import base64
+import json
+
+# Listing endpoints keep returning plain lists, the cursor for the next page travels in this header.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(values):
+    payload = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor does not match the listing keys")
+        return [
+            datetime.fromisoformat(value) if column.type.python_type is datetime and value is not None else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+def keyset_paginate(query, columns, cursor: str = None, descending: bool = False):
+    """Order a select by the given (indexed) key columns and, with a cursor, start right after the row it points to.
+
+    All columns sort in the same direction so the whole key can be compared as one row value, which
+    Postgres resolves with a single index range scan instead of skipping rows like OFFSET does.
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        key = tuple_(*columns)
+        boundary = tuple_(*[literal(value, column.type) for column, value in zip(columns, values)])
+        query = query.where(key < boundary if descending else key > boundary)
+    return query.order_by(*[column.desc() if descending else column for column in columns])
+
+def next_cursor(rows, columns, limit: int):
+    # A short page means there is nothing left to fetch.
+    if limit and len(rows) == limit:
+        last = rows[-1]
+        return encode_cursor([getattr(last, column.key) for column in columns])
+    return None
+
+def set_next_cursor(response: Response, rows, columns, limit: int):
+    set_cursor_header(response, next_cursor(rows, columns, limit))
+
+def set_cursor_header(response: Response, cursor: str):
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
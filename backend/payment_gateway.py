@@ -0,0 +1,83 @@
+from dotenv import load_dotenv
+import httpx
+import os
+import stripe
+
+load_dotenv()
+
+# Stripe is called through its async HTTPX client so a slow Stripe response only delays the checkout request that
+# waits for it, not the whole worker. Network errors and 409/429/5xx responses are retried by the Stripe library
+# (exponential backoff with jitter, same idempotency key on every attempt).
+STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
+STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", "3"))
+STRIPE_READ_TIMEOUT = float(os.getenv("STRIPE_READ_TIMEOUT", "10"))
+STRIPE_MAX_RETRIES = int(os.getenv("STRIPE_MAX_RETRIES", "2"))
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE")  # e.g. http://localhost:12111 to run against stripe-mock
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")  # Signing secret of the webhook endpoint (whsec_...)
+
+# PaymentIntents in these states can still be paid, so they are handed out again instead of creating another one.
+REUSABLE_INTENT_STATUSES = {"requires_payment_method", "requires_confirmation", "requires_action", "processing"}
+# PaymentIntents in these states can be cancelled. One replaced by an intent for a new amount is, so a client still
+# holding its client_secret cannot pay the old amount.
+CANCELABLE_INTENT_STATUSES = {"requires_payment_method", "requires_confirmation", "requires_action", "requires_capture"}
+
+class PaymentInProgress(Exception):
+    """The existing PaymentIntent is being processed for another amount, it can neither be reused nor cancelled."""
+
+def create_stripe_client(api_key: str = STRIPE_SECRET_KEY, api_base: str = STRIPE_API_BASE):
+    http_client = stripe.HTTPXClient(timeout=httpx.Timeout(STRIPE_READ_TIMEOUT, connect=STRIPE_CONNECT_TIMEOUT))
+    return stripe.StripeClient(
+        api_key,
+        http_client=http_client,
+        max_network_retries=STRIPE_MAX_RETRIES,
+        base_addresses={"api": api_base} if api_base else None,
+    )
+
+def payment_intent_idempotency_key(booking_id: int, amount_minor: int, currency: str, previous_intent_id: str = None):
+    # Retries and double submits of the same checkout get the same PaymentIntent back from Stripe. A changed amount,
+    # or replacing an intent that can no longer be paid, needs a new key.
+    return f"booking-{booking_id}-intent-{amount_minor}-{currency.lower()}-{previous_intent_id or 'first'}"
+
+class PaymentGateway:
+    def __init__(self, api_key: str = STRIPE_SECRET_KEY, api_base: str = STRIPE_API_BASE):
+        self.api_key = api_key
+        self.api_base = api_base
+        self._client = None
+
+    @property
+    def configured(self):
+        return bool(self.api_key)
+
+    @property
+    def payment_intents(self):
+        if self._client is None:
+            self._client = create_stripe_client(self.api_key, self.api_base)
+        # Newer stripe versions moved the services under client.v1.
+        return getattr(self._client, "v1", self._client).payment_intents
+
+    async def retrieve_intent(self, intent_id: str):
+        return await self.payment_intents.retrieve_async(intent_id)
+
+    async def create_intent(self, amount_minor: int, currency: str, metadata: dict, idempotency_key: str):
+        return await self.payment_intents.create_async(
+            params={"amount": amount_minor, "currency": currency, "metadata": metadata},
+            options={"idempotency_key": idempotency_key},
+        )
+
+    async def cancel_intent(self, intent_id: str):
+        return await self.payment_intents.cancel_async(intent_id, options={"idempotency_key": f"cancel-{intent_id}"})
+
+    async def reusable_intent(self, intent_id: str, amount_minor: int, currency: str):
+        """The existing PaymentIntent if it can still be paid for this amount, otherwise None. An intent that could
+        still be paid for another amount is cancelled first (PaymentInProgress when that is too late)."""
+        intent = await self.retrieve_intent(intent_id)
+        same_amount = intent.amount == amount_minor and intent.currency.lower() == currency.lower()
+        if intent.status in REUSABLE_INTENT_STATUSES and same_amount:
+            return intent
+        if intent.status in CANCELABLE_INTENT_STATUSES:
+            await self.cancel_intent(intent.id)
+        elif intent.status == "processing":
+            raise PaymentInProgress(intent.id)
+        return None
+
+gateway = PaymentGateway()
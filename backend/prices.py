@@ -0,0 +1,143 @@
+"""Treatment prices in one currency, for comparing providers (GET /treatments/{id}/prices).
+
+Every treatment price also stores base_price_minor, its amount converted to BASE_CURRENCY with the rate in fx_rates and
+rounded to the base currency's minor unit. The (treatment_id, base_price_minor) index returns a treatment's prices
+cheapest first from one range scan, with no conversion at read time. Prices in a currency fx_rates does not list have
+no base price and are left out.
+
+The rates are loaded from a local CSV (currency,rate: the value of one unit in BASE_CURRENCY) at startup when the
+table is empty. After editing the file, reload the rates and convert every price again:
+    poetry run python prices.py
+"""
+from sqlalchemy import select, insert, update, delete, func, cast, BigInteger
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, async_engine
+from models import FxRate, TreatmentPrice, Provider
+from money import currency_exponent, from_minor
+from decimal import Decimal, ROUND_FLOOR
+import asyncio
+import csv
+import os
+
+BASE_CURRENCY = os.getenv("BASE_CURRENCY", "USD").upper()
+BASE_MINOR_UNIT = 10 ** currency_exponent(BASE_CURRENCY)
+FX_RATES_PATH = os.getenv("FX_RATES_PATH", os.path.join(os.path.dirname(__file__), "data", "fx_rates.csv"))
+
+def read_rates(path: str = FX_RATES_PATH):
+    rates = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for line, row in enumerate(csv.DictReader(f), 2):
+            currency, rate = row["currency"].strip().upper(), float(row["rate"])
+            if rate <= 0:
+                raise ValueError(f"{path}:{line}: rate of {currency} must be positive")
+            rates[currency] = rate
+    if rates.setdefault(BASE_CURRENCY, 1.0) != 1.0:
+        raise ValueError(f"{path}: rate of the base currency {BASE_CURRENCY} must be 1")
+    return rates
+
+def base_price_minor():
+    # price * rate of its currency in base minor units, NULL when the currency has no rate. Prices are in minor units
+    # (money.py), the rate is a float: the product is rounded once, here, and stored as an integer.
+    rate = (
+        select(FxRate.rate * BASE_MINOR_UNIT / FxRate.minor_unit)
+        .where(FxRate.currency == func.upper(TreatmentPrice.currency))
+        .scalar_subquery()
+    )
+    return cast(func.round(TreatmentPrice.price_minor * rate), BigInteger)
+
+def to_base_minor(amount):
+    # A base currency amount as a bound on base_price_minor: base_price_minor <= to_base_minor(amount) is price <= amount.
+    return int(Decimal(str(amount)).scaleb(currency_exponent(BASE_CURRENCY)).to_integral_value(ROUND_FLOOR))
+
+def from_base_minor(minor):
+    return from_minor(minor, BASE_CURRENCY)
+
+async def refresh_base_prices(db: AsyncSession, price_ids=None):
+    """Convert some (or all) treatment prices again inside the caller's transaction. Call it after a price or its
+    currency changes."""
+    await db.flush()
+    query = update(TreatmentPrice).values(base_price_minor=base_price_minor())
+    if price_ids is not None:
+        query = query.where(TreatmentPrice.id.in_(price_ids))
+    # base_price_minor is not part of any response, loaded objects can keep the stale value.
+    await db.execute(query.execution_options(synchronize_session=False))
+
+async def load_fx_rates(db: AsyncSession, path: str = FX_RATES_PATH):
+    rates = read_rates(path)
+    await db.execute(delete(FxRate))
+    await db.execute(insert(FxRate), [
+        dict(currency=currency, rate=rate, minor_unit=10 ** currency_exponent(currency)) for currency, rate in rates.items()
+    ])
+    await refresh_base_prices(db)
+    await db.commit()
+    return len(rates)
+
+async def ensure_fx_rates():
+    # Startup: a new database gets the rates file's rates.
+    async with AsyncSessionLocal() as db:
+        if await db.scalar(select(func.count()).select_from(FxRate)) == 0:
+            await load_fx_rates(db)
+
+def comparable_prices(treatment_id: int, max_price: float = None):
+    # A treatment's prices that have a base price (within max_price): one range of the (treatment_id, base_price_minor)
+    # index.
+    conditions = [TreatmentPrice.treatment_id == treatment_id, TreatmentPrice.base_price_minor.isnot(None)]
+    if max_price is not None:
+        conditions.append(TreatmentPrice.base_price_minor <= to_base_minor(max_price))
+    return conditions
+
+async def price_index(db: AsyncSession, treatment_id: int, max_price: float = None, descending: bool = False,
+                      skip: int = 0, limit: int = 100):
+    """One page of a treatment's comparable prices, cheapest (or most expensive) first, with the provider fields the
+    comparison shows."""
+    order = (TreatmentPrice.base_price_minor, TreatmentPrice.id)
+    if descending:
+        order = [column.desc() for column in order]  # The same index, scanned backwards.
+    query = (
+        select(
+            TreatmentPrice.id.label("treatment_price_id"),
+            TreatmentPrice.provider_id,
+            Provider.name.label("provider_name"),
+            Provider.city,
+            Provider.country,
+            TreatmentPrice.price_minor,
+            TreatmentPrice.currency,
+            TreatmentPrice.base_price_minor,
+        )
+        .join(Provider, Provider.id == TreatmentPrice.provider_id)
+        .where(*comparable_prices(treatment_id, max_price))
+        .order_by(*order)
+        .offset(skip)
+        .limit(limit)
+    )
+    return (await db.execute(query)).all()
+
+async def price_statistics(db: AsyncSession, treatment_id: int, max_price: float = None):
+    """count, min, median and max of all of a treatment's comparable prices (not just a page), computed by the
+    database. Amounts are decimals of the base currency."""
+    conditions = comparable_prices(treatment_id, max_price)
+    column = TreatmentPrice.base_price_minor
+    columns = [func.count(), func.min(column), func.max(column)]
+    postgres = async_engine.dialect.name == "postgresql"
+    if postgres:
+        columns.append(func.percentile_cont(0.5).within_group(column))
+    count, low, high, *median = (await db.execute(select(*columns).where(*conditions))).one()
+    if not count:
+        return dict(count=0, min=None, median=None, max=None)
+    if postgres:
+        median = median[0]  # A float, exact: the mean of two integers.
+    else:
+        # SQLite has no percentile_cont: the middle one or two prices, read from the index.
+        middle = (await db.scalars(
+            select(column).where(*conditions).order_by(column).offset((count - 1) // 2).limit(2 - count % 2)
+        )).all()
+        median = Decimal(sum(middle)) / len(middle)
+    return dict(count=count, min=from_base_minor(low), median=from_base_minor(median), max=from_base_minor(high))
+
+async def main():
+    async with AsyncSessionLocal() as db:
+        count = await load_fx_rates(db)
+    print(f"Loaded {count} exchange rates, treatment prices converted to {BASE_CURRENCY}.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
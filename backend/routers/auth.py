@@ -1,13 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from dataclasses import dataclass, fields
 from datetime import datetime, timedelta
 from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
-from models import User
+from models import User, UserRole
+from cache import cache, user_key, AUTH_CACHE_TTL
 from schemas import UserCreate, UserResponse, Token, TokenData
+import asyncio
 import os
 
 router = APIRouter(
@@ -21,9 +26,26 @@ SECRET_KEY = os.getenv("SECRET_KEY", "yoursecretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor. Hashes made with another cost are flagged as outdated and rehashed on the next login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt is CPU bound (~100-300 ms at cost 12), it runs on its own small thread pool (the bcrypt library releases
+# the GIL while hashing). Beyond the workers at most PASSWORD_HASH_QUEUE jobs wait, further requests get a 503
+# instead of piling up behind a login storm.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "16"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_desired_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_desired_rounds=BCRYPT_ROUNDS,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+password_jobs = 0  # Running and waiting jobs, only touched from the event loop.
+
 # Helper functions
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -31,12 +53,34 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(User).filter(User.username == username).first()
+async def run_password_job(func, *args):
+    global password_jobs
+    if password_jobs >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again",
+            headers={"Retry-After": "1"},
+        )
+    password_jobs += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, func, *args)
+    finally:
+        password_jobs -= 1
+
+async def hash_password(password: str):
+    return await run_password_job(get_password_hash, password)
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await db.scalar(select(User).where(User.username == username))
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = await run_password_job(pwd_context.verify_and_update, password, user.hashed_password)
+    if not verified:
         return False
+    if new_hash:
+        # BCRYPT_ROUNDS changed since this password was hashed.
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -49,7 +93,45 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)): # Decode the access token and and return the current user (see auth/me).
+# Every authenticated request needs the user, so a snapshot of it is cached (AUTH_CACHE_TTL) instead of
+# queried each time. users.update_user and anything else that changes a user calls cache.invalidate_user.
+@dataclass(frozen=True)
+class CurrentUser:
+    """The user get_current_user returns: the columns of the row minus the password hash, no relationships and no
+    session. Read only, an endpoint that changes the user or needs more of it loads the row with db.get(User, id)."""
+    id: int
+    email: str
+    username: str
+    full_name: Optional[str]
+    role: Optional[UserRole]
+    created_at: Optional[datetime]
+    is_active: bool
+    stripe_customer_id: Optional[str]
+
+def user_snapshot(user: User):
+    snapshot = {field.name: getattr(user, field.name) for field in fields(CurrentUser)}
+    snapshot["role"] = user.role.value if user.role else None
+    snapshot["created_at"] = user.created_at.isoformat() if user.created_at else None
+    return snapshot
+
+def user_from_snapshot(snapshot: dict):
+    return CurrentUser(**{
+        **snapshot,
+        "role": UserRole(snapshot["role"]) if snapshot["role"] else None,
+        "created_at": datetime.fromisoformat(snapshot["created_at"]) if snapshot["created_at"] else None,
+    })
+
+async def load_current_user(db: AsyncSession, user_id: int):
+    snapshot = await cache.get(user_key(user_id))
+    if snapshot is None:
+        user = await db.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = user_snapshot(user)
+        await cache.set(user_key(user_id), snapshot, ttl=AUTH_CACHE_TTL)
+    return user_from_snapshot(snapshot)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)): # Decode the access token and and return the current user (see auth/me).
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -63,31 +145,31 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = TokenData(user_id=int(user_id))
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.id == token_data.user_id).first()
+    user = await load_current_user(db, token_data.user_id)
     if user is None:
         raise credentials_exception
     return user
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)):
+async def get_current_active_user(current_user: CurrentUser = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
 @router.post("/register", response_model=UserResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     print(f"Received registration request for user: {user.username}")
     try:
-        db_user = db.query(User).filter(User.email == user.email).first()
+        db_user = await db.scalar(select(User).where(User.email == user.email))
         if db_user:
             print(f"Email {user.email} already registered")
             raise HTTPException(status_code=400, detail="Email already registered")
 
-        db_username = db.query(User).filter(User.username == user.username).first()
+        db_username = await db.scalar(select(User).where(User.username == user.username))
         if db_username:
             print(f"Username {user.username} already taken")
             raise HTTPException(status_code=400, detail="Username already taken")
 
-        hashed_password = get_password_hash(user.password)
+        hashed_password = await hash_password(user.password)
         db_user = User(
             email=user.email,
             username=user.username,
@@ -96,17 +178,19 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
             role=user.role
         )
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         return db_user
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"An error occurred during registration: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
 @router.post("/token", response_model=Token) # Responsible for incoming login requests to give access to auth/me below and display user info.
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -120,5 +204,5 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=UserResponse)
-async def read_users_me(current_user: User = Depends(get_current_active_user)):
+async def read_users_me(current_user: CurrentUser = Depends(get_current_active_user)):
     return current_user
\ No newline at end of file
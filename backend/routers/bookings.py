@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
 from datetime import datetime, timedelta, timezone
 from database import get_db
-from models import Booking, TreatmentPrice, Provider, UserRole, BookingStatus, User
-from schemas import BookingCreate, BookingResponse, BookingUpdate, ProviderResponse, TreatmentPriceResponse, UserResponse
-from .auth import get_current_active_user
+from models import Booking, TreatmentPrice, Provider, UserRole, BookingStatus
+from schemas import BookingCreate, BookingResponse, BookingUpdate
+from pagination import keyset_paginate, set_next_cursor
+from jobs import enqueue
+from serialization import orm_response, orm_list_response
+from availability import claim_slots, claim_booking_slots, release_slots, treatment_duration, as_utc, ACTIVE_STATUSES
+from .auth import get_current_active_user, CurrentUser
 
 router = APIRouter(
     prefix="/bookings",
@@ -13,14 +19,37 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# Everything BookingResponse serializes, loaded up front since async sessions cannot lazy load.
+booking_response_options = (
+    selectinload(Booking.user),
+    selectinload(Booking.provider).selectinload(Provider.specialties),
+    selectinload(Booking.provider).selectinload(Provider.treatments),
+    selectinload(Booking.treatment_price).selectinload(TreatmentPrice.treatment),
+)
+
+# Nested objects that repeat across a booking list (one provider for all of a provider's bookings, one user for all
+# of a user's), serialized once per list.
+booking_shared_fields = ("provider", "treatment_price", "user")
+
+# Upcoming appointments first. Listings are unbounded unless a limit is given.
+booking_page_keys = (Booking.appointment_date, Booking.id)
+
+async def load_booking(db: AsyncSession, booking_id: int):
+    return await db.scalar(
+        select(Booking)
+        .options(*booking_response_options)
+        .where(Booking.id == booking_id)
+        .execution_options(populate_existing=True)
+    )
+
 @router.post("/", response_model=BookingResponse, status_code=status.HTTP_201_CREATED)
-def create_booking(
+async def create_booking(
     booking: BookingCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Check if provider exists
-    provider = db.query(Provider).filter(Provider.id == booking.provider_id).first()
+    provider = await db.get(Provider, booking.provider_id)
     if not provider:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -28,10 +57,10 @@ def create_booking(
         )
     
     # Check if treatment price exists
-    treatment_price = db.query(TreatmentPrice).filter(
+    treatment_price = await db.scalar(select(TreatmentPrice).where(
         TreatmentPrice.id == booking.treatment_price_id,
         TreatmentPrice.provider_id == booking.provider_id
-    ).first()
+    ))
     
     if not treatment_price:
         raise HTTPException(
@@ -56,98 +85,73 @@ def create_booking(
     )
     
     db.add(db_booking)
-    db.commit()
-    db.refresh(db_booking)
+    await db.flush()
+    # Claim the time in the slot index, committed together with the booking (409 if it is taken).
+    duration = await treatment_duration(db, provider, booking.treatment_price_id)
+    await claim_slots(db, provider, db_booking.id, booking.appointment_date, duration)
+    enqueue(db, "booking_status_changed", booking_id=db_booking.id, status=BookingStatus.PENDING.value)
+    await db.commit()
     
-    return db_booking
+    return await load_booking(db, db_booking.id)
 
 @router.get("/", response_model=List[BookingResponse])
-def get_user_bookings(
+async def get_user_bookings(
+    response: Response,
     booking_status: BookingStatus = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Get bookings for current user
-    query = db.query(Booking).options(
-        joinedload(Booking.user),  # include user
-        joinedload(Booking.provider),
-        joinedload(Booking.treatment_price).joinedload(TreatmentPrice.treatment)
-    ).filter(Booking.user_id == current_user.id)
+    query = select(Booking).options(*booking_response_options).where(Booking.user_id == current_user.id)
     
     if booking_status:
-        query = query.filter(Booking.status == booking_status)
+        query = query.where(Booking.status == booking_status)
     
-    bookings = query.order_by(Booking.appointment_date).all()
-    return bookings
+    query = keyset_paginate(query, booking_page_keys, cursor)
+    bookings = (await db.scalars(query.limit(limit))).all()
+    set_next_cursor(response, bookings, booking_page_keys, limit)
+    return orm_list_response(BookingResponse, bookings, response, shared=booking_shared_fields)
 
 @router.get("/provider", response_model=List[BookingResponse])
-def get_provider_bookings(
+async def get_provider_bookings(
+    response: Response,
     booking_status: BookingStatus = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Get provider for current user
-    provider = db.query(Provider).filter(Provider.user_id == current_user.id).first()
+    provider_id = await db.scalar(select(Provider.id).where(Provider.user_id == current_user.id))
     
-    if not provider:
+    if not provider_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User is not a provider"
         )
     
-    # Collect treatment_prices from all treatments associated with the provider.
-    treatment_prices = []
-    for treatment in provider.treatments:
-        for price in treatment.treatment_prices:
-            if price.provider_id == provider.id:
-                treatment_prices.append(price)
-    
-    # Get bookings for provider
-    query = db.query(Booking).options(
-        joinedload(Booking.user),  # include user
-        joinedload(Booking.provider),
-        joinedload(Booking.treatment_price).joinedload(TreatmentPrice.treatment)
-    ).filter(Booking.provider_id == provider.id)
+    # Get bookings for provider. Related rows come from one selectin query per relationship, whatever the page size.
+    query = select(Booking).options(*booking_response_options).where(Booking.provider_id == provider_id)
     
     if booking_status:
-        query = query.filter(Booking.status == booking_status)
+        query = query.where(Booking.status == booking_status)
     
-    bookings = query.order_by(Booking.appointment_date).all()
-
-    # Manually build the response (since it includes nested lists, this is necessary (same as @router.get("/{provider_id} route)).
-    result = []
-    for booking in bookings:
-        # Fetch the provider and treatment_price for the current booking
-        provider_response = ProviderResponse.from_orm(booking.provider)
-        treatment_price_response = TreatmentPriceResponse.from_orm(booking.treatment_price)
-        user_response = UserResponse.from_orm(booking.user) 
-
-        result.append(BookingResponse(
-            id=booking.id,
-            user_id=booking.user_id,
-            provider_id=booking.provider_id,
-            treatment_price_id=booking.treatment_price_id,
-            appointment_date=booking.appointment_date,
-            special_requests=booking.special_requests,
-            status=booking.status,
-            created_at=booking.created_at,
-            updated_at=booking.updated_at,
-            provider=provider_response,
-            treatment_price=treatment_price_response,
-            user=user_response
-        ))
-
-    return result
+    query = keyset_paginate(query, booking_page_keys, cursor)
+    bookings = (await db.scalars(query.limit(limit))).all()
+    set_next_cursor(response, bookings, booking_page_keys, limit)
+    return orm_list_response(BookingResponse, bookings, response, shared=booking_shared_fields)
 
 
 @router.get("/{booking_id}", response_model=BookingResponse)
-def get_booking(
+async def get_booking(
     booking_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Get booking
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
+    booking = await load_booking(db, booking_id)
     
     if not booking:
         raise HTTPException(
@@ -156,7 +160,7 @@ def get_booking(
         )
     
     # Check if user is authorized to view this booking
-    provider = db.query(Provider).filter(Provider.user_id == current_user.id).first()
+    provider = await db.scalar(select(Provider).where(Provider.user_id == current_user.id))
     is_provider_of_booking = provider and provider.id == booking.provider_id
     
     if booking.user_id != current_user.id and not is_provider_of_booking and current_user.role != UserRole.ADMIN:
@@ -165,17 +169,17 @@ def get_booking(
             detail="Not authorized to view this booking"
         )
     
-    return booking
+    return orm_response(BookingResponse, booking)
 
 @router.put("/{booking_id}", response_model=BookingResponse)
-def update_booking(
+async def update_booking(
     booking_id: int,
     booking_update: BookingUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Get booking
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
+    booking = await db.get(Booking, booking_id)
     
     if not booking:
         raise HTTPException(
@@ -184,7 +188,7 @@ def update_booking(
         )
     
     # Check if user is authorized to update this booking
-    provider = db.query(Provider).filter(Provider.user_id == current_user.id).first()
+    provider = await db.scalar(select(Provider).where(Provider.user_id == current_user.id))
     is_provider_of_booking = provider and provider.id == booking.provider_id
     
     # Users can update their own bookings, providers can update status
@@ -207,7 +211,7 @@ def update_booking(
     
     # Validate appointment date if being updated
     if "appointment_date" in update_data:
-        if update_data["appointment_date"] < datetime.now() + timedelta(days=1):
+        if as_utc(update_data["appointment_date"]) < datetime.now(timezone.utc) + timedelta(days=1):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Appointment date must be at least 24 hours in the future"
@@ -221,22 +225,32 @@ def update_booking(
             )
     
     # Apply updates
+    held_slots = booking.status in ACTIVE_STATUSES
+    old_status = booking.status
     for key, value in update_data.items():
         setattr(booking, key, value)
     
-    db.commit()
-    db.refresh(booking)
+    # Keep the slot index in step: cancelled bookings free their time, a new time or a reactivated booking claims it.
+    holds_slots = booking.status in ACTIVE_STATUSES
+    if held_slots and (not holds_slots or "appointment_date" in update_data):
+        await release_slots(db, booking.id)
+    if holds_slots and (not held_slots or "appointment_date" in update_data):
+        await claim_booking_slots(db, booking.id, booking.provider_id, booking.treatment_price_id, booking.appointment_date)
+    if booking.status != old_status:
+        enqueue(db, "booking_status_changed", booking_id=booking.id, status=booking.status.value)
+    
+    await db.commit()
     
-    return booking
+    return await load_booking(db, booking.id)
 
 @router.delete("/{booking_id}", status_code=status.HTTP_204_NO_CONTENT)
-def cancel_booking(
+async def cancel_booking(
     booking_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Get booking
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
+    booking = await db.get(Booking, booking_id)
     
     if not booking:
         raise HTTPException(
@@ -258,8 +272,10 @@ def cancel_booking(
             detail=f"Cannot cancel booking with status {booking.status}"
         )
     
-    # Update booking status to cancelled
+    # Update booking status to cancelled, its time can be booked again
     booking.status = BookingStatus.CANCELLED
-    db.commit()
+    await release_slots(db, booking.id)
+    enqueue(db, "booking_status_changed", booking_id=booking.id, status=booking.status.value)
+    await db.commit()
     
     return None
@@ -0,0 +1,86 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from datetime import datetime
+from database import get_db
+from models import Provider, UserRole, BookingStatus, PaymentStatus
+from exports import (
+    export_rows, booking_export_query, review_export_query, payment_export_query,
+    BOOKING_COLUMNS, REVIEW_COLUMNS, PAYMENT_COLUMNS, EXPORT_FORMATS
+)
+from .auth import get_current_active_user, CurrentUser
+
+router = APIRouter(
+    prefix="/exports",
+    tags=["Exports"],
+    responses={404: {"description": "Not found"}},
+)
+
+FORMAT_PATTERN = "^(" + "|".join(EXPORT_FORMATS) + ")$"
+
+async def export_scope(db: AsyncSession, current_user: CurrentUser, provider_id: Optional[int]):
+    """The provider to export for: any (or all) for admin, otherwise the user's own provider."""
+    if current_user.role == UserRole.ADMIN:
+        return provider_id
+    own_provider_id = await db.scalar(select(Provider.id).where(Provider.user_id == current_user.id))
+    if not own_provider_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User is not a provider"
+        )
+    if provider_id is not None and provider_id != own_provider_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to export this provider's data"
+        )
+    return own_provider_id
+
+def export_response(name: str, query, columns: dict, format: str):
+    return StreamingResponse(
+        export_rows(query, columns, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{format}"'},
+    )
+
+@router.get("/bookings")
+async def export_bookings(
+    format: str = Query("ndjson", pattern=FORMAT_PATTERN),
+    from_: Optional[datetime] = Query(None, alias="from"),  # Appointment date range [from, to).
+    to: Optional[datetime] = None,
+    booking_status: Optional[BookingStatus] = None,
+    provider_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
+):
+    provider_id = await export_scope(db, current_user, provider_id)
+    query = booking_export_query(provider_id, booking_status, from_, to)
+    return export_response("bookings", query, BOOKING_COLUMNS, format)
+
+@router.get("/reviews")
+async def export_reviews(
+    format: str = Query("ndjson", pattern=FORMAT_PATTERN),
+    from_: Optional[datetime] = Query(None, alias="from"),  # Review date range [from, to).
+    to: Optional[datetime] = None,
+    provider_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
+):
+    provider_id = await export_scope(db, current_user, provider_id)
+    query = review_export_query(provider_id, from_, to)
+    return export_response("reviews", query, REVIEW_COLUMNS, format)
+
+@router.get("/payments")
+async def export_payments(
+    format: str = Query("ndjson", pattern=FORMAT_PATTERN),
+    from_: Optional[datetime] = Query(None, alias="from"),  # Payment creation date range [from, to).
+    to: Optional[datetime] = None,
+    payment_status: Optional[PaymentStatus] = None,
+    provider_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
+):
+    provider_id = await export_scope(db, current_user, provider_id)
+    query = payment_export_query(provider_id, payment_status, from_, to)
+    return export_response("payments", query, PAYMENT_COLUMNS, format)
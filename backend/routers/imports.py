@@ -0,0 +1,98 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.responses import StreamingResponse
+from database import AsyncSessionLocal
+from models import UserRole
+from bulk_import import (
+    ProviderImport, TreatmentImport, TreatmentPriceImport, run_import,
+    read_json_array, read_ndjson, read_csv, IMPORT_MAX_ERRORS
+)
+from .auth import get_current_active_user, CurrentUser
+import json
+import tempfile
+
+router = APIRouter(
+    prefix="/imports",
+    tags=["Imports"],
+    responses={404: {"description": "Not found"}},
+)
+
+NDJSON = "application/x-ndjson"
+READERS = {
+    "application/json": read_json_array,
+    NDJSON: read_ndjson,
+    "application/ndjson": read_ndjson,
+    "text/csv": read_csv,
+    "application/csv": read_csv,
+}
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024  # Larger uploads are spooled to a temporary file.
+
+async def spooled_chunks(upload, size: int = 64 * 1024):
+    try:
+        while chunk := upload.read(size):
+            yield chunk
+    finally:
+        upload.close()
+
+async def import_response(request: Request, importer):
+    """Run an import. Clients accepting NDJSON get one progress line per committed chunk as it happens and a final
+    line with "done", others get the summary once the whole upload is imported."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    reader = READERS.get(content_type)
+    if reader is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send a JSON array (application/json), NDJSON (application/x-ndjson) or CSV (text/csv)"
+        )
+
+    if NDJSON in request.headers.get("accept", ""):
+        # The upload is received before the progress response starts (a streaming response may not share the
+        # request's receive channel with the body), rows are still parsed and imported chunk by chunk from the spool.
+        upload = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        async for chunk in request.stream():
+            upload.write(chunk)
+        upload.seek(0)
+
+        async def progress_lines():
+            # Own session, the import outlives the request handler while the response streams.
+            async with AsyncSessionLocal() as db:
+                summary = {"rows": 0, "inserted": 0, "failed": 0}
+                async for progress in run_import(db, importer, reader(spooled_chunks(upload))):
+                    summary = {key: progress[key] for key in summary}
+                    yield json.dumps(progress) + "\n"
+                yield json.dumps({**summary, "done": True}) + "\n"
+        return StreamingResponse(progress_lines(), media_type=NDJSON)
+
+    summary = {"rows": 0, "inserted": 0, "failed": 0, "errors": []}
+    async with AsyncSessionLocal() as db:
+        async for progress in run_import(db, importer, reader(request.stream())):
+            summary.update({key: progress[key] for key in ("rows", "inserted", "failed")})
+            summary["errors"].extend(progress["errors"][:IMPORT_MAX_ERRORS - len(summary["errors"])])
+    return summary
+
+def require_admin(current_user: CurrentUser):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can import this data"
+        )
+
+@router.post("/providers")
+async def import_providers(request: Request, current_user: CurrentUser = Depends(get_current_active_user)):
+    # Rows as for POST /providers/, id lists in CSV cells separated by ";".
+    require_admin(current_user)
+    return await import_response(request, ProviderImport(current_user))
+
+@router.post("/treatments")
+async def import_treatments(request: Request, current_user: CurrentUser = Depends(get_current_active_user)):
+    require_admin(current_user)
+    return await import_response(request, TreatmentImport(current_user))
+
+@router.post("/treatment-prices")
+async def import_treatment_prices(request: Request, current_user: CurrentUser = Depends(get_current_active_user)):
+    # Rows as for POST /providers/treatment-prices/. Providers may import prices for their own clinics only.
+    if current_user.role not in [UserRole.ADMIN, UserRole.PROVIDER]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to import treatment prices"
+        )
+    return await import_response(request, TreatmentPriceImport(current_user))
@@ -1,31 +1,33 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from database import get_db
-from models import Payment, Booking, BookingStatus, PaymentStatus, User
+from models import Payment, Booking, BookingStatus, PaymentStatus
 from schemas import PaymentIntentCreate, PaymentIntentResponse
-from .auth import get_current_active_user
-from dotenv import load_dotenv
-import os
+from payment_gateway import gateway, payment_intent_idempotency_key, PaymentInProgress, STRIPE_WEBHOOK_SECRET
+from stripe_events import insert_event, events_pending
+from jobs import enqueue
+from .auth import get_current_active_user, CurrentUser
 import stripe
 import logging
 
-load_dotenv()
-
 router = APIRouter(
     prefix="/payments",
     tags=["Payments"],
     responses={404: {"description": "Not found"}},
 )
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 
 @router.post("/create-payment-intent", response_model=PaymentIntentResponse)
 async def create_payment_intent(
     payment_data: PaymentIntentCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Get booking
-    booking = db.query(Booking).filter(Booking.id == payment_data.booking_id).first()
+    booking = await db.scalar(
+        select(Booking).options(selectinload(Booking.treatment_price)).where(Booking.id == payment_data.booking_id)
+    )
     
     if not booking:
         raise HTTPException(
@@ -47,12 +49,12 @@ async def create_payment_intent(
             detail=f"Cannot process payment for booking with status {booking.status}"
         )
     
-    if not stripe.api_key:
+    if not gateway.configured:
         logging.error("Stripe secret key is not set!")
         raise HTTPException(status_code=500, detail="Payment configuration error")
     
     # Check if there's already a payment for this booking
-    existing_payment = db.query(Payment).filter(Payment.booking_id == booking.id).first()
+    existing_payment = await db.scalar(select(Payment).where(Payment.booking_id == booking.id))
     if existing_payment and existing_payment.status == PaymentStatus.PAID:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -62,18 +64,36 @@ async def create_payment_intent(
     # Get treatment price
     treatment_price = booking.treatment_price
     
-    amount = treatment_price.price
+    # Prices are kept in minor units (money.py), the amount Stripe charges as is.
+    amount_minor = treatment_price.price_minor
     currency = treatment_price.currency
+    previous_intent_id = existing_payment.stripe_payment_intent_id if existing_payment else None
 
     try:
-        intent = stripe.PaymentIntent.create(
-            amount=int(amount * 100),  # Convert to cents
-            currency=currency,
-            metadata={
-                "booking_id": str(booking.id),
-                "user_id": str(current_user.id)
-            }
+        intent = None
+        if previous_intent_id:
+            # Calling this again (page reload, second tab) hands out the same PaymentIntent while it can still be paid.
+            # After the price changed the old one is cancelled before it is replaced.
+            intent = await gateway.reusable_intent(previous_intent_id, amount_minor, currency)
+        if intent is None:
+            intent = await gateway.create_intent(
+                amount_minor,
+                currency,
+                metadata={
+                    "booking_id": str(booking.id),
+                    "user_id": str(current_user.id)
+                },
+                idempotency_key=payment_intent_idempotency_key(booking.id, amount_minor, currency, previous_intent_id)
+            )
+    except PaymentInProgress:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A payment for this booking is being processed, please try again shortly"
         )
+    except stripe.error.APIConnectionError as e:
+        # Timed out or could not connect, after the retries.
+        logging.error(f"Stripe unreachable: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Payment provider unavailable, please try again")
     except stripe.error.StripeError as e:
         logging.error(f"Stripe error: {e.user_message}")
         raise HTTPException(status_code=500, detail=f"Stripe error: {e.user_message}")
@@ -83,32 +103,33 @@ async def create_payment_intent(
     
     # Create or update payment record
     if existing_payment:
-        existing_payment.amount = amount
-        existing_payment.currency = currency
-        existing_payment.status = PaymentStatus.PENDING
-        existing_payment.stripe_payment_intent_id = intent.id
-        db.commit()
+        if existing_payment.stripe_payment_intent_id != intent.id or existing_payment.amount_minor != amount_minor or existing_payment.currency != currency:
+            existing_payment.amount_minor = amount_minor
+            existing_payment.currency = currency
+            existing_payment.status = PaymentStatus.PENDING
+            existing_payment.stripe_payment_intent_id = intent.id
+            await db.commit()
     else:
         new_payment = Payment(
             booking_id=booking.id,
-            amount=amount,
+            amount_minor=amount_minor,
             currency=currency,
             stripe_payment_intent_id=intent.id,
             status=PaymentStatus.PENDING
         )
         db.add(new_payment)
-        db.commit()
+        await db.commit()
     
     return {"client_secret": intent.client_secret}
 
 @router.post("/confirm-payment/{booking_id}", status_code=status.HTTP_200_OK)
 async def confirm_payment(
     booking_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Get booking
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
+    booking = await db.get(Booking, booking_id)
     
     if not booking:
         raise HTTPException(
@@ -124,7 +145,7 @@ async def confirm_payment(
         )
     
     # Get payment
-    payment = db.query(Payment).filter(Payment.booking_id == booking_id).first()
+    payment = await db.scalar(select(Payment).where(Payment.booking_id == booking_id))
     
     if not payment:
         raise HTTPException(
@@ -132,12 +153,57 @@ async def confirm_payment(
             detail="Payment not found"
         )
     
+    # The client saying the payment went through is not enough, Stripe has to say so too.
+    if not gateway.configured:
+        logging.error("Stripe secret key is not set!")
+        raise HTTPException(status_code=500, detail="Payment configuration error")
+    try:
+        intent = await gateway.retrieve_intent(payment.stripe_payment_intent_id)
+    except stripe.error.APIConnectionError as e:
+        logging.error(f"Stripe unreachable: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Payment provider unavailable, please try again")
+    except stripe.error.StripeError as e:
+        logging.error(f"Stripe error: {e.user_message}")
+        raise HTTPException(status_code=500, detail=f"Stripe error: {e.user_message}")
+
+    if intent.status != "succeeded":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Payment has not succeeded (status {intent.status})"
+        )
+    if intent.amount != payment.amount_minor or intent.currency.lower() != payment.currency.lower():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Paid amount does not match the payment"
+        )
+
     # Update payment status
     payment.status = PaymentStatus.PAID
     
     # Update booking status
     booking.status = BookingStatus.CONFIRMED
     
-    db.commit()
+    enqueue(db, "payment_status_changed", payment_id=payment.id, status=payment.status.value)
+    enqueue(db, "booking_status_changed", booking_id=booking.id, status=booking.status.value)
+    await db.commit()
     
     return {"status": "Payment confirmed", "booking_status": booking.status}
+
+@router.post("/webhook", status_code=status.HTTP_200_OK)
+async def stripe_webhook(request: Request, db: AsyncSession = Depends(get_db)):
+    # Stripe retries deliveries until it gets a 2xx, so this only verifies and stores the event.
+    # stripe_events.py applies it to the payment and booking shortly after.
+    if not STRIPE_WEBHOOK_SECRET:
+        logging.error("Stripe webhook secret is not set!")
+        raise HTTPException(status_code=500, detail="Payment configuration error")
+
+    payload = await request.body()
+    try:
+        event = stripe.Webhook.construct_event(payload, request.headers.get("stripe-signature", ""), STRIPE_WEBHOOK_SECRET)
+    except (ValueError, stripe.error.SignatureVerificationError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid webhook signature")
+
+    await db.execute(insert_event(event.id, event.type, payload.decode(), event.created))
+    await db.commit()
+    events_pending.set()
+    return {"received": True}
@@ -1,15 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session, joinedload
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List, Optional
+from datetime import datetime, timedelta, timezone
 from database import get_db
-from models import Provider, User, Specialty, Treatment, TreatmentPrice, UserRole, Booking, Review
+from models import Provider, Specialty, Treatment, TreatmentPrice, UserRole, Booking, ProviderWorkingHours
 from schemas import (
     ProviderCreate, ProviderResponse, ProviderUpdate, ProviderDetailResponse,
     ProviderFilter, SpecialtyCreate, SpecialtyResponse, 
-    TreatmentResponse, TreatmentPriceCreate, TreatmentPriceResponse, TreatmentPriceUpdate, TopRatedTreatmentOut
+    TreatmentResponse, TreatmentPriceCreate, TreatmentPriceResponse, TreatmentPriceUpdate, TopRatedTreatmentOut,
+    WorkingHours, AvailabilityResponse, ProviderSearchResponse, NearbyProviderResponse
 )
-from .auth import get_current_active_user
-from sqlalchemy import func, or_, exists
+from search import apply_provider_search, fulltext_enabled
+from pagination import keyset_paginate, next_cursor, set_next_cursor, set_cursor_header
+from leaderboard import get_leaderboard
+from facets import facet_counts
+from jobs import enqueue
+from geo import location, nearby_condition, distance_km, MAX_NEARBY_RADIUS_KM
+from prices import refresh_base_prices
+from money import to_minor
+from serialization import orm_response, cached_response
+from availability import load_working_hours, validate_zone, validate_working_hours, provider_availability, parse_duration
+from cache import cache, cache_key, provider_key, invalidate_provider, make_etag, etag_matches, TOP_RATED_TREATMENTS_KEY, SPECIALTIES_PREFIX, TREATMENTS_PREFIX
+from .auth import get_current_active_user, CurrentUser
+from sqlalchemy import exists, select, func, delete
 
 router = APIRouter(
     prefix="/providers",
@@ -17,12 +31,39 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# Keyset pagination keys (each backed by an index).
+provider_page_keys = (Provider.average_rating, Provider.id)
+specialty_page_keys = (Specialty.id,)
+treatment_page_keys = (Treatment.id,)
+
+# Collections serialized by ProviderResponse, loaded up front since async sessions cannot lazy load.
+provider_response_options = (
+    selectinload(Provider.specialties),
+    selectinload(Provider.treatments),
+)
+
+async def load_provider(db: AsyncSession, provider_id: int):
+    return await db.scalar(
+        select(Provider)
+        .options(*provider_response_options)
+        .where(Provider.id == provider_id)
+        .execution_options(populate_existing=True)
+    )
+
+async def load_treatment_price(db: AsyncSession, price_id: int):
+    return await db.scalar(
+        select(TreatmentPrice)
+        .options(selectinload(TreatmentPrice.treatment))
+        .where(TreatmentPrice.id == price_id)
+        .execution_options(populate_existing=True)
+    )
+
 # Providers endpoints
 @router.post("/", response_model=ProviderResponse, status_code=status.HTTP_201_CREATED)
-def create_provider(
+async def create_provider(
     provider: ProviderCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Check if user is authorized to create a provider
     if current_user.role not in [UserRole.ADMIN, UserRole.PROVIDER]:
@@ -32,7 +73,7 @@ def create_provider(
         )
     
     # Check if provider already exists for this user
-    existing_provider = db.query(Provider).filter(Provider.user_id == provider.user_id).first()
+    existing_provider = await db.scalar(select(Provider).where(Provider.user_id == provider.user_id))
     if existing_provider:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -49,11 +90,12 @@ def create_provider(
         country=provider.country,
         phone=provider.phone,
         website=provider.website,
-        license_number=provider.license_number
+        license_number=provider.license_number,
+        **location(provider.city, provider.country, provider.latitude, provider.longitude)
     )
     
     # Add specialties
-    specialties = db.query(Specialty).filter(Specialty.id.in_(provider.specialty_ids)).all()
+    specialties = (await db.scalars(select(Specialty).where(Specialty.id.in_(provider.specialty_ids)))).all()
     if len(specialties) != len(provider.specialty_ids):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -62,7 +104,7 @@ def create_provider(
     db_provider.specialties = specialties
     
     # Add treatments
-    treatments = db.query(Treatment).filter(Treatment.id.in_(provider.treatment_ids)).all()
+    treatments = (await db.scalars(select(Treatment).where(Treatment.id.in_(provider.treatment_ids)))).all()
     if len(treatments) != len(provider.treatment_ids):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -71,96 +113,172 @@ def create_provider(
     db_provider.treatments = treatments
     
     db.add(db_provider)
-    db.commit()
-    db.refresh(db_provider)
-    return db_provider
+    await db.flush()
+    enqueue(db, "refresh_providers", provider_ids=[db_provider.id])  # Search facets.
+    await db.commit()
+    return await load_provider(db, db_provider.id)
 
-@router.get("/", response_model=List[ProviderResponse])
-def get_providers(
-    filter: ProviderFilter = Depends(),
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
-):
-    query = db.query(Provider)
-    
+def filter_providers(query, filter: ProviderFilter):
     # Apply filters
     if filter.country:
-        query = query.filter(Provider.country.ilike(f"%{filter.country}%")) # Country name from filter is lowercase so we match any similar case
+        query = query.where(Provider.country.ilike(f"%{filter.country}%")) # Country name from filter is lowercase so we match any similar case
     if filter.city:
-        query = query.filter(Provider.city == filter.city)
+        query = query.where(Provider.city == filter.city)
     if filter.featured:
-        query = query.filter(Provider.featured == True)
+        query = query.where(Provider.featured == True)
     if filter.min_rating is not None:
-        query = query.filter(Provider.average_rating >= filter.min_rating)
+        query = query.where(Provider.average_rating >= filter.min_rating)
+    # EXISTS over the join tables (their treatment_id/specialty_id indexes), not the facet table: the facets are
+    # refreshed by a job after the commit, the filters must see a write right away.
     if filter.treatment_id:
-        query = query.filter(Provider.treatments.any(Treatment.id == filter.treatment_id))
+        query = query.where(Provider.treatments.any(Treatment.id == filter.treatment_id))
     if filter.specialty_id:
-        query = query.filter(Provider.specialties.any(Specialty.id == filter.specialty_id))
+        query = query.where(Provider.specialties.any(Specialty.id == filter.specialty_id))
     if filter.search:
-        search_term = f"%{filter.search}%"
-        query = query.filter(
-            or_(
-                Provider.name.ilike(search_term),
-                Provider.description.ilike(search_term),
-                Provider.city.ilike(search_term),
-                Provider.country.ilike(search_term)
+        query = apply_provider_search(query, filter.search)
+    return query
+
+async def provider_page(db: AsyncSession, query, filter: ProviderFilter, skip: int, limit: int, cursor: Optional[str]):
+    """One page of a filtered provider select and the cursor of the next page."""
+    # Ranked search results are ordered by relevance, so they can only be paged with skip/limit.
+    if filter.search and fulltext_enabled():
+        if cursor:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursor pagination is not available for search results"
             )
-        )
+        return (await db.scalars(query.offset(skip).limit(limit))).all(), None
     
-    # Return filtered results
-    providers = query.offset(skip).limit(limit).all()
-    return providers
+    # Highest rated first. With a cursor the page starts after it and skip is ignored.
+    query = keyset_paginate(query, provider_page_keys, cursor, descending=True)
+    if not cursor:
+        query = query.offset(skip)
+    providers = (await db.scalars(query.limit(limit))).all()
+    return providers, next_cursor(providers, provider_page_keys, limit)
+
+@router.get("/", response_model=List[ProviderResponse])
+async def get_providers(
+    response: Response,
+    filter: ProviderFilter = Depends(),
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    query = filter_providers(select(Provider).options(*provider_response_options), filter)
+    providers, page_cursor = await provider_page(db, query, filter, skip, limit, cursor)
+    set_cursor_header(response, page_cursor)
+    return orm_response(List[ProviderResponse], providers, response)
+
+@router.get("/search", response_model=ProviderSearchResponse)
+async def search_providers(
+    filter: ProviderFilter = Depends(),
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    # The page of GET /providers/ plus the number of matching providers and, among them, the counts per country,
+    # city, specialty, treatment and rating bucket (see facets.py), so the UI can offer only filters that match.
+    query = filter_providers(select(Provider).options(*provider_response_options), filter)
+    providers, page_cursor = await provider_page(db, query, filter, skip, limit, cursor)
+    total, facets = await facet_counts(db, query)
+    return orm_response(ProviderSearchResponse, {
+        "items": providers,
+        "total": total,
+        "facets": facets,
+        "next_cursor": page_cursor,
+    })
+
+@router.get("/nearby", response_model=List[NearbyProviderResponse])
+async def get_nearby_providers(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(50, gt=0, le=MAX_NEARBY_RADIUS_KM),
+    filter: ProviderFilter = Depends(),
+    skip: int = 0,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_db)
+):
+    # Candidates from the geohash index (with the usual filters), nearest first by exact distance. Only the
+    # coordinates of the candidates are read, the full providers only for the requested page.
+    query = filter_providers(select(Provider.id, Provider.latitude, Provider.longitude), filter)
+    query = query.where(nearby_condition(lat, lon, radius_km)).order_by(None)
+    distances = []
+    for provider_id, latitude, longitude in await db.execute(query):
+        distance = distance_km(lat, lon, latitude, longitude)
+        if distance <= radius_km:
+            distances.append((distance, provider_id))
+    page = sorted(distances)[skip:skip + limit]
+    
+    providers = {
+        provider.id: provider
+        for provider in await db.scalars(
+            select(Provider).options(*provider_response_options).where(Provider.id.in_([provider_id for _, provider_id in page]))
+        )
+    }
+    return orm_response(List[NearbyProviderResponse], [
+        {**{name: getattr(providers[provider_id], name) for name in ProviderResponse.model_fields}, "distance_km": round(distance, 2)}
+        for distance, provider_id in page
+    ])
+
+def provider_etag(provider_id: int, created_at, updated_at):
+    # updated_at moves on every change shown on the detail page: provider fields, prices (see the
+    # treatment price endpoints) and ratings (the aggregate UPDATE in reviews).
+    return make_etag(provider_id, (updated_at or created_at).isoformat())
+
+def not_modified(etag: str):
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 @router.get("/{provider_id}", response_model=ProviderDetailResponse)
-def get_provider(provider_id: int, db: Session = Depends(get_db)):
-    provider = db.query(Provider).options(
-        joinedload(Provider.specialties),
-        joinedload(Provider.treatments).joinedload(Treatment.treatment_prices)
-    ).filter(Provider.id == provider_id).first()
+async def get_provider(provider_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    if_none_match = request.headers.get("if-none-match")
+    cached = await cache.get(provider_key(provider_id))
 
-    if not provider:
-        raise HTTPException(status_code=404, detail="Provider not found")
+    if cached is None and if_none_match:
+        # Revalidating a copy the client already has only needs the timestamps.
+        row = (await db.execute(
+            select(Provider.created_at, Provider.updated_at).where(Provider.id == provider_id)
+        )).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Provider not found")
+        etag = provider_etag(provider_id, *row)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    if cached is None:
+        # The provider's own prices come through Provider.treatment_prices, not every provider's prices of its treatments.
+        provider = await db.scalar(
+            select(Provider).options(
+                *provider_response_options,
+                selectinload(Provider.treatment_prices).selectinload(TreatmentPrice.treatment)
+            ).where(Provider.id == provider_id)
+        )
 
-    # Collect treatment_prices from all treatments associated with the provider.
-    treatment_prices = []
-    for treatment in provider.treatments:
-        for price in treatment.treatment_prices:
-            if price.provider_id == provider.id:
-                treatment_prices.append(price)
+        if not provider:
+            raise HTTPException(status_code=404, detail="Provider not found")
 
-    # Build the response manually with proper Pydantic conversion
-    return ProviderDetailResponse(
-        id=provider.id,
-        user_id=provider.user_id,
-        name=provider.name,
-        description=provider.description,
-        address=provider.address,
-        city=provider.city,
-        country=provider.country,
-        phone=provider.phone,
-        website=provider.website,
-        license_number=provider.license_number,
-        is_verified=provider.is_verified,
-        created_at=provider.created_at,
-        updated_at=provider.updated_at,
-        average_rating=provider.average_rating,
-        total_reviews=provider.total_reviews,
-        featured=provider.featured,
-        specialties=[SpecialtyResponse.from_orm(s) for s in provider.specialties],
-        treatments=[TreatmentResponse.from_orm(t) for t in provider.treatments],
-        treatment_prices=[TreatmentPriceResponse.from_orm(p) for p in treatment_prices]
-    )
+        cached = {
+            "etag": provider_etag(provider.id, provider.created_at, provider.updated_at),
+            "body": ProviderDetailResponse.model_validate(provider).model_dump(mode="json"),
+        }
+        await cache.set(provider_key(provider_id), cached)
+
+    if etag_matches(if_none_match, cached["etag"]):
+        return not_modified(cached["etag"])
+    response.headers["ETag"] = cached["etag"]
+    response.headers["Cache-Control"] = "no-cache"  # Clients may keep the page but must revalidate it.
+    return cached_response(cached["body"], response)
 
 @router.put("/{provider_id}", response_model=ProviderResponse)
-def update_provider(
+async def update_provider(
     provider_id: int,
     provider_update: ProviderUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
-    # Get provider
-    provider = db.query(Provider).filter(Provider.id == provider_id).first()
+    # Get provider (with its collections, which are replaced below)
+    provider = await db.scalar(select(Provider).options(*provider_response_options).where(Provider.id == provider_id))
     if not provider:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -181,12 +299,22 @@ def update_provider(
     specialties = update_data.pop("specialty_ids", None)
     treatments = update_data.pop("treatment_ids", None)
     
+    # New coordinates, or new city/country without them: locate the provider again.
+    coordinates = {"latitude", "longitude"} & update_data.keys()
+    if coordinates or {"city", "country"} & update_data.keys():
+        update_data.update(location(
+            update_data.get("city", provider.city),
+            update_data.get("country", provider.country),
+            update_data.get("latitude", provider.latitude) if coordinates else None,
+            update_data.get("longitude", provider.longitude) if coordinates else None,
+        ))
+    
     for key, value in update_data.items():
         setattr(provider, key, value)
     
     # Update specialties if provided
     if specialties is not None:
-        specialty_objs = db.query(Specialty).filter(Specialty.id.in_(specialties)).all()
+        specialty_objs = (await db.scalars(select(Specialty).where(Specialty.id.in_(specialties)))).all()
         if len(specialty_objs) != len(specialties):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -196,7 +324,7 @@ def update_provider(
     
     # Update treatments if provided
     if treatments is not None:
-        treatment_objs = db.query(Treatment).filter(Treatment.id.in_(treatments)).all()
+        treatment_objs = (await db.scalars(select(Treatment).where(Treatment.id.in_(treatments)))).all()
         if len(treatment_objs) != len(treatments):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -204,16 +332,89 @@ def update_provider(
             )
         provider.treatments = treatment_objs
     
-    db.commit()
-    db.refresh(provider)
-    return provider
+    # Changes to the collections alone do not update the provider row.
+    provider.updated_at = func.now()
+    enqueue(db, "refresh_providers", provider_ids=[provider.id])  # Leaderboard and search facets.
+    await db.commit()
+    await invalidate_provider(provider.id)
+    return await load_provider(db, provider.id)
+
+# Availability endpoints
+@router.get("/{provider_id}/working-hours", response_model=WorkingHours)
+async def get_working_hours(provider_id: int, db: AsyncSession = Depends(get_db)):
+    provider = await db.get(Provider, provider_id)
+    if not provider:
+        raise HTTPException(status_code=404, detail="Provider not found")
+    hours = await load_working_hours(db, provider_id)
+    return {
+        "timezone": provider.timezone,
+        "slot_minutes": provider.slot_minutes,
+        "slot_capacity": provider.slot_capacity,
+        "hours": [hours[weekday] for weekday in sorted(hours)],
+    }
+
+@router.put("/{provider_id}/working-hours", response_model=WorkingHours)
+async def update_working_hours(
+    provider_id: int,
+    working_hours: WorkingHours,
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
+):
+    provider = await db.get(Provider, provider_id)
+    if not provider:
+        raise HTTPException(status_code=404, detail="Provider not found")
+    if current_user.id != provider.user_id and current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to update this provider"
+        )
+    validate_zone(working_hours.timezone)
+    validate_working_hours(working_hours.slot_minutes, working_hours.hours)
+
+    # The weekly schedule is replaced as a whole. Existing bookings keep their slots.
+    provider.timezone = working_hours.timezone
+    provider.slot_minutes = working_hours.slot_minutes
+    provider.slot_capacity = working_hours.slot_capacity
+    await db.execute(delete(ProviderWorkingHours).where(ProviderWorkingHours.provider_id == provider_id))
+    db.add_all([ProviderWorkingHours(provider_id=provider_id, **entry.dict()) for entry in working_hours.hours])
+    await db.commit()
+    return working_hours
+
+@router.get("/{provider_id}/availability", response_model=AvailabilityResponse)
+async def get_availability(
+    provider_id: int,
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    treatment_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    # Free appointment starts within the provider's working hours, the coming week unless from/to are given.
+    # Providers without working hours have no listed slots, bookings with them are only checked for conflicts.
+    provider = await db.get(Provider, provider_id)
+    if not provider:
+        raise HTTPException(status_code=404, detail="Provider not found")
+
+    duration = timedelta(minutes=provider.slot_minutes)
+    if treatment_id is not None:
+        average_duration = await db.scalar(select(Treatment.average_duration).where(Treatment.id == treatment_id))
+        duration = parse_duration(average_duration, duration)
+
+    start = from_ or datetime.now(timezone.utc)
+    end = to or start + timedelta(days=7)
+    return {
+        "provider_id": provider.id,
+        "timezone": provider.timezone,
+        "slot_minutes": provider.slot_minutes,
+        "duration_minutes": int(duration.total_seconds() // 60),
+        "slots": await provider_availability(db, provider, start, end, duration),
+    }
 
 # Specialties endpoints
 @router.post("/specialties/", response_model=SpecialtyResponse, status_code=status.HTTP_201_CREATED)
-def create_specialty(
+async def create_specialty(
     specialty: SpecialtyCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Only admin can create specialties
     if current_user.role != UserRole.ADMIN:
@@ -223,7 +424,7 @@ def create_specialty(
         )
     
     # Check if specialty already exists
-    existing = db.query(Specialty).filter(Specialty.name == specialty.name).first()
+    existing = await db.scalar(select(Specialty).where(Specialty.name == specialty.name))
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -233,41 +434,70 @@ def create_specialty(
     # Create specialty
     db_specialty = Specialty(**specialty.dict())
     db.add(db_specialty)
-    db.commit()
-    db.refresh(db_specialty)
+    await db.commit()
+    await db.refresh(db_specialty)
+    await cache.delete_prefix(SPECIALTIES_PREFIX)
     return db_specialty
 
 @router.get("/specialties/", response_model=List[SpecialtyResponse])
-def get_specialties(
+async def get_specialties(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
 ):
-    specialties = db.query(Specialty).offset(skip).limit(limit).all()
-    return specialties
+    key = SPECIALTIES_PREFIX + cache_key(skip, limit, cursor)
+    page = await cache.get(key)
+    if page is None:
+        query = keyset_paginate(select(Specialty), specialty_page_keys, cursor)
+        if not cursor:
+            query = query.offset(skip)
+        specialties = (await db.scalars(query.limit(limit))).all()
+        page = {
+            "items": [SpecialtyResponse.model_validate(s).model_dump(mode="json") for s in specialties],
+            "next_cursor": next_cursor(specialties, specialty_page_keys, limit),
+        }
+        await cache.set(key, page)
+    set_cursor_header(response, page["next_cursor"])
+    return cached_response(page["items"], response)
 
 @router.get("/treatments/", response_model=List[TreatmentResponse])
-def get_treatments(
+async def get_treatments(
+    response: Response,
     category: Optional[str] = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(Treatment)
-    if category:
-        query = query.filter(Treatment.category == category)
-    treatments = query.offset(skip).limit(limit).all()
-    return treatments
+    key = TREATMENTS_PREFIX + cache_key(category, skip, limit, cursor)
+    page = await cache.get(key)
+    if page is None:
+        query = select(Treatment)
+        if category:
+            query = query.where(Treatment.category == category)
+        query = keyset_paginate(query, treatment_page_keys, cursor)
+        if not cursor:
+            query = query.offset(skip)
+        treatments = (await db.scalars(query.limit(limit))).all()
+        page = {
+            "items": [TreatmentResponse.model_validate(t).model_dump(mode="json") for t in treatments],
+            "next_cursor": next_cursor(treatments, treatment_page_keys, limit),
+        }
+        await cache.set(key, page)
+    set_cursor_header(response, page["next_cursor"])
+    return cached_response(page["items"], response)
 
 # Treatment Price endpoints
 @router.post("/treatment-prices/", response_model=TreatmentPriceResponse, status_code=status.HTTP_201_CREATED)
-def create_treatment_price(
+async def create_treatment_price(
     treatment_price: TreatmentPriceCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Check if provider exists and current user is authorized
-    provider = db.query(Provider).filter(Provider.id == treatment_price.provider_id).first()
+    provider = await db.get(Provider, treatment_price.provider_id)
     if not provider:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -281,7 +511,7 @@ def create_treatment_price(
         )
     
     # Check if treatment exists
-    treatment = db.query(Treatment).filter(Treatment.id == treatment_price.treatment_id).first()
+    treatment = await db.get(Treatment, treatment_price.treatment_id)
     if not treatment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -289,96 +519,106 @@ def create_treatment_price(
         )
     
     # Create treatment price
-    db_treatment_price = TreatmentPrice(**treatment_price.dict())
+    try:
+        price_minor = to_minor(treatment_price.price, treatment_price.currency)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    db_treatment_price = TreatmentPrice(**treatment_price.dict(exclude={"price"}), price_minor=price_minor)
     db.add(db_treatment_price)
-    db.commit()
-    db.refresh(db_treatment_price)
-    return db_treatment_price
+    await db.flush()
+    await refresh_base_prices(db, [db_treatment_price.id])
+    provider.updated_at = func.now()  # Prices are part of the provider detail page and its ETag.
+    enqueue(db, "refresh_providers", provider_ids=[db_treatment_price.provider_id])
+    await db.commit()
+    await invalidate_provider(db_treatment_price.provider_id)
+    return await load_treatment_price(db, db_treatment_price.id)
 
 @router.put("/treatment-prices/{price_id}", response_model=TreatmentPriceResponse)
-def update_treatment_price(
+async def update_treatment_price(
     price_id: int,
     updated_price: TreatmentPriceUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
-    db_price = db.query(TreatmentPrice).options(joinedload(TreatmentPrice.treatment)).filter(TreatmentPrice.id == price_id).first()
+    db_price = await db.scalar(select(TreatmentPrice).options(selectinload(TreatmentPrice.treatment)).where(TreatmentPrice.id == price_id))
     if not db_price:
         raise HTTPException(status_code=404, detail="Treatment price not found")
 
-    provider = db.query(Provider).filter(Provider.id == db_price.provider_id).first()
+    provider = await db.get(Provider, db_price.provider_id)
     if not provider or provider.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
 
     if updated_price.treatment_id and updated_price.treatment_id != db_price.treatment_id:
         # Check if this treatment_price is used in any bookings
-        is_used = db.query(exists().where(Booking.treatment_price_id == db_price.id)).scalar()
+        is_used = await db.scalar(select(exists().where(Booking.treatment_price_id == db_price.id)))
         if is_used:
             raise HTTPException(
                 status_code=400,
                 detail="Cannot update treatment_id of a treatment price that is referenced in bookings."
             )
 
-    for field, value in updated_price.dict(exclude_unset=True).items():
+    update_data = updated_price.dict(exclude_unset=True)
+    if "price" in update_data or "currency" in update_data:
+        # A new currency keeps the price, in the new currency's minor unit.
+        price = update_data.pop("price", None)
+        price = db_price.price if price is None else price
+        try:
+            update_data["price_minor"] = to_minor(price, update_data.get("currency") or db_price.currency)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+    for field, value in update_data.items():
         setattr(db_price, field, value)
 
-    db.commit()
-    db.refresh(db_price)
-    return db_price
+    await refresh_base_prices(db, [db_price.id])
+    provider.updated_at = func.now()
+    enqueue(db, "refresh_providers", provider_ids=[db_price.provider_id])
+    await db.commit()
+    await invalidate_provider(db_price.provider_id)
+    return await load_treatment_price(db, db_price.id)
 
 @router.delete("/treatment-prices/{price_id}", status_code=204)
-def delete_treatment_price(
+async def delete_treatment_price(
     price_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
-    db_price = db.query(TreatmentPrice).filter(TreatmentPrice.id == price_id).first()
+    db_price = await db.get(TreatmentPrice, price_id)
     if not db_price:
         raise HTTPException(status_code=404, detail="Treatment price not found")
 
-    provider = db.query(Provider).filter(Provider.id == db_price.provider_id).first()
+    provider = await db.get(Provider, db_price.provider_id)
     if not provider or provider.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
 
     # Check if referenced by bookings
-    is_used = db.query(exists().where(Booking.treatment_price_id == db_price.id)).scalar()
+    is_used = await db.scalar(select(exists().where(Booking.treatment_price_id == db_price.id)))
     if is_used:
         raise HTTPException(
             status_code=400,
             detail="Cannot delete treatment price that is referenced by existing bookings."
         )
 
-    db.delete(db_price)
-    db.commit()
+    await db.delete(db_price)
+    provider.updated_at = func.now()
+    enqueue(db, "refresh_providers", provider_ids=[db_price.provider_id])
+    await db.commit()
+    await invalidate_provider(db_price.provider_id)
 
 
 @router.get("/top-rated-treatments/", response_model=List[TopRatedTreatmentOut])
-def get_top_rated_treatments(db: Session = Depends(get_db)):
+async def get_top_rated_treatments(db: AsyncSession = Depends(get_db)):
     """
     Returns 4 top-rated treatments based on average review ratings,
-    grouped by provider + treatment.
+    grouped by provider + treatment (read from the precomputed leaderboard).
     """
-    results = (
-        db.query(
-            Treatment.id.label("treatment_id"),
-            Treatment.name.label("treatment_name"),
-            Treatment.category.label("treatment_category"),
-            Provider.id.label("provider_id"),
-            Provider.name.label("provider_name"),
-            func.avg(Review.rating).label("avg_rating"),
-            func.count(Review.id).label("review_count"),
-            func.substr(func.coalesce(func.min(Review.comment), ''), 1, 120).label("review_snippet")
-        )
-        .join(TreatmentPrice, TreatmentPrice.treatment_id == Treatment.id)
-        .join(Provider, Provider.id == TreatmentPrice.provider_id)
-        .join(Review, Review.provider_id == Provider.id)
-        .group_by(Treatment.id, Provider.id)
-        .order_by(func.avg(Review.rating).desc(), func.count(Review.id).desc())
-        .limit(4)
-        .all()
-    )
+    cached = await cache.get(TOP_RATED_TREATMENTS_KEY)
+    if cached is not None:
+        return cached_response(cached)
+
+    results = await get_leaderboard(db)
 
-    return [
+    top_rated = [
         {
             "id": idx,
             "treatmentName": row.treatment_name,
@@ -389,3 +629,5 @@ def get_top_rated_treatments(db: Session = Depends(get_db)):
         }
         for idx, row in enumerate(results)
     ]
+    await cache.set(TOP_RATED_TREATMENTS_KEY, top_rated)
+    return cached_response(top_rated)
@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
 from database import get_db
-from models import Review, Provider, Booking, BookingStatus, User
+from models import Review, Provider, Booking, BookingStatus
 from schemas import ReviewCreate, ReviewResponse, ReviewUpdate
-from .auth import get_current_active_user
-from sqlalchemy import func
+from pagination import keyset_paginate, set_next_cursor
+from serialization import orm_response
+from cache import invalidate_provider
+from jobs import enqueue
+from .auth import get_current_active_user, CurrentUser
+from sqlalchemy import func, select, update, cast, Float
 
 router = APIRouter(
     prefix="/reviews",
@@ -13,14 +18,25 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# Newest first, keyset paginated on (created_at, id).
+review_page_keys = (Review.created_at, Review.id)
+
+async def load_review(db: AsyncSession, review_id: int):
+    return await db.scalar(
+        select(Review)
+        .options(selectinload(Review.user))
+        .where(Review.id == review_id)
+        .execution_options(populate_existing=True)
+    )
+
 @router.post("/", response_model=ReviewResponse, status_code=status.HTTP_201_CREATED)
-def create_review(
+async def create_review(
     review: ReviewCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Check if provider exists
-    provider = db.query(Provider).filter(Provider.id == review.provider_id).first()
+    provider = await db.get(Provider, review.provider_id)
     if not provider:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -28,11 +44,11 @@ def create_review(
         )
     
     # Check if user has already reviewed the treatment received for this provider
-    existing_review = db.query(Review).filter(
+    existing_review = await db.scalar(select(Review).where(
         Review.user_id == current_user.id,
         Review.provider_id == review.provider_id,
         Review.treatment_received == review.treatment_received
-    ).first()
+    ))
     
     if existing_review:
         raise HTTPException(
@@ -41,11 +57,11 @@ def create_review(
         )
     
     # Check if user has a completed booking with this provider for verification
-    verified_booking = db.query(Booking).filter(
+    verified_booking = await db.scalar(select(Booking).where(
         Booking.user_id == current_user.id,
         Booking.provider_id == review.provider_id,
         Booking.status == BookingStatus.COMPLETED
-    ).first()
+    ))
     
     # Create review
     db_review = Review(
@@ -61,23 +77,25 @@ def create_review(
     )
     
     db.add(db_review)
-    db.commit()
-    db.refresh(db_review)
     
-    # Update provider average rating
-    update_provider_rating(db, review.provider_id)
+    # Update provider average rating in the same transaction
+    await update_provider_rating(db, review.provider_id, new_scores=review_scores(db_review))
+    await db.commit()
+    await invalidate_provider(review.provider_id)
     
-    return db_review
+    return await load_review(db, db_review.id)
 
 @router.get("/provider/{provider_id}", response_model=List[ReviewResponse])
-def get_provider_reviews(
+async def get_provider_reviews(
     provider_id: int,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
 ):
     # Check if provider exists
-    provider = db.query(Provider).filter(Provider.id == provider_id).first()
+    provider = await db.get(Provider, provider_id)
     if not provider:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -85,35 +103,43 @@ def get_provider_reviews(
         )
     
     # Get reviews for provider
-    reviews = db.query(Review).filter(
-        Review.provider_id == provider_id
-    ).order_by(Review.created_at.desc()).offset(skip).limit(limit).all()
-    
-    return reviews
+    query = select(Review).options(selectinload(Review.user)).where(Review.provider_id == provider_id)
+    query = keyset_paginate(query, review_page_keys, cursor, descending=True)
+    if not cursor:
+        query = query.offset(skip)
+    reviews = (await db.scalars(query.limit(limit))).all()
+    set_next_cursor(response, reviews, review_page_keys, limit)
+    
+    return orm_response(List[ReviewResponse], reviews, response)
 
 @router.get("/user", response_model=List[ReviewResponse])
-def get_user_reviews(
+async def get_user_reviews(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Get reviews by current user
-    reviews = db.query(Review).filter(
-        Review.user_id == current_user.id
-    ).order_by(Review.created_at.desc()).offset(skip).limit(limit).all()
-    
-    return reviews
+    query = select(Review).options(selectinload(Review.user)).where(Review.user_id == current_user.id)
+    query = keyset_paginate(query, review_page_keys, cursor, descending=True)
+    if not cursor:
+        query = query.offset(skip)
+    reviews = (await db.scalars(query.limit(limit))).all()
+    set_next_cursor(response, reviews, review_page_keys, limit)
+    
+    return orm_response(List[ReviewResponse], reviews, response)
 
 @router.put("/{review_id}", response_model=ReviewResponse)
-def update_review(
+async def update_review(
     review_id: int,
     review_update: ReviewUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Get review
-    db_review = db.query(Review).filter(Review.id == review_id).first()
+    db_review = await db.get(Review, review_id)
     if not db_review:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -128,27 +154,29 @@ def update_review(
         )
     
     # Update review
+    old_scores = review_scores(db_review)
     update_data = review_update.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_review, key, value)
     
-    db.commit()
-    db.refresh(db_review)
-    
-    # Update provider average rating if rating changed
-    if "rating" in update_data:
-        update_provider_rating(db, db_review.provider_id)
+    # Update provider average rating (and the leaderboard snippet) in the same transaction if a score or comment changed
+    rating_changed = bool(update_data.keys() & {*RATING_COLUMNS, "comment"})
+    if rating_changed:
+        await update_provider_rating(db, db_review.provider_id, old_scores=old_scores, new_scores=review_scores(db_review))
+    await db.commit()
+    if rating_changed:
+        await invalidate_provider(db_review.provider_id)
     
-    return db_review
+    return await load_review(db, db_review.id)
 
 @router.delete("/{review_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_review(
+async def delete_review(
     review_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Get review
-    db_review = db.query(Review).filter(Review.id == review_id).first()
+    db_review = await db.get(Review, review_id)
     if not db_review:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -164,27 +192,56 @@ def delete_review(
     
     provider_id = db_review.provider_id
     
-    # Delete review
-    db.delete(db_review)
-    db.commit()
-    
-    # Update provider average rating
-    update_provider_rating(db, provider_id)
+    # Delete review and update provider average rating in the same transaction
+    await db.delete(db_review)
+    await update_provider_rating(db, provider_id, old_scores=review_scores(db_review))
+    await db.commit()
+    await invalidate_provider(provider_id)
     
     return None
 
+# Review scores and the provider (sum, count) columns they are aggregated into.
+RATING_COLUMNS = {
+    "rating": (Provider.rating_sum, Provider.total_reviews),
+    "site_quality": (Provider.site_quality_sum, Provider.site_quality_count),
+    "transportation": (Provider.transportation_sum, Provider.transportation_count),
+    "accommodation": (Provider.accommodation_sum, Provider.accommodation_count),
+}
+
+def review_scores(review: Review):
+    return {field: getattr(review, field) for field in RATING_COLUMNS}
+
 # Helper function to update provider average rating
-def update_provider_rating(db: Session, provider_id: int):
-    # Calculate new average rating
-    result = db.query(func.avg(Review.rating).label("average"), func.count(Review.id).label("count"))\
-               .filter(Review.provider_id == provider_id).first()
-    
-    average_rating = result.average or 0.0
-    total_reviews = result.count or 0
-    
-    # Update provider
-    provider = db.query(Provider).filter(Provider.id == provider_id).first()
-    if provider:
-        provider.average_rating = average_rating
-        provider.total_reviews = total_reviews
-        db.commit()
+async def update_provider_rating(db: AsyncSession, provider_id: int, old_scores: dict = None, new_scores: dict = None):
+    """Apply one review's change (create: new only, delete: old only, update: both) to the provider's running sums.
+
+    A single UPDATE with relative deltas, so the cost does not depend on how many reviews the provider has and the
+    row lock keeps concurrent reviewers from overwriting each other. It does not commit, the caller commits it
+    together with the review write.
+    """
+    old_scores = old_scores or {}
+    new_scores = new_scores or {}
+    values = {}
+    for field, (sum_column, count_column) in RATING_COLUMNS.items():
+        old, new = old_scores.get(field), new_scores.get(field)
+        sum_delta = (new or 0) - (old or 0)
+        count_delta = (new is not None) - (old is not None)
+        if sum_delta or count_delta:
+            values[sum_column.key] = func.coalesce(sum_column, 0) + sum_delta
+            values[count_column.key] = func.coalesce(count_column, 0) + count_delta
+        if field == "rating":
+            # SET expressions all see the row before the update, so the average applies the same deltas.
+            values[Provider.average_rating.key] = func.coalesce(
+                cast(func.coalesce(Provider.rating_sum, 0) + sum_delta, Float)
+                / func.nullif(func.coalesce(Provider.total_reviews, 0) + count_delta, 0),
+                0.0
+            )
+    
+    await db.execute(
+        update(Provider)
+        .where(Provider.id == provider_id)
+        .values(**values)
+        .execution_options(synchronize_session="fetch")
+    )
+    # Leaderboard and rating facets follow after the commit.
+    enqueue(db, "refresh_providers", provider_ids=[provider_id])
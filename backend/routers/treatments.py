@@ -1,10 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from typing import List
-from models import Treatment, User, Provider, Booking, BookingStatus, TreatmentPrice
-from schemas import TreatmentResponse, ProviderResponse, UserTreatmentResponse, UserTreatmentEntry
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
+from models import Treatment, Provider, Booking, BookingStatus, TreatmentPrice
+from schemas import TreatmentResponse, ProviderResponse, UserTreatmentResponse, UserTreatmentEntry, TreatmentPriceIndex
 from database import get_db
-from .auth import get_current_active_user
+from cache import cache, TREATMENTS_PREFIX
+from serialization import orm_response, cached_response
+from prices import price_index, price_statistics, from_base_minor, BASE_CURRENCY
+from money import from_minor
+from .auth import get_current_active_user, CurrentUser
 
 router = APIRouter(
     prefix="/treatments",
@@ -13,46 +19,89 @@ router = APIRouter(
 )
 
 @router.get("/", response_model=List[TreatmentResponse]) # GET all treatments
-def get_all_treatments(db: Session = Depends(get_db)):
-    treatments = db.query(Treatment).all()
-    return treatments
+async def get_all_treatments(db: AsyncSession = Depends(get_db)):
+    cached = await cache.get(TREATMENTS_PREFIX + "all")
+    if cached is None:
+        treatments = (await db.scalars(select(Treatment))).all()
+        cached = [TreatmentResponse.model_validate(t).model_dump(mode="json") for t in treatments]
+        await cache.set(TREATMENTS_PREFIX + "all", cached)
+    return cached_response(cached)
 
 # Get a treatment by ID, including providers offering it
 @router.get("/{treatment_id}", response_model=TreatmentResponse)
-def get_treatment(treatment_id: int, db: Session = Depends(get_db)):
-    treatment = db.query(Treatment).filter(Treatment.id == treatment_id).first()
+async def get_treatment(treatment_id: int, db: AsyncSession = Depends(get_db)):
+    treatment = await db.get(Treatment, treatment_id)
     if not treatment:
         raise HTTPException(status_code=404, detail="Treatment not found")
     return treatment
 
 
 @router.get("/{treatment_id}/providers", response_model=List[ProviderResponse])
-def get_treatment_providers(treatment_id: int, db: Session = Depends(get_db)):
-    treatment = db.query(Treatment).filter(Treatment.id == treatment_id).first()
+async def get_treatment_providers(treatment_id: int, db: AsyncSession = Depends(get_db)):
+    treatment = await db.scalar(
+        select(Treatment)
+        .options(
+            selectinload(Treatment.providers).selectinload(Provider.specialties),
+            selectinload(Treatment.providers).selectinload(Provider.treatments)
+        )
+        .where(Treatment.id == treatment_id)
+    )
     if not treatment:
         raise HTTPException(status_code=404, detail="Treatment not found")
-    return treatment.providers
+    return orm_response(List[ProviderResponse], treatment.providers)
+
+@router.get("/{treatment_id}/prices", response_model=TreatmentPriceIndex)
+async def get_treatment_prices(
+    treatment_id: int,
+    sort: str = Query("price", pattern="^-?price$"),  # "-price": most expensive first.
+    max_price: Optional[float] = Query(None, alias="max", ge=0),  # In the base currency.
+    skip: int = 0,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_db)
+):
+    # One page of every provider's price for the treatment in the base currency, with count/min/median/max over all
+    # of them (within max), not just the page.
+    if not await db.get(Treatment, treatment_id):
+        raise HTTPException(status_code=404, detail="Treatment not found")
+    rows = await price_index(db, treatment_id, max_price, descending=sort == "-price", skip=skip, limit=limit)
+    return orm_response(TreatmentPriceIndex, {
+        "treatment_id": treatment_id,
+        "currency": BASE_CURRENCY,
+        **await price_statistics(db, treatment_id, max_price),
+        "items": [
+            dict(row._mapping, price=from_minor(row.price_minor, row.currency),
+                 base_price=from_base_minor(row.base_price_minor))
+            for row in rows
+        ],
+    })
 
 @router.get("/user-treatments/{provider_id}", response_model=UserTreatmentResponse)
-def get_user_completed_treatments(
+async def get_user_completed_treatments(
     provider_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     """Get list of treatments the current user has completed with a specific provider"""
 
-    provider = db.query(Provider).filter(Provider.id == provider_id).first()
+    provider = await db.get(Provider, provider_id)
     if not provider:
         raise HTTPException(
             status_code=404,
             detail="Provider not found"
         )
 
-    completed_bookings = db.query(Booking).filter(
-        Booking.user_id == current_user.id,
-        Booking.provider_id == provider_id,
-        Booking.status == BookingStatus.COMPLETED
-    ).all()
+    # One query for the completed bookings and their treatments, earliest appointment first.
+    completed_bookings = (await db.execute(
+        select(Booking.appointment_date, Treatment.id, Treatment.name)
+        .outerjoin(TreatmentPrice, TreatmentPrice.id == Booking.treatment_price_id)
+        .outerjoin(Treatment, Treatment.id == TreatmentPrice.treatment_id)
+        .where(
+            Booking.user_id == current_user.id,
+            Booking.provider_id == provider_id,
+            Booking.status == BookingStatus.COMPLETED
+        )
+        .order_by(Booking.appointment_date, Booking.id)
+    )).all()
 
     if not completed_bookings:
         raise HTTPException(
@@ -63,20 +112,14 @@ def get_user_completed_treatments(
     seen_treatments = set()
     treatments: List[UserTreatmentEntry] = []
 
-    for booking in completed_bookings:
-        treatment_price = db.query(TreatmentPrice).filter(
-            TreatmentPrice.id == booking.treatment_price_id
-        ).first()
-
-        if treatment_price and treatment_price.treatment:
-            treatment = treatment_price.treatment
-            if treatment.id not in seen_treatments:
-                treatments.append(UserTreatmentEntry(
-                    id=treatment.id,
-                    name=treatment.name,
-                    booking_date=booking.appointment_date
-                ))
-                seen_treatments.add(treatment.id)
+    for appointment_date, treatment_id, treatment_name in completed_bookings:
+        if treatment_id is not None and treatment_id not in seen_treatments:
+            treatments.append(UserTreatmentEntry(
+                id=treatment_id,
+                name=treatment_name,
+                booking_date=appointment_date
+            ))
+            seen_treatments.add(treatment_id)
 
     return UserTreatmentResponse(
         treatments=treatments,
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
 from models import User, UserRole
 from schemas import UserUpdate, UserResponse
-from .auth import get_current_active_user, get_password_hash
+from cache import invalidate_user
+from .auth import get_current_active_user, CurrentUser, hash_password
 
 router = APIRouter(
     prefix="/users",
@@ -12,10 +13,10 @@ router = APIRouter(
 )
 
 @router.get("/{user_id}", response_model=UserResponse)
-def get_user(
+async def get_user(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Check if user is authorized to view user details
     if current_user.id != user_id and current_user.role != UserRole.ADMIN:
@@ -25,7 +26,7 @@ def get_user(
         )
     
     # Get user
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -35,45 +36,49 @@ def get_user(
     return user
 
 @router.put("/me", response_model=UserResponse)
-def update_user(
+async def update_user(
     user_update: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Update user data
     update_data = user_update.dict(exclude_unset=True)
     
     # Hash password if it's being updated
     if "password" in update_data:
-        update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
+        update_data["hashed_password"] = await hash_password(update_data.pop("password"))
     
-    # Apply updates
+    # Apply updates (current_user is the read-only snapshot, the row is loaded to change it)
+    user = await db.get(User, current_user.id)
     for key, value in update_data.items():
-        setattr(current_user, key, value)
+        setattr(user, key, value)
     
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await invalidate_user(user.id)
+    await db.refresh(user)
     
-    return current_user
+    return user
 
 @router.get("/me/stripe", response_model=dict)
-def get_stripe_info(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+async def get_stripe_info(
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Return user's Stripe customer ID
     return {"stripe_customer_id": current_user.stripe_customer_id}
 
 @router.put("/me/stripe", response_model=dict)
-def update_stripe_info(
+async def update_stripe_info(
     stripe_data: dict,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_active_user)
 ):
     # Update user's Stripe customer ID
     if "stripe_customer_id" in stripe_data:
-        current_user.stripe_customer_id = stripe_data["stripe_customer_id"]
-        db.commit()
-        db.refresh(current_user)
+        user = await db.get(User, current_user.id)
+        user.stripe_customer_id = stripe_data["stripe_customer_id"]
+        await db.commit()
+        await invalidate_user(user.id)
+        return {"stripe_customer_id": user.stripe_customer_id}
     
     return {"stripe_customer_id": current_user.stripe_customer_id}
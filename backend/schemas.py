@@ -1,7 +1,12 @@
-from pydantic import BaseModel, EmailStr, validator, Field
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, validator, Field, PlainSerializer
+from typing import List, Optional, Dict, Any, Annotated
+from datetime import datetime, time
+from decimal import Decimal
 from models import UserRole, BookingStatus, PaymentStatus
+from money import to_minor
+
+# Exact amounts (stored in minor units, see money.py), written to JSON as plain numbers.
+Money = Annotated[Decimal, PlainSerializer(float, return_type=float, when_used="json")]
 
 # User schemas (the forms seriallized into a simple pydantic class (has to match the submitted form with name attributes from frontend)).
 class UserBase(BaseModel):
@@ -25,6 +30,7 @@ class UserUpdate(BaseModel):
     password: Optional[str] = None
 
 class UserResponse(UserBase):
+    email: str  # Validated when it was stored, EmailStr is slow to run again on every serialized user.
     id: int
     created_at: datetime
     is_active: bool
@@ -43,6 +49,9 @@ class ProviderBase(BaseModel):
     phone: str
     website: Optional[str] = None
     license_number: Optional[str] = None
+    # Geocoded from city and country when not given.
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 class ProviderCreate(ProviderBase):
     user_id: int
@@ -58,6 +67,8 @@ class ProviderUpdate(BaseModel):
     phone: Optional[str] = None
     website: Optional[str] = None
     license_number: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
     specialty_ids: Optional[List[int]] = None
     treatment_ids: Optional[List[int]] = None
     is_verified: Optional[bool] = None
@@ -96,16 +107,23 @@ class TreatmentResponse(TreatmentBase):
 
 class TreatmentPriceBase(BaseModel):
     treatment_id: int
-    price: float
+    price: Money
     currency: str = "USD"
     description: Optional[str] = None
 
+    @validator('currency', always=True)  # Also when currency is left at its default.
+    def price_in_minor_units(cls, v, values):
+        # 19.99 is fine for USD, not for JPY (no minor unit); never rounded.
+        if values.get('price') is not None:
+            to_minor(values['price'], v)
+        return v
+
 class TreatmentPriceCreate(TreatmentPriceBase):
     provider_id: int
 
 class TreatmentPriceUpdate(BaseModel):
     treatment_id: Optional[int] = None
-    price: Optional[float] = None
+    price: Optional[Money] = None
     currency: Optional[str] = None
     description: Optional[str] = None
 
@@ -117,12 +135,38 @@ class TreatmentPriceResponse(TreatmentPriceBase):
         orm_mode = True
         from_attributes = True
 
+# Price comparison (prices.py), amounts in the base currency.
+class ComparedPrice(BaseModel):
+    treatment_price_id: int
+    provider_id: int
+    provider_name: str
+    city: Optional[str] = None
+    country: Optional[str] = None
+    price: Money
+    currency: str
+    base_price: Money
+
+    class Config:
+        from_attributes = True
+
+class TreatmentPriceIndex(BaseModel):
+    treatment_id: int
+    currency: str
+    count: int
+    min: Optional[Money] = None
+    median: Optional[Money] = None
+    max: Optional[Money] = None
+    items: List[ComparedPrice]
+
 class ProviderResponse(ProviderBase):
     id: int
     user_id: int
     is_verified: bool
     average_rating: float
     total_reviews: int
+    average_site_quality: Optional[float] = None
+    average_transportation: Optional[float] = None
+    average_accommodation: Optional[float] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
     featured: bool
@@ -204,7 +248,7 @@ class BookingResponse(BookingBase):
 # Payment schemas
 class PaymentBase(BaseModel):
     booking_id: int
-    amount: float
+    amount: Money
     currency: str = "USD"
 
 class PaymentCreate(PaymentBase):
@@ -243,6 +287,15 @@ class ProviderFilter(BaseModel):
     featured: Optional[bool] = None
     search: Optional[str] = None
 
+class NearbyProviderResponse(ProviderResponse):
+    distance_km: float
+
+class ProviderSearchResponse(BaseModel):
+    items: List[ProviderResponse]
+    total: int
+    facets: Dict[str, Dict[str, int]]  # Facet -> value -> number of matching providers.
+    next_cursor: Optional[str] = None
+
 class ComparisonRequest(BaseModel):
     provider_ids: List[int]
     treatment_id: Optional[int] = None
@@ -265,4 +318,32 @@ class TopRatedTreatmentOut(BaseModel):
     treatmentCategory: str
     providerId: int
     providerName: str
-    reviewSnippet: str
\ No newline at end of file
+    reviewSnippet: str
+
+# Availability schemas
+class WorkingHoursEntry(BaseModel):
+    weekday: int = Field(..., ge=0, le=6)  # 0 = Monday
+    opens_at: time
+    closes_at: time
+
+    class Config:
+        orm_mode = True
+        from_attributes = True
+
+class WorkingHours(BaseModel):
+    timezone: str = "UTC"
+    slot_minutes: int = Field(60, ge=15, le=24 * 60)
+    slot_capacity: int = Field(1, ge=1, le=100)
+    hours: List[WorkingHoursEntry] = []
+
+class AvailabilitySlot(BaseModel):
+    start: datetime
+    end: datetime
+    available: int
+
+class AvailabilityResponse(BaseModel):
+    provider_id: int
+    timezone: str
+    slot_minutes: int
+    duration_minutes: int
+    slots: List[AvailabilitySlot]
@@ -0,0 +1,51 @@
+from sqlalchemy import func, or_, literal_column
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from database import async_engine
+from models import Provider
+import os
+import re
+
+# "fulltext" uses the Postgres tsvector/trigram indexes below, "ilike" keeps the plain pattern match (also used on non Postgres databases).
+SEARCH_MODE = os.getenv("SEARCH_MODE", "fulltext")
+
+# providers.search_vector is a generated tsvector column (name weighted A, city/country B, description C) with a
+# GIN index, plus trigram indexes on name and city. All Postgres only, created by migration 0002.
+search_vector = literal_column("providers.search_vector", type_=TSVECTOR)
+
+def fulltext_enabled():
+    return SEARCH_MODE == "fulltext" and async_engine.dialect.name == "postgresql"
+
+def build_prefix_tsquery(term: str):
+    # "hair trans" -> "hair:* & trans:*" so partially typed words still match. Only word characters are kept,
+    # the result is passed as a bound parameter.
+    words = re.findall(r"\w+", term.lower())
+    return " & ".join(f"{word}:*" for word in words)
+
+def apply_provider_search(query, term: str):
+    """Filter a Provider select by a search term, ranking the results when full text search is enabled."""
+    if not fulltext_enabled():
+        search_term = f"%{term}%"
+        return query.where(
+            or_(
+                Provider.name.ilike(search_term),
+                Provider.description.ilike(search_term),
+                Provider.city.ilike(search_term),
+                Provider.country.ilike(search_term)
+            )
+        )
+
+    # Typo tolerance: "%" is pg_trgm's similarity operator (threshold pg_trgm.similarity_threshold, 0.3 by default).
+    similarity = func.greatest(func.similarity(Provider.name, term), func.similarity(Provider.city, term))
+    condition = or_(
+        Provider.name.op("%")(term),
+        Provider.city.op("%")(term),
+    )
+    rank = similarity
+
+    prefix_query = build_prefix_tsquery(term)
+    if prefix_query:
+        tsquery = func.to_tsquery("simple", prefix_query)
+        condition = or_(search_vector.op("@@")(tsquery), condition)
+        rank = func.ts_rank(search_vector, tsquery) + similarity
+
+    return query.where(condition).order_by(rank.desc(), Provider.id)
@@ -0,0 +1,61 @@
+"""Pre-encoded JSON responses.
+
+Returning ORM objects (or models built from them) lets FastAPI validate the result against response_model, dump it
+to a dict and encode that with json.dumps. Here the objects are validated against the response schema once, straight
+from their attributes, and encoded to bytes by pydantic-core. The endpoints keep their response_model for the OpenAPI
+schema, FastAPI does not validate a Response that is returned directly.
+"""
+from fastapi import Response
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+from functools import lru_cache
+from typing import List
+
+JSON_MEDIA_TYPE = "application/json"
+
+@lru_cache(maxsize=None)
+def type_adapter(schema):
+    # Building the validator and serializer is the expensive part, done once per schema.
+    return TypeAdapter(schema)
+
+def dump_json(schema, value):
+    """ORM objects (or dicts) as JSON bytes of the response schema, e.g. dump_json(List[BookingResponse], bookings)."""
+    adapter = type_adapter(schema)
+    return adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+
+def validate_objects(model, objects, shared=()):
+    """ORM objects as a list of `model` instances. The relationship fields named in shared point at objects many rows
+    have in common (every booking of a provider has the same provider), each distinct one is validated once."""
+    if not shared:
+        return type_adapter(List[model]).validate_python(objects, from_attributes=True)
+    validated = {}
+    rows = []
+    for obj in objects:
+        values = {name: getattr(obj, name) for name in model.model_fields}
+        for name in shared:
+            key = (name, id(values[name]))  # The objects stay referenced by the session while this runs.
+            if key not in validated:
+                annotation = model.model_fields[name].annotation
+                validated[key] = type_adapter(annotation).validate_python(values[name], from_attributes=True)
+            values[name] = validated[key]
+        rows.append(values)
+    # Model instances in the rows are taken as they are, only the row's own fields are validated here.
+    return type_adapter(List[model]).validate_python(rows)
+
+def json_response(content: bytes, response: Response = None, status_code: int = 200):
+    result = Response(content=content, media_type=JSON_MEDIA_TYPE, status_code=status_code)
+    if response is not None:
+        # Headers the endpoint set on its Response parameter (cursor, ETag, ...), FastAPI drops them for returned responses.
+        result.raw_headers.extend(header for header in response.raw_headers if header[0] != b"content-length")
+    return result
+
+def orm_response(schema, value, response: Response = None, status_code: int = 200):
+    return json_response(dump_json(schema, value), response, status_code)
+
+def orm_list_response(model, objects, response: Response = None, shared=()):
+    content = type_adapter(List[model]).dump_json(validate_objects(model, objects, shared))
+    return json_response(content, response)
+
+def cached_response(body, response: Response = None):
+    # Cached bodies are already JSON-compatible (model_dump(mode="json")), they only need encoding.
+    return json_response(to_json(body), response)
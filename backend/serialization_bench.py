@@ -0,0 +1,106 @@
+"""Micro-benchmark for serializing large booking lists.
+
+Compares the old way of answering GET /bookings/provider (a BookingResponse rebuilt per booking with from_orm for
+every nested object, then validated and encoded again by FastAPI through response_model) with serialization.py's
+pre-encoded response. Both run as routes of an in-process app over the same in-memory bookings, no database needed.
+
+    poetry run python serialization_bench.py --bookings 1000 --repeat 20
+
+Only the models are imported, outside docker any DATABASE_URL will do (e.g. DATABASE_URL=sqlite://).
+"""
+from fastapi import FastAPI
+from typing import List
+from datetime import datetime, timedelta, timezone
+from models import User, UserRole, Provider, Specialty, Treatment, TreatmentPrice, Booking, BookingStatus
+from schemas import BookingResponse, ProviderResponse, TreatmentPriceResponse, UserResponse
+from serialization import orm_list_response
+import argparse
+import asyncio
+import httpx
+import time
+
+def make_bookings(count: int, providers: int = 20):
+    """Transient bookings with every relationship BookingResponse serializes already set."""
+    now = datetime.now(timezone.utc)
+    specialties = [Specialty(id=i, name=f"Specialty {i}", description="Description") for i in range(1, 4)]
+    treatments = [
+        Treatment(id=i, name=f"Treatment {i}", description="Description", category="Dental",
+                  average_duration="2 hours", recovery_time="3 days")
+        for i in range(1, 6)
+    ]
+    clinics = [
+        Provider(id=i, user_id=i, name=f"Clinic {i}", description="Description", address="Address", city="Istanbul",
+                 country="Turkey", phone="123", website=None, license_number=None, is_verified=True, average_rating=4.5,
+                 total_reviews=10, created_at=now, updated_at=now, featured=False,
+                 specialties=specialties, treatments=treatments)
+        for i in range(1, providers + 1)
+    ]
+    prices = [TreatmentPrice(id=i, treatment_id=t.id, price_minor=10000 + 100 * i, currency="EUR", description=None, treatment=t)
+              for i, t in enumerate(treatments, 1)]
+    users = [User(id=1000 + i, email=f"user{i}@example.com", username=f"user{i}", full_name="User", role=UserRole.USER,
+                  created_at=now, is_active=True) for i in range(50)]
+    return [
+        Booking(id=i, user_id=users[i % len(users)].id, provider_id=clinics[i % len(clinics)].id,
+                treatment_price_id=prices[i % len(prices)].id, appointment_date=now + timedelta(days=i % 90),
+                status=BookingStatus.CONFIRMED, special_requests=None, created_at=now, updated_at=None,
+                provider=clinics[i % len(clinics)], treatment_price=prices[i % len(prices)], user=users[i % len(users)])
+        for i in range(count)
+    ]
+
+def rebuild(booking: Booking):
+    # What get_provider_bookings did per booking before serialization.py.
+    return BookingResponse(
+        id=booking.id,
+        user_id=booking.user_id,
+        provider_id=booking.provider_id,
+        treatment_price_id=booking.treatment_price_id,
+        appointment_date=booking.appointment_date,
+        special_requests=booking.special_requests,
+        status=booking.status,
+        created_at=booking.created_at,
+        updated_at=booking.updated_at,
+        provider=ProviderResponse.from_orm(booking.provider),
+        treatment_price=TreatmentPriceResponse.from_orm(booking.treatment_price),
+        user=UserResponse.from_orm(booking.user),
+    )
+
+def make_app(bookings):
+    app = FastAPI()
+
+    @app.get("/before", response_model=List[BookingResponse])
+    async def before():
+        return [rebuild(booking) for booking in bookings]
+
+    @app.get("/after", response_model=List[BookingResponse])
+    async def after():
+        return orm_list_response(BookingResponse, bookings, shared=("provider", "treatment_price", "user"))
+
+    return app
+
+async def measure(client: httpx.AsyncClient, path: str, repeat: int):
+    await client.get(path)  # Warm up (schema and serializer setup).
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await client.get(path)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return response, timings[len(timings) // 2] * 1000
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bookings", type=int, nargs="*", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    for count in args.bookings:
+        transport = httpx.ASGITransport(app=make_app(make_bookings(count)))
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            before, before_ms = await measure(client, "/before", args.repeat)
+            after, after_ms = await measure(client, "/after", args.repeat)
+        assert before.json() == after.json(), "Both paths must produce the same JSON"
+        print(f"{count:>6} bookings  before {before_ms:9.1f} ms  after {after_ms:9.1f} ms  "
+              f"speedup {before_ms / after_ms:4.1f}x  ({len(after.content) // 1024} KB)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,145 @@
+"""Applies stored Stripe webhook events to payments and bookings.
+
+The webhook endpoint only verifies and stores events (stripe_events table), this worker applies them in batches.
+It runs inside the API process (STRIPE_EVENT_WORKER=true, the default) or on its own:
+    poetry run python stripe_events.py
+"""
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import async_engine, AsyncSessionLocal
+from models import StripeEvent, Payment, PaymentStatus, Booking, BookingStatus
+from jobs import enqueue
+import asyncio
+import json
+import logging
+import os
+
+STRIPE_EVENT_WORKER = os.getenv("STRIPE_EVENT_WORKER", "true").lower() == "true"
+STRIPE_EVENT_BATCH_SIZE = int(os.getenv("STRIPE_EVENT_BATCH_SIZE", "100"))
+STRIPE_EVENT_POLL_INTERVAL = float(os.getenv("STRIPE_EVENT_POLL_INTERVAL", "5"))  # Picks up events stored by other processes.
+
+logger = logging.getLogger(__name__)
+
+# Payment status each event type moves a payment to, other event types are stored and ignored.
+EVENT_PAYMENT_STATUS = {
+    "payment_intent.succeeded": PaymentStatus.PAID,
+    "payment_intent.payment_failed": PaymentStatus.FAILED,
+    "payment_intent.canceled": PaymentStatus.FAILED,
+    "charge.refunded": PaymentStatus.REFUNDED,
+}
+# Statuses a payment may move from, so late or replayed events never undo a later state.
+ALLOWED_FROM = {
+    PaymentStatus.PAID: (PaymentStatus.PENDING, PaymentStatus.FAILED),
+    PaymentStatus.FAILED: (PaymentStatus.PENDING,),
+    PaymentStatus.REFUNDED: (PaymentStatus.PENDING, PaymentStatus.PAID),
+}
+
+events_pending = asyncio.Event()  # Set by the webhook endpoint so the worker does not wait for the next poll.
+
+def insert_event(event_id: str, event_type: str, payload: str, created: int):
+    """INSERT for a received event that does nothing when the event id is already stored."""
+    if async_engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(StripeEvent).values(
+        id=event_id, type=event_type, payload=payload, created=created
+    ).on_conflict_do_nothing(index_elements=["id"])
+
+def event_intent_id(event_type: str, payload: str):
+    obj = json.loads(payload)["data"]["object"]
+    # Charge events point at their PaymentIntent, payment_intent events are the intent itself.
+    return obj.get("payment_intent") if event_type.startswith("charge.") else obj["id"]
+
+async def process_pending_events(db: AsyncSession, batch_size: int = STRIPE_EVENT_BATCH_SIZE):
+    """Apply one batch of unprocessed events with one UPDATE per resulting status. Returns the batch size."""
+    events = (await db.scalars(
+        select(StripeEvent)
+        .where(StripeEvent.processed_at.is_(None))
+        .order_by(StripeEvent.created, StripeEvent.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)  # Several workers can run side by side (Postgres).
+    )).all()
+    if not events:
+        return 0
+
+    # The last event per intent decides where the payment ends up.
+    final_status = {}
+    for event in events:
+        status = EVENT_PAYMENT_STATUS.get(event.type)
+        if status is None:
+            continue
+        try:
+            intent_id = event_intent_id(event.type, event.payload)
+        except (ValueError, KeyError, TypeError) as e:
+            event.error = f"Unreadable payload: {e}"
+            continue
+        if intent_id:
+            final_status[intent_id] = status
+
+    intents_by_status = {}
+    for intent_id, status in final_status.items():
+        intents_by_status.setdefault(status, []).append(intent_id)
+
+    for status, intent_ids in intents_by_status.items():
+        payment_ids = await db.scalars(
+            update(Payment)
+            .where(Payment.stripe_payment_intent_id.in_(intent_ids), Payment.status.in_(ALLOWED_FROM[status]))
+            .values(status=status)
+            .returning(Payment.id)
+            .execution_options(synchronize_session=False)
+        )
+        for payment_id in payment_ids:
+            enqueue(db, "payment_status_changed", payment_id=payment_id, status=status.value)
+        if status == PaymentStatus.PAID:
+            booking_ids = await db.scalars(
+                update(Booking)
+                .where(
+                    Booking.id.in_(select(Payment.booking_id).where(Payment.stripe_payment_intent_id.in_(intent_ids))),
+                    Booking.status == BookingStatus.PENDING
+                )
+                .values(status=BookingStatus.CONFIRMED)
+                .returning(Booking.id)
+                .execution_options(synchronize_session=False)
+            )
+            for booking_id in booking_ids:
+                enqueue(db, "booking_status_changed", booking_id=booking_id, status=BookingStatus.CONFIRMED.value)
+
+    for event in events:
+        event.processed_at = func.now()
+    await db.commit()
+    return len(events)
+
+async def run_worker():
+    while True:
+        events_pending.clear()
+        try:
+            async with AsyncSessionLocal() as db:
+                while await process_pending_events(db) == STRIPE_EVENT_BATCH_SIZE:
+                    pass  # Full batch, there may be more.
+        except Exception as e:
+            logger.error(f"Applying Stripe events failed: {e}")
+        try:
+            await asyncio.wait_for(events_pending.wait(), STRIPE_EVENT_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+_worker = None
+
+def start_event_worker():
+    global _worker
+    if STRIPE_EVENT_WORKER and _worker is None:
+        _worker = asyncio.create_task(run_worker())
+
+async def stop_event_worker():
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+        _worker = None
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
@@ -0,0 +1,96 @@
+"""The app runs against a throwaway SQLite database, migrated at startup like any other database.
+
+Requests go through one TestClient for the whole run, its event loop also runs the background jobs and whatever a
+test does with the database directly (run).
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATA_DIR = tempfile.mkdtemp(prefix="medport-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{DATA_DIR}/medport.db"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["CACHE_BACKEND"] = "memory"
+os.environ["JOB_QUEUE"] = "memory"
+os.environ["STRIPE_EVENT_WORKER"] = "false"
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import pytest
+import uuid
+from fastapi.testclient import TestClient
+
+@pytest.fixture(scope="session")
+def client():
+    from main import app
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture(scope="session")
+def run(client):
+    """run(async_function, *args): await it on the app's event loop, where the engine's connections live."""
+    return client.portal.call
+
+@pytest.fixture(scope="session")
+def wait_for_jobs(run):
+    """Block until the background jobs queued so far (and their retries) are done."""
+    import jobs
+    return lambda: run(jobs.queue.join)
+
+def auth_headers(user):
+    from routers.auth import create_access_token
+    return {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+@pytest.fixture(scope="session")
+def make_user(run):
+    """make_user(role) -> (user, headers): a new active user and the Authorization header to act as them."""
+    from database import AsyncSessionLocal
+    from models import User, UserRole
+
+    async def create(role):
+        suffix = uuid.uuid4().hex[:8]
+        async with AsyncSessionLocal() as db:
+            user = User(email=f"{role.value}-{suffix}@example.com", username=f"{role.value}-{suffix}",
+                        full_name=f"Test {role.value}", hashed_password="-", role=role, is_active=True)
+            db.add(user)
+            await db.commit()
+        return user
+
+    def make(role=UserRole.USER):
+        user = run(create, role)
+        return user, auth_headers(user)
+    return make
+
+@pytest.fixture(scope="session")
+def make_treatment(run):
+    """make_treatment(**fields) -> a new treatment (treatments are only imported, there is no endpoint for one)."""
+    from database import AsyncSessionLocal
+    from models import Treatment
+
+    async def create(fields):
+        async with AsyncSessionLocal() as db:
+            treatment = Treatment(**{"name": f"Treatment {uuid.uuid4().hex[:8]}", "description": "Test",
+                                     "category": "Dental", **fields})
+            db.add(treatment)
+            await db.commit()
+        return treatment
+
+    return lambda **fields: run(create, fields)
+
+@pytest.fixture(scope="session")
+def make_provider(client, make_user, make_treatment):
+    """make_provider(**fields) -> (provider JSON, owner headers): a clinic created through the API, offering one treatment."""
+    from models import UserRole
+
+    def make(**fields):
+        owner, headers = make_user(UserRole.PROVIDER)
+        treatment = make_treatment()
+        response = client.post("/providers/", headers=headers, json={
+            "user_id": owner.id, "name": f"Clinic {uuid.uuid4().hex[:8]}", "description": "Test clinic",
+            "address": "Street 1", "city": "Istanbul", "country": "Turkey", "phone": "1",
+            "specialty_ids": [], "treatment_ids": [treatment.id], **fields,
+        })
+        assert response.status_code == 201, response.text
+        return response.json(), headers
+    return make
@@ -0,0 +1,46 @@
+"""The current user: authenticated from the cached snapshot, changed through the users row."""
+from cache import user_key
+from routers.auth import CurrentUser, load_current_user, verify_password
+from database import AsyncSessionLocal
+from models import User
+import cache as cache_module
+import pytest
+
+async def current_user(user_id):
+    async with AsyncSessionLocal() as db:
+        return await load_current_user(db, user_id)
+
+async def stored_user(user_id):
+    async with AsyncSessionLocal() as db:
+        return await db.get(User, user_id)
+
+def test_the_current_user_is_a_read_only_snapshot_from_the_cache(run, make_user):
+    user, _ = make_user()
+    first = run(current_user, user.id)
+    assert isinstance(first, CurrentUser) and first.username == user.username
+    assert run(cache_module.cache.get, user_key(user.id)) is not None
+    assert run(current_user, user.id) == first  # Served from the cached snapshot.
+    assert not hasattr(first, "hashed_password")
+    with pytest.raises(AttributeError):
+        first.full_name = "Changed"
+
+@pytest.mark.parametrize("cached", [False, True], ids=["loaded", "cached"])
+def test_update_user_changes_the_row_and_the_next_snapshot(client, run, make_user, cached):
+    user, headers = make_user()
+    if cached:
+        client.get("/auth/me", headers=headers).raise_for_status()
+
+    response = client.put("/users/me", headers=headers, json={"full_name": "New Name", "password": "secret-123"})
+    assert response.status_code == 200, response.text
+    assert response.json()["full_name"] == "New Name"
+
+    stored = run(stored_user, user.id)
+    assert stored.full_name == "New Name" and verify_password("secret-123", stored.hashed_password)
+    assert client.get("/auth/me", headers=headers).json()["full_name"] == "New Name"
+
+def test_update_stripe_info(client, make_user):
+    _, headers = make_user()
+    client.get("/users/me/stripe", headers=headers).raise_for_status()
+    response = client.put("/users/me/stripe", headers=headers, json={"stripe_customer_id": "cus_123"})
+    assert response.json() == {"stripe_customer_id": "cus_123"}
+    assert client.get("/users/me/stripe", headers=headers).json() == {"stripe_customer_id": "cus_123"}
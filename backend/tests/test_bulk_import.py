@@ -0,0 +1,109 @@
+"""Bulk import: the streaming readers and the per row errors of an import."""
+from bulk_import import Importer, TreatmentImport, read_csv, read_json_array, read_ndjson
+from models import UserRole
+import json
+import pytest
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+def read(run, reader, data, size=3):
+    """All (row, values, error) of data sent in chunks of size bytes, split anywhere, also inside a character."""
+    async def collect():
+        return [record async for record in reader(chunked(data, size))]
+    return run(collect)
+
+# Readers
+
+def test_ndjson_reader(run):
+    data = '\ufeff{"name": "Çağla"}\n\n  \n[1]\n{"name": \n{"name": "Last"}'.encode()
+    records = read(run, read_ndjson, data)
+    assert [(row, values) for row, values, _ in records] == [(1, {"name": "Çağla"}), (2, None), (3, None), (4, {"name": "Last"})]
+    assert records[1][2] == "Expected a JSON object" and records[2][2].startswith("Invalid JSON")
+
+def test_csv_reader(run):
+    data = 'name,description,category\r\nÇağla,"Two\nlines, with a comma",Dental\r\n\r\nCrown,"Says ""hi""",\r\n'.encode()
+    assert read(run, read_csv, data) == [
+        (1, {"name": "Çağla", "description": "Two\nlines, with a comma", "category": "Dental"}, None),
+        (2, {"name": "Crown", "description": 'Says "hi"'}, None),  # Empty cells are left out.
+    ]
+
+def test_csv_reader_without_rows(run):
+    assert read(run, read_csv, b"") == []
+    assert read(run, read_csv, b"name,category\n") == []
+
+@pytest.mark.parametrize("data, expected", [
+    (b'[{"a": 1}, 2, {"b": "\xc3\xa7"}]', [(1, {"a": 1}, None), (2, None, "Expected a JSON object"), (3, {"b": "ç"}, None)]),
+    (b"", []),
+    (b'{"a": 1}', [(1, None, "Expected a JSON array")]),
+])
+def test_json_array_reader(run, data, expected):
+    assert read(run, read_json_array, data) == expected
+
+def test_json_array_reader_invalid_json(run):
+    [(row, values, error)] = read(run, read_json_array, b'[{"a": 1},')
+    assert (row, values) == (1, None) and error.startswith("Invalid JSON")
+
+# Importers
+
+def test_an_importer_has_to_insert(make_user):
+    user, _ = make_user()
+
+    class NoInsert(Importer):
+        pass
+
+    with pytest.raises(TypeError):
+        NoInsert(user)
+    assert TreatmentImport(user).current_user is user
+
+def post_import(client, path, headers, content_type, body):
+    response = client.post(path, headers={**headers, "Content-Type": content_type}, content=body)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_rows_that_fail_are_reported_and_the_others_imported(client, make_user):
+    _, admin = make_user(UserRole.ADMIN)
+    body = (
+        'name,description,category\n'
+        'Rhinoplasty,Nose,Aesthetic\n'
+        ',No name,Aesthetic\n'
+        'Otoplasty,Ears\n'
+    )
+    summary = post_import(client, "/imports/treatments", admin, "text/csv", body)
+    assert (summary["rows"], summary["inserted"], summary["failed"]) == (3, 1, 2)
+    assert [error["row"] for error in summary["errors"]] == [2, 3]
+    assert "category" in summary["errors"][1]["error"]
+
+def test_treatment_price_rows_are_checked_one_by_one(client, make_provider):
+    provider, owner = make_provider()
+    other, _ = make_provider()
+    treatment_id = provider["treatments"][0]["id"]
+    rows = [
+        {"provider_id": provider["id"], "treatment_id": treatment_id, "price": "100"},
+        {"provider_id": other["id"], "treatment_id": treatment_id, "price": "100"},
+        {"provider_id": provider["id"], "treatment_id": 10**9, "price": "100"},
+        {"provider_id": 10**9, "treatment_id": treatment_id, "price": "100"},
+        {"provider_id": provider["id"], "treatment_id": treatment_id, "price": "1.5", "currency": "JPY"},
+        {"provider_id": provider["id"], "treatment_id": treatment_id, "price": "oops"},
+    ]
+    body = "\n".join(json.dumps(row) for row in rows) + "\nnot json\n"
+    summary = post_import(client, "/imports/treatment-prices", owner, "application/x-ndjson", body)
+
+    assert (summary["rows"], summary["inserted"], summary["failed"]) == (7, 1, 6)
+    errors = {error["row"]: error["error"] for error in summary["errors"]}
+    assert errors[2] == f"Not authorized to add treatment prices for provider {other['id']}"
+    assert errors[3] == f"Treatment {10**9} not found"
+    assert errors[4] == f"Provider {10**9} not found"
+    assert "JPY" in errors[5] and errors[6].startswith("price") and errors[7].startswith("Invalid JSON")
+
+def test_import_progress_is_streamed(client, make_user):
+    _, admin = make_user(UserRole.ADMIN)
+    rows = [{"name": f"Streamed {i}", "description": "d", "category": "Dental"} for i in range(5)] + [{"name": "x"}]
+    response = client.post(
+        "/imports/treatments", content=json.dumps(rows),
+        headers={**admin, "Content-Type": "application/json", "Accept": "application/x-ndjson"},
+    )
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1] == {"rows": 6, "inserted": 5, "failed": 1, "done": True}
+    assert [error["row"] for line in lines[:-1] for error in line["errors"]] == [6]
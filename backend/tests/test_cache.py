@@ -0,0 +1,174 @@
+"""Cache backends and the invalidation of cached catalog pages by the writes that change them."""
+from cache import MemoryCache, RedisCache, provider_key, TOP_RATED_TREATMENTS_KEY, TREATMENTS_PREFIX
+from models import UserRole
+import cache as cache_module
+import fnmatch
+import json
+import pytest
+import sys
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class FakeRedis:
+    """The part of redis.asyncio.Redis RedisCache uses, kept in a dict: strings with an optional expiry."""
+
+    def __init__(self, clock=None):
+        self.clock = clock or Clock()
+        self.data = {}
+
+    def _live(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires <= self.clock():
+            del self.data[key]
+            return None
+        return value
+
+    async def get(self, key):
+        return self._live(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = (value.encode(), None if ex is None else self.clock() + ex)
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def scan_iter(self, match="*"):
+        for key in list(self.data):
+            if self._live(key) is not None and fnmatch.fnmatchcase(key, match):
+                yield key
+
+    def keys(self, namespace="medport:"):
+        return {key.removeprefix(namespace) for key in list(self.data) if self._live(key) is not None}
+
+# Backends
+
+def test_memory_cache_expires_entries_after_their_ttl(run):
+    clock = Clock()
+    cache = MemoryCache(default_ttl=60, clock=clock)
+    run(cache.set, "a", {"x": 1})
+    run(cache.set, "b", [1], 5)
+    clock.now += 5
+    assert run(cache.get, "a") == {"x": 1}
+    assert run(cache.get, "b") == [1]
+    clock.now += 0.5
+    assert run(cache.get, "b") is None
+    clock.now += 60
+    assert run(cache.get, "a") is None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+def test_memory_cache_evicts_the_least_recently_used_entry(run):
+    cache = MemoryCache(max_entries=2)
+    run(cache.set, "a", 1)
+    run(cache.set, "b", 2)
+    run(cache.get, "a")  # b is now the least recently used
+    run(cache.set, "c", 3)
+    assert [run(cache.get, key) for key in "abc"] == [1, None, 3]
+
+def test_redis_cache_stores_json_with_a_ttl(run):
+    client = FakeRedis()
+    cache = RedisCache(client=client, default_ttl=60)
+    run(cache.set, "a", {"x": [1, 2]})
+    run(cache.set, "b", "short", 5)
+    assert json.loads(client.data["medport:a"][0]) == {"x": [1, 2]}
+    assert run(cache.get, "a") == {"x": [1, 2]}
+    client.clock.now += 6
+    assert run(cache.get, "b") is None
+    assert run(cache.get, "a") == {"x": [1, 2]}
+    client.clock.now += 60
+    assert run(cache.get, "a") is None
+
+def test_redis_cache_deletes_keys_and_prefixes(run):
+    client = FakeRedis()
+    cache = RedisCache(client=client)
+    for key in ("treatments:all", "treatments:Dental", "specialties:all", "provider-detail:1"):
+        run(cache.set, key, 1)
+    run(cache.delete_prefix, "treatments:")
+    run(cache.delete, "provider-detail:1", "missing")
+    assert client.keys() == {"specialties:all"}
+
+def test_redis_cache_errors_count_as_misses(run):
+    class Down:
+        async def get(self, key):
+            raise ConnectionError("down")
+
+        async def set(self, key, value, ex=None):
+            raise ConnectionError("down")
+
+    cache = RedisCache(client=Down())
+    run(cache.set, "a", 1)
+    assert run(cache.get, "a") is None and cache.misses == 1
+
+# Invalidation
+
+@pytest.fixture
+def redis(monkeypatch):
+    """The app's cache replaced by a RedisCache on a FakeRedis, in every module that imported it."""
+    client = FakeRedis()
+    fake, original = RedisCache(client=client), cache_module.cache
+    for module in list(sys.modules.values()):
+        if getattr(module, "cache", None) is original:
+            monkeypatch.setattr(module, "cache", fake)
+    return client
+
+@pytest.fixture
+def clinic(client, make_provider, make_user, wait_for_jobs):
+    provider, owner_headers = make_provider()
+    patient, patient_headers = make_user(UserRole.USER)
+    treatment_id = provider["treatments"][0]["id"]
+    price = client.post("/providers/treatment-prices/", headers=owner_headers, json={
+        "provider_id": provider["id"], "treatment_id": treatment_id, "price": 100,
+    }).json()
+    review = client.post("/reviews/", headers=patient_headers, json={
+        "provider_id": provider["id"], "rating": 4, "treatment_received": "Implant",
+    }).json()
+    wait_for_jobs()
+    return dict(id=provider["id"], owner=owner_headers, patient=patient_headers, treatment_id=treatment_id,
+                price_id=price["id"], review_id=review["id"])
+
+PROVIDER_WRITES = {
+    "update provider": lambda client, c: client.put(
+        f"/providers/{c['id']}", headers=c["owner"], json={"description": "Renovated"}),
+    "create treatment price": lambda client, c: client.post(
+        "/providers/treatment-prices/", headers=c["owner"],
+        json={"provider_id": c["id"], "treatment_id": c["treatment_id"], "price": 80, "currency": "EUR"}),
+    "update treatment price": lambda client, c: client.put(
+        f"/providers/treatment-prices/{c['price_id']}", headers=c["owner"], json={"price": 90}),
+    "delete treatment price": lambda client, c: client.delete(
+        f"/providers/treatment-prices/{c['price_id']}", headers=c["owner"]),
+    # These three change the rating through update_provider_rating.
+    "create review": lambda client, c: client.post(
+        "/reviews/", headers=c["patient"], json={"provider_id": c["id"], "rating": 1, "treatment_received": "Crown"}),
+    "update review": lambda client, c: client.put(
+        f"/reviews/{c['review_id']}", headers=c["patient"], json={"rating": 2}),
+    "delete review": lambda client, c: client.delete(f"/reviews/{c['review_id']}", headers=c["patient"]),
+}
+
+@pytest.mark.parametrize("write", PROVIDER_WRITES.values(), ids=PROVIDER_WRITES.keys())
+def test_provider_writes_evict_the_provider_page_and_leaderboard(client, redis, clinic, write, wait_for_jobs):
+    before = client.get(f"/providers/{clinic['id']}").json()
+    client.get("/providers/top-rated-treatments/").raise_for_status()
+    assert {provider_key(clinic["id"]), TOP_RATED_TREATMENTS_KEY} <= redis.keys()
+
+    response = write(client, clinic)
+    assert response.status_code < 300, response.text
+    assert not {provider_key(clinic["id"]), TOP_RATED_TREATMENTS_KEY} & redis.keys()
+
+    wait_for_jobs()
+    after = client.get(f"/providers/{clinic['id']}").json()
+    assert after != before  # Served from the database again, not from the evicted entry.
+
+def test_treatment_import_evicts_the_treatment_list(client, redis, make_user):
+    _, admin = make_user(UserRole.ADMIN)
+    names = {treatment["name"] for treatment in client.get("/treatments/").json()}
+    assert TREATMENTS_PREFIX + "all" in redis.keys()
+
+    response = client.post("/imports/treatments", headers={**admin, "Content-Type": "application/json"},
+                           content=json.dumps([{"name": "Gastric sleeve", "description": "d", "category": "Bariatric"}]))
+    assert response.json()["inserted"] == 1, response.text
+    assert TREATMENTS_PREFIX + "all" not in redis.keys()
+    assert {treatment["name"] for treatment in client.get("/treatments/").json()} == names | {"Gastric sleeve"}
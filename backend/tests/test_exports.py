@@ -0,0 +1,43 @@
+"""Exports write amounts exactly, as decimals of their currency."""
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from models import UserRole
+import csv
+import io
+import json
+import pytest
+
+# More significant digits than a float holds.
+LARGE_PRICE = "12345678901234567.89"
+PRICES = [("19.99", "USD"), (LARGE_PRICE, "USD"), ("1500", "JPY"), ("1.005", "KWD")]
+
+@pytest.fixture
+def provider_with_bookings(client, make_provider, make_user):
+    provider, owner = make_provider()
+    _, patient = make_user(UserRole.USER)
+    when = (datetime.now(timezone.utc) + timedelta(days=5)).replace(hour=10, minute=0, second=0, microsecond=0)
+    for hours, (price, currency) in enumerate(PRICES):
+        price_id = client.post("/providers/treatment-prices/", headers=owner, json={
+            "provider_id": provider["id"], "treatment_id": provider["treatments"][0]["id"], "price": price,
+            "currency": currency,
+        }).json()["id"]
+        client.post("/bookings/", headers=patient, json={
+            "provider_id": provider["id"], "treatment_price_id": price_id,
+            "appointment_date": (when + timedelta(hours=hours)).isoformat(),
+        }).raise_for_status()
+    return owner
+
+def test_ndjson_amounts_are_exact_json_numbers(client, provider_with_bookings):
+    response = client.get("/exports/bookings", headers=provider_with_bookings, params={"format": "ndjson"})
+    assert response.status_code == 200, response.text
+    lines = response.text.splitlines()
+    rows = [json.loads(line, parse_float=Decimal) for line in lines]
+    assert [(row["price"], row["currency"]) for row in rows] == [(Decimal(p), c) for p, c in PRICES]
+    assert f'"price": {LARGE_PRICE},' in lines[1]
+    assert json.loads(lines[0])["status"] == "pending"
+
+def test_csv_amounts_are_exact(client, provider_with_bookings):
+    response = client.get("/exports/bookings", headers=provider_with_bookings, params={"format": "csv"})
+    assert response.status_code == 200, response.text
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [(row["price"], row["currency"]) for row in rows] == PRICES
@@ -0,0 +1,101 @@
+"""PaymentIntent handling of create-payment-intent, against an in-memory Stripe and, when one runs, stripe-mock."""
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from payment_gateway import gateway, PaymentGateway
+from models import UserRole
+import itertools
+import os
+import pytest
+
+class FakePaymentIntents:
+    """The PaymentIntent calls of the Stripe client, answered from a dict."""
+
+    def __init__(self):
+        self.intents = {}
+        self.ids = itertools.count(1)
+        self.cancelled = []
+
+    async def create_async(self, params, options=None):
+        intent_id = f"pi_{next(self.ids)}"
+        self.intents[intent_id] = SimpleNamespace(
+            id=intent_id, status="requires_payment_method", amount=params["amount"], currency=params["currency"].lower(),
+            client_secret=f"{intent_id}_secret", metadata=params["metadata"],
+        )
+        return self.intents[intent_id]
+
+    async def retrieve_async(self, intent_id, params=None, options=None):
+        return self.intents[intent_id]
+
+    async def cancel_async(self, intent_id, params=None, options=None):
+        self.cancelled.append(intent_id)
+        self.intents[intent_id].status = "canceled"
+        return self.intents[intent_id]
+
+@pytest.fixture
+def stripe(monkeypatch):
+    intents = FakePaymentIntents()
+    monkeypatch.setattr(gateway, "api_key", "sk_test_fake")
+    monkeypatch.setattr(gateway, "_client", SimpleNamespace(payment_intents=intents))
+    return intents
+
+@pytest.fixture
+def booking(client, make_provider, make_user):
+    provider, owner = make_provider()
+    price = client.post("/providers/treatment-prices/", headers=owner, json={
+        "provider_id": provider["id"], "treatment_id": provider["treatments"][0]["id"], "price": 150,
+    }).json()
+    _, patient = make_user(UserRole.USER)
+    when = (datetime.now(timezone.utc) + timedelta(days=3)).replace(hour=10, minute=0, second=0, microsecond=0)
+    response = client.post("/bookings/", headers=patient, json={
+        "provider_id": provider["id"], "treatment_price_id": price["id"], "appointment_date": when.isoformat(),
+    })
+    assert response.status_code == 201, response.text
+    return dict(id=response.json()["id"], patient=patient, owner=owner, price_id=price["id"])
+
+def create_intent(client, booking):
+    return client.post("/payments/create-payment-intent", headers=booking["patient"], json={"booking_id": booking["id"]})
+
+def test_the_same_intent_is_handed_out_again(client, stripe, booking):
+    first, second = create_intent(client, booking), create_intent(client, booking)
+    assert first.json() == second.json() == {"client_secret": "pi_1_secret"}
+    assert stripe.intents["pi_1"].amount == 15000 and not stripe.cancelled
+
+def test_a_changed_amount_cancels_the_old_intent(client, stripe, booking):
+    create_intent(client, booking).raise_for_status()
+    client.put(f"/providers/treatment-prices/{booking['price_id']}", headers=booking["owner"],
+               json={"price": 120}).raise_for_status()
+
+    response = create_intent(client, booking)
+    assert response.json() == {"client_secret": "pi_2_secret"}
+    assert stripe.cancelled == ["pi_1"]
+    assert stripe.intents["pi_2"].amount == 12000
+
+def test_an_intent_being_processed_is_not_replaced(client, stripe, booking):
+    create_intent(client, booking).raise_for_status()
+    stripe.intents["pi_1"].status = "processing"
+    client.put(f"/providers/treatment-prices/{booking['price_id']}", headers=booking["owner"],
+               json={"price": 120}).raise_for_status()
+
+    response = create_intent(client, booking)
+    assert response.status_code == 409, response.text
+    assert list(stripe.intents) == ["pi_1"] and not stripe.cancelled
+
+# stripe-mock (https://github.com/stripe/stripe-mock) answers every call with fixture data, it checks that the
+# requests PaymentGateway sends are valid API calls:
+#     docker compose --profile test up -d stripe-mock
+#     STRIPE_MOCK_URL=http://localhost:12111 poetry run pytest
+STRIPE_MOCK_URL = os.getenv("STRIPE_MOCK_URL")
+
+@pytest.mark.skipif(not STRIPE_MOCK_URL, reason="STRIPE_MOCK_URL is not set")
+def test_gateway_calls_against_stripe_mock(run):
+    mock = PaymentGateway(api_key="sk_test_123", api_base=STRIPE_MOCK_URL)
+
+    async def calls():
+        created = await mock.create_intent(15000, "usd", metadata={"booking_id": "1"}, idempotency_key="test-1")
+        retrieved = await mock.retrieve_intent(created.id)
+        cancelled = await mock.cancel_intent(created.id)
+        return created, retrieved, cancelled
+
+    created, retrieved, cancelled = run(calls)
+    assert created.object == retrieved.object == cancelled.object == "payment_intent"
+    assert created.id.startswith("pi_") and created.client_secret
@@ -0,0 +1,40 @@
+"""Price comparison in the base currency (USD here, see data/fx_rates.csv)."""
+import pytest
+
+@pytest.fixture
+def compare(client, make_provider, make_treatment):
+    """compare(*(price, currency)) -> the ids of a new treatment's prices and a function to GET its comparison."""
+    treatment = make_treatment()
+
+    def create(*prices):
+        provider, owner = make_provider(treatment_ids=[treatment.id])
+        ids = []
+        for price, currency in prices:
+            response = client.post("/providers/treatment-prices/", headers=owner, json={
+                "provider_id": provider["id"], "treatment_id": treatment.id, "price": price, "currency": currency,
+            })
+            assert response.status_code == 201, response.text
+            ids.append(response.json()["id"])
+
+        def get(**params):
+            response = client.get(f"/treatments/{treatment.id}/prices", params=params)
+            assert response.status_code == 200, response.text
+            return response.json()
+        return ids, get
+    return create
+
+def test_equal_base_prices_compare_equal(compare):
+    # As floats 100 CHF at 1.12 is 112.00000000000001 and 300 MYR at 0.21 is 62.99999999999999 USD.
+    (chf, usd_112, usd_63, myr), get = compare(("100", "CHF"), ("112", "USD"), ("63", "USD"), ("300", "MYR"))
+    result = get()
+    assert [(item["treatment_price_id"], item["base_price"]) for item in result["items"]] == [
+        (usd_63, 63), (myr, 63), (chf, 112), (usd_112, 112),  # Equal base prices in id order.
+    ]
+    assert (result["min"], result["median"], result["max"]) == (63, 87.5, 112)
+    assert [item["treatment_price_id"] for item in get(sort="-price")["items"]] == [usd_112, chf, myr, usd_63]
+    assert get(max=112)["count"] == 4 and get(max=111.99)["count"] == 2
+
+def test_median_of_an_even_number_of_prices(compare):
+    _, get = compare(("10", "EUR"), ("100", "TRY"), ("19.99", "USD"), ("0.01", "USD"))
+    result = get()
+    assert (result["count"], result["min"], result["median"], result["max"]) == (4, 0.01, 6.95, 19.99)
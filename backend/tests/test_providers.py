@@ -0,0 +1,53 @@
+"""Provider search filters and the derived provider data behind them."""
+from sqlalchemy import select, func
+from database import AsyncSessionLocal
+from models import ProviderFacet, UserRole
+import asyncio
+import jobs
+import pytest
+
+@pytest.fixture
+def lagging_refresh(monkeypatch, wait_for_jobs):
+    """The refresh_providers job does nothing: the facet table stays as it was before the test's writes."""
+    wait_for_jobs()
+
+    async def skip(db, **args):
+        pass
+
+    monkeypatch.setitem(jobs.handlers, "refresh_providers", skip)
+
+def ids(response):
+    assert response.status_code == 200, response.text
+    items = response.json()
+    return {provider["id"] for provider in (items["items"] if isinstance(items, dict) else items)}
+
+@pytest.mark.parametrize("path", ["/providers/", "/providers/search"])
+def test_treatment_filter_sees_a_write_before_the_facets_are_refreshed(client, make_provider, make_treatment,
+                                                                       lagging_refresh, path):
+    provider, owner = make_provider()
+    old = provider["treatments"][0]["id"]
+    new = make_treatment().id
+    client.put(f"/providers/{provider['id']}", headers=owner, json={"treatment_ids": [new]}).raise_for_status()
+
+    assert provider["id"] in ids(client.get(path, params={"treatment_id": new}))
+    assert provider["id"] not in ids(client.get(path, params={"treatment_id": old}))
+
+def test_concurrent_refreshes_of_a_provider_take_turns(client, run, make_provider, make_user, wait_for_jobs):
+    provider, _ = make_provider()
+    _, patient = make_user(UserRole.USER)
+    client.post("/reviews/", headers=patient, json={
+        "provider_id": provider["id"], "rating": 5, "treatment_received": "Implant",
+    }).raise_for_status()
+    wait_for_jobs()
+
+    async def refresh():
+        async with AsyncSessionLocal() as db:
+            await jobs.refresh_providers(db, provider_ids=[provider["id"]])
+
+    async def refresh_at_once():
+        await asyncio.gather(*(refresh() for _ in range(4)))
+        async with AsyncSessionLocal() as db:
+            return await db.scalar(select(func.count()).where(ProviderFacet.provider_id == provider["id"]))
+
+    # Country, city, the treatment and five rating buckets, each once.
+    assert run(refresh_at_once) == 8
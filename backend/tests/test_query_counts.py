@@ -0,0 +1,91 @@
+"""Endpoints whose number of queries grows with the size of their result (N+1 queries) fail here.
+
+Each guarded endpoint is requested for a patient and provider with one booking and review and for another pair with
+many; both have to take the same number of queries.
+"""
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event
+from database import async_engine, AsyncSessionLocal
+from models import UserRole, Provider, Treatment, TreatmentPrice, Booking, BookingStatus, Review
+import pytest
+import uuid
+
+SMALL, LARGE = 1, 11
+
+class QueryCounter:
+    """Records the statements sent through the engine while the block runs."""
+
+    def __init__(self, engine=async_engine):
+        self.engine = engine.sync_engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+class Dataset:
+    """One patient and one provider with rows completed bookings and reviews, each for a different treatment."""
+
+    def __init__(self, make_user, run, rows: int):
+        self.user, self.user_headers = make_user(UserRole.USER)
+        self.owner, self.owner_headers = make_user(UserRole.PROVIDER)
+        run(self.create, rows)
+
+    async def create(self, rows: int):
+        suffix = uuid.uuid4().hex[:8]
+        async with AsyncSessionLocal() as db:
+            self.provider = Provider(user_id=self.owner.id, name=f"Guard Clinic {suffix}", description="Query guard",
+                                     address="Street 1", city="Izmir", country="Turkey", phone="1")
+            db.add(self.provider)
+            for row in range(rows):
+                treatment = Treatment(name=f"Guard treatment {suffix}-{row}", description="Query guard", category="Dental")
+                price = TreatmentPrice(provider=self.provider, treatment=treatment, price_minor=10000, currency="USD")
+                db.add(Booking(user_id=self.user.id, provider=self.provider, treatment_price=price,
+                               status=BookingStatus.COMPLETED,
+                               appointment_date=datetime.now(timezone.utc) + timedelta(days=row + 1)))
+                db.add(Review(user_id=self.user.id, provider=self.provider, rating=4, treatment_received=treatment.name))
+            await db.commit()
+
+    def request(self, endpoint):
+        path, headers = endpoint(self)
+        return path, getattr(self, headers) if headers else None
+
+@pytest.fixture(scope="module")
+def datasets(make_user, run):
+    return Dataset(make_user, run, SMALL), Dataset(make_user, run, LARGE)
+
+GUARDED = {
+    "provider bookings": lambda data: ("/bookings/provider", "owner_headers"),
+    "user bookings": lambda data: ("/bookings/", "user_headers"),
+    "completed treatments": lambda data: (f"/treatments/user-treatments/{data.provider.id}", "user_headers"),
+    "provider reviews": lambda data: (f"/reviews/provider/{data.provider.id}", None),
+    "user reviews": lambda data: ("/reviews/user", "user_headers"),
+}
+
+def count_queries(client, path, headers):
+    client.get(path, headers=headers).raise_for_status()  # Warms the cached user, so both sides skip that query.
+    with QueryCounter() as counter:
+        response = client.get(path, headers=headers)
+    response.raise_for_status()
+    return counter, response.json()
+
+@pytest.mark.parametrize("endpoint", GUARDED.values(), ids=GUARDED.keys())
+def test_query_count_does_not_grow_with_the_result(client, datasets, endpoint):
+    small, large = datasets
+    small_queries, small_body = count_queries(client, *small.request(endpoint))
+    large_queries, large_body = count_queries(client, *large.request(endpoint))
+
+    assert len(str(large_body)) > len(str(small_body))  # The larger dataset does show up in the response.
+    extra = "\n".join(" ".join(statement.split())[:160] for statement in large_queries.statements[small_queries.count:])
+    assert large_queries.count == small_queries.count, f"{small_queries.count} queries with {SMALL} rows, " \
+        f"{large_queries.count} with {LARGE}:\n{extra}"